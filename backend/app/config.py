@@ -1,6 +1,7 @@
 from pydantic_settings import BaseSettings, SettingsConfigDict
 from pydantic import Field, field_validator
 from pathlib import Path
+from typing import Literal
 
 class Settings(BaseSettings):
     MONGO_URI: str
@@ -12,6 +13,28 @@ class Settings(BaseSettings):
     SESSION_SECRET: str = Field(..., description="Required secret key for session encryption. Must be set in .env (min 32 characters)")
     CORS_ORIGINS: str = Field(default="http://localhost:3000", description="Comma-separated list of allowed CORS origins")
     RATE_LIMIT_PER_MINUTE: int = Field(default=60, description="API rate limit per minute per IP")
+    POLLER_MAX_CONCURRENCY: int = Field(default=20, description="Maximum number of users polled for playback at the same time")
+    POLL_INTERVAL_SECONDS: float = Field(default=10.0, description="Seconds between playback polls for each user")
+    SPOTIFY_MAX_WORKERS: int = Field(default=16, description="Worker threads for Spotify calls made by API requests")
+    SPOTIFY_BACKGROUND_MAX_WORKERS: int = Field(default=20, description="Worker threads for Spotify calls made by the background poller")
+    HISTORY_FLUSH_BATCH_SIZE: int = Field(default=500, description="Flush buffered history writes once this many plays are waiting")
+    HISTORY_FLUSH_INTERVAL_SECONDS: float = Field(default=1.0, description="Flush buffered history writes at least this often")
+    RECONCILE_INTERVAL_SECONDS: float = Field(default=1800.0, description="Seconds between background recently-played syncs for every user")
+    WORKER_HEARTBEAT_SECONDS: float = Field(default=10.0, description="How often each worker renews its lease for sharding background work")
+    WORKER_LEASE_SECONDS: float = Field(default=30.0, description="A worker whose lease is older than this is considered dead and its users are rebalanced")
+    SPOTIFY_APP_RATE_PER_SECOND: float = Field(default=20.0, description="Sustained Spotify calls per second for the whole app (bursts up to twice this)")
+    SPOTIFY_USER_RATE_PER_SECOND: float = Field(default=1.0, description="Sustained Spotify calls per second per user (bursts up to 10)")
+    POLL_SCHEDULE_MODE: Literal["adaptive", "fixed"] = Field(default="adaptive", description="'adaptive' polls at expected track boundaries; 'fixed' polls every POLL_INTERVAL_SECONDS")
+    HISTORY_CACHE_MAX_ENTRIES: int = Field(default=10000, description="Maximum cached top-N history results per worker (least recently used are evicted)")
+    HISTORY_CACHE_TTL_SECONDS: float = Field(default=30.0, description="How long a cached top-N result lives at most; new plays invalidate it on every worker before that")
+    HISTORY_IMPORT_BATCH_SIZE: int = Field(default=1000, description="Plays per bulk upsert when importing a streaming history file")
+    HISTORY_IMPORT_PARALLELISM: int = Field(default=4, description="Bulk upserts in flight at once per streaming history import")
+    TRACK_CATALOG_CACHE_SIZE: int = Field(default=50000, description="Track catalog entries kept in memory per worker for joining plays to their metadata")
+    TRACK_CATALOG_TTL_SECONDS: float = Field(default=3600.0, description="How long a cached catalog entry is trusted before it is re-read from Mongo")
+    HISTORY_STORAGE: Literal["standard", "timeseries"] = Field(default="standard", description="'timeseries' keeps plays in a MongoDB time-series collection (user_id as metaField); migrate with scripts/migrate_history_timeseries.py")
+    SESSION_GAP_MINUTES: float = Field(default=30.0, description="Silence between plays (after the previous track ends) that starts a new listening session")
+    YEAR_REVIEW_PROCESSES: int = Field(default=0, description="Worker processes computing year-in-review reports (0 = one per CPU core)")
+    YEAR_REVIEW_INTERVAL_SECONDS: float = Field(default=86400.0, description="How often the leader worker refreshes this and last year's year-in-review reports (0 disables it)")
 
     @field_validator('SESSION_SECRET')
     @classmethod
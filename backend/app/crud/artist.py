@@ -4,10 +4,11 @@ import asyncio
 import logging
 import httpx
 import re
-import spotipy
 from typing import List, Optional
 from urllib.parse import quote
 
+from ..services.spotify_client import AsyncSpotify
+
 logger = logging.getLogger(__name__)
 
 # Shared async HTTP client for connection pooling
@@ -90,19 +91,18 @@ async def get_artist_description(artist_name: str) -> Optional[str]:
     return summary or None
 
 
-def fetch_top_artists(
-    spotify_client: spotipy.Spotify,
+async def fetch_top_artists(
+    spotify_client: AsyncSpotify,
     time_range: str = "medium_term",
     limit: int = 10
 ) -> List[dict]:
     """
     Return list of user's top artists with an optional Last.fm description.
-    Note: This is sync because it's called from async context but uses sync Spotify client.
     Description fetching is moved to a separate async endpoint if needed.
     """
-    items = spotify_client.current_user_top_artists(
+    items = (await spotify_client.current_user_top_artists(
         time_range=time_range, limit=limit
-    ).get("items", [])
+    )).get("items", [])
     result = []
     for art in items:
         images = art.get("images", [])
@@ -117,17 +117,20 @@ def fetch_top_artists(
     return result
 
 
-def fetch_artist_info(
-    spotify_client: spotipy.Spotify,
+async def fetch_artist_info(
+    spotify_client: AsyncSpotify,
     artist_id: str,
     country: str = "US"
 ) -> dict:
     """
     Return detailed artist info + their top tracks.
-    Bio is fetched separately to keep this sync.
+    Bio is fetched separately.
     """
-    details = spotify_client.artist(artist_id)
-    top_tracks = spotify_client.artist_top_tracks(artist_id, country=country).get("tracks", [])
+    details, top_tracks_data = await asyncio.gather(
+        spotify_client.artist(artist_id),
+        spotify_client.artist_top_tracks(artist_id, country=country),
+    )
+    top_tracks = top_tracks_data.get("tracks", [])
 
     # Get artist images from Spotify
     spotify_images = [img["url"] for img in details.get("images", []) if img.get("url")]
@@ -0,0 +1,113 @@
+# app/crud/heatmap.py
+
+from typing import Any, Dict, List, Optional
+from datetime import datetime, timezone, timedelta
+from zoneinfo import ZoneInfo
+
+from ..db.database import get_async_history_collection
+from ..schemas.history import HeatmapOut, PlaySeriesBucket, PlaySeriesOut
+
+DAY_NAMES = ["Mon", "Tue", "Wed", "Thu", "Fri", "Sat", "Sun"]
+SERIES_UNITS = ("day", "week", "month")
+
+
+def _match(user_id: str, since: Optional[datetime], until: Optional[datetime]) -> Dict[str, Any]:
+    match: Dict[str, Any] = {"user_id": user_id}
+    if since or until:
+        match["played_at"] = {}
+        if since:
+            match["played_at"]["$gte"] = since
+        if until:
+            match["played_at"]["$lt"] = until
+    return match
+
+
+def _covered_stages(user_id: str, since: Optional[datetime], until: Optional[datetime]) -> List[Dict[str, Any]]:
+    # Projecting only played_at lets Mongo answer from history_user_time
+    # alone (a covered scan) instead of fetching every play document; on
+    # time-series storage it means only played_at is unpacked from buckets
+    return [
+        {"$match": _match(user_id, since, until)},
+        {"$project": {"_id": 0, "played_at": 1}},
+    ]
+
+
+async def get_heatmap(
+    user_id: str,
+    tz: str = "UTC",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> HeatmapOut:
+    """
+    Plays per (day of week, hour of day) in timezone `tz`, bucketed inside
+    Mongo. Returns a dense 7x24 matrix, Monday first.
+    """
+    pipeline = _covered_stages(user_id, since, until) + [
+        {"$group": {
+            "_id": {
+                "dow": {"$isoDayOfWeek": {"date": "$played_at", "timezone": tz}},
+                "hour": {"$hour": {"date": "$played_at", "timezone": tz}},
+            },
+            "plays": {"$sum": 1},
+        }},
+    ]
+    matrix = [[0] * 24 for _ in DAY_NAMES]
+    total = 0
+    cursor = await get_async_history_collection().aggregate(pipeline, hint="history_user_time")
+    async for doc in cursor:
+        matrix[doc["_id"]["dow"] - 1][doc["_id"]["hour"]] = doc["plays"]
+        total += doc["plays"]
+    return HeatmapOut(timezone=tz, days=DAY_NAMES, hours=list(range(24)), matrix=matrix, total_plays=total)
+
+
+def _next_bucket(start: datetime, unit: str, zone: ZoneInfo) -> datetime:
+    """The start of the bucket after `start` (an aware local datetime)."""
+    local = start.replace(tzinfo=None)
+    if unit == "day":
+        local += timedelta(days=1)
+    elif unit == "week":
+        local += timedelta(weeks=1)
+    elif local.month == 12:
+        local = local.replace(year=local.year + 1, month=1)
+    else:
+        local = local.replace(month=local.month + 1)
+    return local.replace(tzinfo=zone)
+
+
+async def get_play_series(
+    user_id: str,
+    unit: str = "day",
+    tz: str = "UTC",
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None
+) -> PlaySeriesOut:
+    """
+    Plays per calendar day, week (starting Monday) or month in timezone `tz`,
+    bucketed inside Mongo with $dateTrunc. Buckets without plays between the
+    first and last play are filled in with zeros.
+    """
+    if unit not in SERIES_UNITS:
+        raise ValueError(f"unit must be one of {SERIES_UNITS}")
+    zone = ZoneInfo(tz)
+    pipeline = _covered_stages(user_id, since, until) + [
+        {"$group": {
+            "_id": {"$dateTrunc": {
+                "date": "$played_at", "unit": unit, "timezone": tz, "startOfWeek": "monday",
+            }},
+            "plays": {"$sum": 1},
+        }},
+        {"$sort": {"_id": 1}},
+    ]
+    counts: Dict[datetime, int] = {}
+    cursor = await get_async_history_collection().aggregate(pipeline, hint="history_user_time")
+    async for doc in cursor:
+        start = doc["_id"].replace(tzinfo=timezone.utc).astimezone(zone)
+        counts[start] = doc["plays"]
+
+    buckets: List[PlaySeriesBucket] = []
+    if counts:
+        start, last = min(counts), max(counts)
+        while start <= last:
+            buckets.append(PlaySeriesBucket(start=start, plays=counts.get(start, 0)))
+            start = _next_bucket(start, unit, zone)
+    return PlaySeriesOut(timezone=tz, unit=unit, buckets=buckets)
@@ -1,201 +1,396 @@
 # app/crud/history.py
 
 import logging
-from typing import List, Optional
-from datetime import datetime
-from pymongo.errors import DuplicateKeyError
-from ..db.database import get_history_collection
-from ..schemas.history import HistoryCreate, HistoryOut, TopTrackOut, TopArtistOut, TopAlbumOut
+from typing import Any, AsyncIterator, Dict, List, Optional, Tuple
+from datetime import datetime, timezone
+from pymongo import UpdateOne
+from pymongo.errors import BulkWriteError, DuplicateKeyError
+from ..db.database import get_async_history_collection, history_is_timeseries
+from .pagination import encode_cursor, decode_cursor, apply_before
+from .rollup import record_plays, top_from_rollups, rank_tracks, TRACK_COUNT_STAGES
+from .session import record_sessions
+from ..services.history_cache import history_cache
+from ..services.track_catalog import track_catalog
+from ..schemas.history import HistoryCreate, HistoryOut
 
 logger = logging.getLogger(__name__)
 
+# Reads hand back plain dicts shaped like the response models rather than
+# model instances: the documents are ours, so validating every row (HttpUrl
+# parsing included) and then again against the route's response_model only
+# costs time. The routers encode them as they are with ORJSONResponse.
+HISTORY_OUT_FIELDS = tuple(HistoryOut.model_fields)
 
-def save_history(entry: HistoryCreate) -> HistoryOut:
+
+def _play(entry: HistoryCreate) -> dict:
+    """The whole entry as a pure-Python dict, converting any HttpUrl → str."""
+    doc = entry.model_dump()
+    if doc.get("album_image") is not None:
+        doc["album_image"] = str(doc["album_image"])
+    return doc
+
+
+def _history_doc(entry: HistoryCreate) -> dict:
+    """
+    The document stored for a play. Track metadata lives in the `tracks`
+    catalog; artist_ids stay on the play for the per-artist index.
+    """
+    return {
+        "user_id": entry.user_id,
+        "track_id": entry.track_id,
+        "played_at": entry.played_at,
+        "artist_ids": entry.artist_ids,
+    }
+
+
+def _history_key(entry: HistoryCreate) -> dict:
+    """Filter matching the unique (user_id, track_id, played_at) index."""
+    return {
+        "user_id": entry.user_id,
+        "track_id": entry.track_id,
+        "played_at": entry.played_at,
+    }
+
+
+def _history_out(entry: HistoryCreate) -> HistoryOut:
+    return HistoryOut(
+        track_id=entry.track_id,
+        track_name=entry.track_name,
+        artist_name=entry.artist_name,
+        album_name=entry.album_name,
+        album_image=entry.album_image,
+        played_at=entry.played_at,
+        artist_ids=entry.artist_ids,
+        artist_names=entry.artist_names
+    )
+
+
+def _history_row(doc: dict) -> Dict[str, Any]:
+    """A stored play (with catalog fields attached) as a HistoryOut-shaped dict."""
+    return {field: doc.get(field) for field in HISTORY_OUT_FIELDS}
+
+
+async def save_history(entry: HistoryCreate) -> HistoryOut:
     """
     Insert the play event if it's not already recorded,
     using upsert to prevent race conditions.
-    Returns the cleaned-up record.
+    Returns the cleaned-up record, built from the input
+    ($setOnInsert means a stored duplicate holds the same data).
     """
-    # Build a pure-Python dict, converting any HttpUrl → str
-    doc = entry.model_dump()
-    if doc.get("album_image") is not None:
-        doc["album_image"] = str(doc["album_image"])
+    if history_is_timeseries():
+        await save_history_many([entry])
+        return _history_out(entry)
 
     # Use upsert to atomically insert if not exists (prevents race conditions)
     # The unique compound index on (user_id, track_id, played_at) ensures no duplicates
+    play = _play(entry)
+    await track_catalog.remember([play])
     try:
-        get_history_collection().update_one(
-            {
-                "user_id": entry.user_id,
-                "track_id": entry.track_id,
-                "played_at": entry.played_at,
-            },
-            {"$setOnInsert": doc},
+        result = await get_async_history_collection().update_one(
+            _history_key(entry),
+            {"$setOnInsert": _history_doc(entry)},
             upsert=True
         )
+        if result.upserted_id is not None:
+            await record_plays([play])
+            await record_sessions([play])
+            await history_cache.invalidate_users([entry.user_id])
     except DuplicateKeyError:
         # Already exists - this is fine, just log it
         logger.debug(f"Duplicate history entry ignored: {entry.user_id}/{entry.track_id}")
 
-    # Fetch back without any internal fields
-    raw = get_history_collection().find_one(
-        {
-            "user_id": entry.user_id,
-            "track_id": entry.track_id,
-            "played_at": entry.played_at,
-        },
-        {"_id": 0, "user_id": 0}
-    )
-    
-    if raw is None:
-        # Fallback: construct from input if query fails
-        return HistoryOut(
-            track_id=entry.track_id,
-            track_name=entry.track_name,
-            artist_name=entry.artist_name,
-            album_name=entry.album_name,
-            album_image=entry.album_image,
-            played_at=entry.played_at
+    return _history_out(entry)
+
+
+async def _upsert_plays(entries: List[HistoryCreate]) -> List[int]:
+    """Upsert against history_unique_play; returns the indexes of inserted entries."""
+    ops = [
+        UpdateOne(_history_key(entry), {"$setOnInsert": _history_doc(entry)}, upsert=True)
+        for entry in entries
+    ]
+    try:
+        result = await get_async_history_collection().bulk_write(ops, ordered=False)
+        upserted = result.upserted_ids.keys()
+    except BulkWriteError as e:
+        # Concurrent writers can race on the unique index; those plays are
+        # stored already. Anything else is a real failure.
+        errors = e.details.get("writeErrors", [])
+        if any(err.get("code") != 11000 for err in errors):
+            raise
+        logger.debug(f"Ignored {len(errors)} duplicate history entries in bulk write")
+        upserted = [u["index"] for u in e.details.get("upserted", [])]
+    return sorted(upserted)
+
+
+def _ms(value: datetime) -> int:
+    """Unix ms, the precision Mongo stores dates with (naive means UTC)."""
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return int(value.timestamp() * 1_000)
+
+
+async def _insert_new_plays(entries: List[HistoryCreate]) -> List[int]:
+    """
+    Time-series collections have neither unique indexes nor upserts, so
+    look the batch's plays up first (one query per user on history_user_time)
+    and insert only those not stored yet. Returns their indexes.
+
+    Unlike the unique index this doesn't stop two processes inserting the
+    same play at the same instant; the poller only writes plays of users
+    its worker owns, which keeps that to overlapping imports.
+    """
+    history = get_async_history_collection()
+    by_user: Dict[str, List[datetime]] = {}
+    for entry in entries:
+        by_user.setdefault(entry.user_id, []).append(entry.played_at)
+
+    stored = set()
+    for user_id, times in by_user.items():
+        cursor = history.find(
+            {"user_id": user_id, "played_at": {"$in": times}},
+            {"_id": 0, "track_id": 1, "played_at": 1}
         )
-    
-    return HistoryOut(**raw)
+        stored.update([(user_id, doc["track_id"], _ms(doc["played_at"])) async for doc in cursor])
+
+    new: List[int] = []
+    for i, entry in enumerate(entries):
+        key = (entry.user_id, entry.track_id, _ms(entry.played_at))
+        if key not in stored:
+            # Also drops repeats within the batch
+            stored.add(key)
+            new.append(i)
+    if new:
+        await history.insert_many([_history_doc(entries[i]) for i in new], ordered=False)
+    return new
+
+
+async def save_history_many(entries: List[HistoryCreate]) -> List[HistoryCreate]:
+    """
+    Upsert a batch of play events with a single unordered bulk_write
+    (time-series storage: one lookup per user, then one insert_many).
+    Returns the entries that were actually inserted (i.e. not already stored).
+    """
+    if not entries:
+        return []
+
+    plays = [_play(entry) for entry in entries]
+    await track_catalog.remember(plays)
+    if history_is_timeseries():
+        inserted = await _insert_new_plays(entries)
+    else:
+        inserted = await _upsert_plays(entries)
+    await record_plays(plays[i] for i in inserted)
+    await record_sessions(plays[i] for i in inserted)
+    if inserted:
+        await history_cache.invalidate_users(entries[i].user_id for i in inserted)
+    return [entries[i] for i in inserted]
 
 
-def get_user_history(
+async def get_play_times(
+    user_id: str,
+    start: datetime,
+    end: datetime
+) -> Dict[str, List[datetime]]:
+    """
+    Return the recorded played_at times per track_id for one user within
+    [start, end], as UTC-aware datetimes. Rides the history_user_time index.
+    """
+    cursor = get_async_history_collection().find(
+        {"user_id": user_id, "played_at": {"$gte": start, "$lte": end}},
+        {"_id": 0, "track_id": 1, "played_at": 1}
+    )
+    times: Dict[str, List[datetime]] = {}
+    async for doc in cursor:
+        played_at = doc["played_at"]
+        if played_at.tzinfo is None:
+            played_at = played_at.replace(tzinfo=timezone.utc)
+        times.setdefault(doc["track_id"], []).append(played_at)
+    return times
+
+
+def iter_plays(
+    user_id: str,
+    start: datetime,
+    end: datetime,
+    fields: Tuple[str, ...] = ("track_id",)
+) -> AsyncIterator[dict]:
+    """
+    Stream one user's plays in [start, end) along the history_user_time
+    index, projected down to played_at plus `fields`.
+    """
+    projection = {"_id": 0, "played_at": 1, **{field: 1 for field in fields}}
+    return get_async_history_collection().find(
+        {"user_id": user_id, "played_at": {"$gte": start, "$lt": end}},
+        projection,
+        batch_size=5000,
+    ).hint("history_user_time")
+
+
+def iter_user_history(
+    user_id: str,
+    fields: List[str],
+    since: Optional[datetime] = None,
+    batch_size: int = 1000
+) -> AsyncIterator[dict]:
+    """
+    Stream all of one user's plays, oldest first, as raw projected
+    documents (no per-row model) in `batch_size` round trips. Track
+    metadata is joined in from the catalog, `batch_size` plays at a time.
+    """
+    query: dict = {"user_id": user_id}
+    if since:
+        query["played_at"] = {"$gte": since}
+    projection = {"_id": 0, "track_id": 1, **{field: 1 for field in fields}}
+    cursor = (
+        get_async_history_collection()
+        .find(query, projection, batch_size=batch_size)
+        .sort([("played_at", 1), ("_id", 1)])
+    )
+    return track_catalog.iter_attached(cursor, batch_size)
+
+
+async def get_user_history(
     user_id: str,
     skip: int = 0,
     limit: int = 50,
-    since: Optional[datetime] = None
-) -> List[HistoryOut]:
+    since: Optional[datetime] = None,
+    before: Optional[str] = None,
+    artist_id: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Return a paginated, optionally time-filtered list of plays for one user.
+    Return a page of plays for one user, newest first, optionally
+    time-filtered, plus the cursor for the next page (None on the last page).
+    Plays are HistoryOut-shaped dicts.
+
+    Pass the previous page's cursor as `before` to continue: each page is
+    then a short scan of the history_user_time index, however deep it is.
+    `skip` still works but costs O(skip); raises ValueError on a bad cursor.
+    With `artist_id`, only plays crediting that artist (history_user_artist_time).
     """
     query: dict = {"user_id": user_id}
+    if artist_id:
+        query["artist_ids"] = artist_id
     if since:
         query["played_at"] = {"$gte": since}
+    if before:
+        apply_before(query, *decode_cursor(before))
 
     cursor = (
-        get_history_collection()
-        .find(query, {"_id": 0, "user_id": 0})
-        .sort("played_at", -1)
+        get_async_history_collection()
+        .find(query, {"user_id": 0})
+        .sort([("played_at", -1), ("_id", -1)])
         .skip(skip)
         .limit(limit)
     )
-    return [HistoryOut(**doc) for doc in cursor]
+    docs = await cursor.to_list()
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor(docs[-1]["played_at"], docs[-1]["_id"])
+    return [_history_row(doc) for doc in await track_catalog.attach(docs)], next_cursor
+
 
-def get_top_tracks(
+async def get_top_tracks(
     user_id: str,
     limit: int = 10,
     since: Optional[datetime] = None
-) -> List[TopTrackOut]:
+) -> List[Dict[str, Any]]:
     """
-    Return the user's most-played tracks, sorted by play_count desc.
+    Return the user's most-played tracks (TopTrackOut-shaped dicts), sorted by play_count desc.
+    Read from the per-day rollups and cached until the user's next play
+    (`since` is rounded down to the cache's bucket).
     """
-    match_stage = { "user_id": user_id }
-    if since:
-        match_stage["played_at"] = { "$gte": since }
-
-    pipeline = [
-        { "$match": match_stage },
-        { 
-          "$group": {
-            "_id": "$track_id",
-            "play_count": { "$sum": 1 },
-            "track_name": { "$first": "$track_name" },
-            "artist_name": { "$first": "$artist_name" },
-            "album_name": { "$first": "$album_name" },
-            "album_image": { "$first": "$album_image" }
-          }
-        },
-        { "$sort": { "play_count": -1 } },
-        { "$limit": limit },
-        { 
-          "$project": {
-            "_id": 0,
-            "track_id": "$_id",
-            "track_name": 1,
-            "artist_name": 1,
-            "album_name": 1,
-            "album_image": 1,
-            "play_count": 1
-          }
-        }
-    ]
+    return await history_cache.get_or_compute(
+        user_id, "top", limit, since,
+        lambda since: top_from_rollups(user_id, "track", limit, since)
+    )
 
-    results = get_history_collection().aggregate(pipeline)
-    return [TopTrackOut(**doc) for doc in results]
 
-def get_top_artists(
+async def get_top_artists(
     user_id: str,
     limit: int = 10,
     since: Optional[datetime] = None
-) -> List[TopArtistOut]:
+) -> List[Dict[str, Any]]:
     """
-    Return the user's most‐played artists, sorted by play_count desc.
+    Return the user's most‐played artists (TopArtistOut-shaped dicts), sorted by play_count desc.
+    Read from the per-day rollups and cached until the user's next play
+    (`since` is rounded down to the cache's bucket).
     """
-    match_stage = {"user_id": user_id}
-    if since:
-        match_stage["played_at"] = {"$gte": since}
-
-    pipeline = [
-        {"$match": match_stage},
-        {
-            "$group": {
-                "_id": "$artist_name",
-                "play_count": {"$sum": 1},
-                "artist_image": {"$first": "$album_image"}
-            }
-        },
-        {"$sort": {"play_count": -1}},
-        {"$limit": limit},
-        {
-            "$project": {
-                "_id": 0,
-                "artist_name": "$_id",
-                "play_count": 1,
-                "artist_image": 1
-            }
-        }
-    ]
-
-    results = get_history_collection().aggregate(pipeline)
-    return [TopArtistOut(**doc) for doc in results]
+    return await history_cache.get_or_compute(
+        user_id, "top-artists", limit, since,
+        lambda since: top_from_rollups(user_id, "artist", limit, since)
+    )
 
 
-def get_top_albums(
+async def get_top_albums(
     user_id: str,
     limit: int = 10,
     since: Optional[datetime] = None
-) -> List[TopAlbumOut]:
+) -> List[Dict[str, Any]]:
     """
-    Return the user's most‐played albums, sorted by play_count desc.
+    Return the user's most‐played albums (TopAlbumOut-shaped dicts), sorted by play_count desc.
+    Read from the per-day rollups and cached until the user's next play
+    (`since` is rounded down to the cache's bucket).
     """
-    match_stage = {"user_id": user_id}
-    if since:
-        match_stage["played_at"] = {"$gte": since}
-
-    pipeline = [
-        {"$match": match_stage},
-        {
-            "$group": {
-                "_id": "$album_name",
-                "play_count": {"$sum": 1},
-                "artist_name": {"$first": "$artist_name"},
-                "album_image": {"$first": "$album_image"},
-            }
-        },
-        {"$sort": {"play_count": -1}},
-        {"$limit": limit},
-        {
-            "$project": {
-                "_id":       0,
-                "album_name":"$_id",
-                "artist_name": 1,
-                "album_image": 1,
-                "play_count":  1,
-            }
-        }
-    ]
+    return await history_cache.get_or_compute(
+        user_id, "top-albums", limit, since,
+        lambda since: top_from_rollups(user_id, "album", limit, since)
+    )
+
+
+async def get_history_summary(
+    user_id: str,
+    since: Optional[datetime] = None,
+    tracks_limit: int = 10,
+    artists_limit: int = 10,
+    albums_limit: int = 10,
+    recent_limit: int = 20
+) -> Dict[str, Any]:
+    """
+    Return the top tracks, artists and albums, the most recent plays and the
+    total play count for one user in a single $facet aggregation, so a
+    dashboard needs one round trip and one scan of history_user_time.
+    The rankings are built from plays per track joined with the catalog.
+    Cached like the top-N reads (`since` is rounded down to the cache's bucket);
+    the result is a HistorySummaryOut-shaped dict.
+    """
+    async def compute(since: Optional[datetime]) -> List[Dict[str, Any]]:
+        match: dict = {"user_id": user_id}
+        if since:
+            match["played_at"] = {"$gte": since}
+        facets: dict = {"total": [{"$count": "plays"}]}
+        # Tracks, artists and albums are all ranked from plays per track;
+        # a limit of 0 leaves that ranking (or the recent facet) out
+        if tracks_limit or artists_limit or albums_limit:
+            facets["by_track"] = TRACK_COUNT_STAGES
+        if recent_limit:
+            facets["recent"] = [{"$limit": recent_limit}, {"$project": {"user_id": 0}}]
+        pipeline = [
+            {"$match": match},
+            # Walked in index order (newest first), so "recent" needs no sort
+            {"$sort": {"played_at": -1, "_id": -1}},
+            {"$facet": facets},
+        ]
+        cursor = await get_async_history_collection().aggregate(pipeline, allowDiskUse=True)
+        result = await cursor.next()
+
+        recent = result.get("recent", [])
+        next_cursor = None
+        if recent and len(recent) == recent_limit:
+            next_cursor = encode_cursor(recent[-1]["played_at"], recent[-1]["_id"])
+        total = result["total"][0]["plays"] if result["total"] else 0
+        by_track = {doc["_id"]: doc["count"] for doc in result.get("by_track", [])}
+
+        async def top(kind: str, limit: int) -> List[dict]:
+            return await rank_tracks(kind, by_track, limit) if limit else []
+
+        return [{
+            "top_tracks": await top("track", tracks_limit),
+            "top_artists": await top("artist", artists_limit),
+            "top_albums": await top("album", albums_limit),
+            "recent": [_history_row(doc) for doc in await track_catalog.attach(recent)],
+            "next_cursor": next_cursor,
+            "total_plays": total,
+        }]
 
-    results = get_history_collection().aggregate(pipeline)
-    return [TopAlbumOut(**doc) for doc in results]
\ No newline at end of file
+    endpoint = f"summary/{tracks_limit}/{artists_limit}/{albums_limit}"
+    return (await history_cache.get_or_compute(user_id, endpoint, recent_limit, since, compute))[0]
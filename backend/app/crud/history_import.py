@@ -0,0 +1,34 @@
+# app/crud/history_import.py
+
+from typing import Any, Dict, Optional
+from datetime import datetime, timezone
+
+from ..db.database import get_async_history_imports_collection
+
+
+def _job_id(user_id: str, source: str) -> str:
+    return f"{user_id}:{source}"
+
+
+async def get_import_job(user_id: str, source: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the progress record of one import (user + source file), or None.
+    """
+    return await get_async_history_imports_collection().find_one(
+        {"_id": _job_id(user_id, source)}, {"_id": 0}
+    )
+
+
+async def save_import_progress(user_id: str, source: str, progress: Dict[str, Any]) -> None:
+    """
+    Record how far an import got, so it can be resumed after that many records.
+    """
+    now = datetime.now(timezone.utc)
+    await get_async_history_imports_collection().update_one(
+        {"_id": _job_id(user_id, source)},
+        {
+            "$set": {**progress, "updated_at": now},
+            "$setOnInsert": {"user_id": user_id, "source": source, "started_at": now},
+        },
+        upsert=True
+    )
@@ -0,0 +1,63 @@
+# app/crud/pagination.py
+
+import base64
+import json
+from datetime import datetime, timezone
+from typing import Any, Dict, Tuple, Union
+
+from bson import ObjectId
+
+PlayedAt = Union[datetime, str]
+
+
+def encode_cursor(played_at: PlayedAt, doc_id: ObjectId) -> str:
+    """
+    Build an opaque cursor pointing just past the row (played_at, _id).
+    played_at keeps its BSON type (older songs rows store ISO strings).
+    """
+    if isinstance(played_at, datetime):
+        if played_at.tzinfo is None:
+            played_at = played_at.replace(tzinfo=timezone.utc)
+        value: Any = ["d", int(played_at.timestamp() * 1_000)]
+    else:
+        value = ["s", played_at]
+    raw = json.dumps(value + [str(doc_id)], separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor: str) -> Tuple[PlayedAt, ObjectId]:
+    """
+    Inverse of encode_cursor. Raises ValueError on anything malformed.
+    """
+    try:
+        raw = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        kind, value, doc_id = json.loads(raw)
+        if kind == "d":
+            played_at: PlayedAt = datetime.fromtimestamp(int(value) / 1_000, tz=timezone.utc)
+        elif kind == "s" and isinstance(value, str):
+            played_at = value
+        else:
+            raise ValueError(f"unknown cursor kind {kind!r}")
+        return played_at, ObjectId(doc_id)
+    except ValueError:
+        raise
+    except Exception as e:
+        raise ValueError(f"Invalid cursor: {e}") from e
+
+
+def apply_before(
+    query: Dict[str, Any],
+    played_at: PlayedAt,
+    doc_id: ObjectId,
+    field: str = "played_at"
+) -> Dict[str, Any]:
+    """
+    Restrict `query` to rows after (played_at, _id) in (played_at desc, _id desc)
+    order. The played_at bound stays a plain range on the index, so a
+    (..., played_at, _id) index serves every page as one short scan.
+    `field` names the time field for collections that don't call it played_at.
+    """
+    bounds = query.setdefault(field, {})
+    bounds["$lte"] = played_at
+    query["$or"] = [{field: {"$lt": played_at}}, {"_id": {"$lt": doc_id}}]
+    return query
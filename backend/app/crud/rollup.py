@@ -0,0 +1,305 @@
+# app/crud/rollup.py
+
+import logging
+from collections import Counter
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone, timedelta
+from pymongo import InsertOne, UpdateOne
+
+from ..db.database import get_async_history_collection, get_async_history_rollups_collection
+from .track_catalog import track_info
+from ..services.track_catalog import track_catalog
+
+logger = logging.getLogger(__name__)
+
+# For each rollup kind: the name its key has in the API output, the display
+# fields stored next to each counter, and the keys one play of a track
+# counts towards (each with those fields). Tracks come from the `tracks`
+# catalog, or straight off a play that is being written.
+def _track_keys(track: Dict[str, Any]) -> List[Tuple[Any, Dict[str, Any]]]:
+    return [(track["track_id"], {
+        "track_name": track.get("track_name"),
+        "artist_name": track.get("artist_name"),
+        "album_name": track.get("album_name"),
+        "album_image": track.get("album_image"),
+    })]
+
+
+def _artist_keys(track: Dict[str, Any]) -> List[Tuple[Any, Dict[str, Any]]]:
+    # Each credited artist of a play counts once; artist_names runs
+    # parallel to artist_ids
+    names = track.get("artist_names") or []
+    return [
+        (artist_id, {
+            "artist_name": names[i] if i < len(names) else None,
+            "artist_image": track.get("album_image"),
+        })
+        for i, artist_id in enumerate(track.get("artist_ids") or [])
+    ]
+
+
+def _album_keys(track: Dict[str, Any]) -> List[Tuple[Any, Dict[str, Any]]]:
+    return [(track.get("album_name"), {
+        "artist_name": track.get("artist_name"),
+        "album_image": track.get("album_image"),
+    })]
+
+
+ROLLUP_KINDS: Dict[str, Dict[str, Any]] = {
+    "track": {
+        "output_key": "track_id",
+        "fields": ("track_name", "artist_name", "album_name", "album_image"),
+        "keys": _track_keys,
+    },
+    "artist": {
+        "output_key": "artist_id",
+        "fields": ("artist_name", "artist_image"),
+        "keys": _artist_keys,
+    },
+    "album": {
+        "output_key": "album_name",
+        "fields": ("artist_name", "album_image"),
+        "keys": _album_keys,
+    },
+}
+
+# Plays per track; everything else is ranked from these and the catalog
+TRACK_COUNT_STAGES: List[Dict[str, Any]] = [{"$group": {"_id": "$track_id", "count": {"$sum": 1}}}]
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _day(value: datetime) -> datetime:
+    """UTC midnight of the day `value` falls on."""
+    return _as_utc(value).replace(hour=0, minute=0, second=0, microsecond=0)
+
+
+async def record_plays(docs: Iterable[Dict[str, Any]]) -> None:
+    """
+    Count newly inserted plays into the rollups: one daily bucket and one
+    all-time bucket (day=None) per kind. Each play is a dict with user_id,
+    played_at and its track's metadata (as passed to save_history).
+
+    Only call this for plays that were actually inserted, or they'll be
+    counted twice. A failure is logged rather than raised (the plays are
+    already stored); the rollups then drift until the backfill script
+    rebuilds them.
+    """
+    counts: Counter = Counter()
+    fields: Dict[Tuple[str, str, Any], Dict[str, Any]] = {}
+    for doc in docs:
+        day = _day(doc["played_at"])
+        for kind, spec in ROLLUP_KINDS.items():
+            for key, extra in spec["keys"](doc):
+                for bucket in (day, None):
+                    counts[(doc["user_id"], kind, key, bucket)] += 1
+                fields.setdefault((doc["user_id"], kind, key), extra)
+
+    if not counts:
+        return
+    ops = [
+        UpdateOne(
+            {"user_id": user_id, "kind": kind, "key": key, "day": day},
+            {"$inc": {"count": n}, "$setOnInsert": fields[(user_id, kind, key)]},
+            upsert=True
+        )
+        for (user_id, kind, key, day), n in counts.items()
+    ]
+    try:
+        await get_async_history_rollups_collection().bulk_write(ops, ordered=False)
+    except Exception as e:
+        # The plays themselves are stored; don't fail the history write over it
+        logger.error(f"Failed to update history rollups: {e}")
+
+
+def _output(kind: str, doc: Dict[str, Any]) -> Dict[str, Any]:
+    spec = ROLLUP_KINDS[kind]
+    out = {spec["output_key"]: doc["key"], "play_count": doc["count"]}
+    for field in spec["fields"]:
+        out[field] = doc.get(field)
+    return out
+
+
+async def rank_tracks(
+    kind: str,
+    track_counts: Dict[str, int],
+    limit: Optional[int] = None
+) -> List[Dict[str, Any]]:
+    """
+    Turn plays per track_id into the top-N `kind` entries (API-shaped,
+    play_count desc), looking the tracks up in the catalog.
+    """
+    spec = ROLLUP_KINDS[kind]
+    tracks = await track_catalog.get_many(track_counts)
+    totals: Dict[Any, Dict[str, Any]] = {}
+    for track_id, count in track_counts.items():
+        for key, extra in spec["keys"](track_info(track_id, tracks.get(track_id))):
+            entry = totals.get(key)
+            if entry is None:
+                totals[key] = {spec["output_key"]: key, "play_count": count, **extra}
+            else:
+                entry["play_count"] += count
+    ranked = sorted(totals.values(), key=lambda e: e["play_count"], reverse=True)
+    return ranked[:limit] if limit else ranked
+
+
+async def raw_track_counts(
+    user_id: str,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> Dict[str, int]:
+    """Plays per track_id straight from history, for plays in [start, end)."""
+    match: Dict[str, Any] = {"user_id": user_id}
+    if start or end:
+        match["played_at"] = {}
+        if start:
+            match["played_at"]["$gte"] = start
+        if end:
+            match["played_at"]["$lt"] = end
+    pipeline = [{"$match": match}] + TRACK_COUNT_STAGES
+    cursor = await get_async_history_collection().aggregate(pipeline)
+    return {doc["_id"]: doc["count"] async for doc in cursor}
+
+
+async def raw_top(
+    user_id: str,
+    kind: str,
+    limit: Optional[int] = None,
+    start: Optional[datetime] = None,
+    end: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    The top-N straight from the history collection, for plays in
+    [start, end): a $group per track over every matching play, ranked
+    through the catalog. Used for partial days and to check the rollups
+    against.
+    """
+    return await rank_tracks(kind, await raw_track_counts(user_id, start, end), limit)
+
+
+async def top_from_rollups(
+    user_id: str,
+    kind: str,
+    limit: int = 10,
+    since: Optional[datetime] = None
+) -> List[Dict[str, Any]]:
+    """
+    Return the user's top-N `kind` entries (plays since `since`, or all time),
+    sorted by play_count desc, read from the rollups instead of raw history.
+
+    All-time reads are an index-ordered scan of `limit` counters. A `since`
+    window sums the daily buckets of its whole days and counts the partial
+    first day from raw history, so it costs O(days x distinct keys) rather
+    than O(plays).
+    """
+    rollups = get_async_history_rollups_collection()
+    if since is None:
+        cursor = (
+            rollups.find({"user_id": user_id, "kind": kind, "day": None})
+            .sort("count", -1)
+            .limit(limit)
+        )
+        return [_output(kind, doc) async for doc in cursor]
+
+    since = _as_utc(since)
+    first_full_day = _day(since)
+    if first_full_day < since:
+        first_full_day += timedelta(days=1)
+
+    spec = ROLLUP_KINDS[kind]
+    group: Dict[str, Any] = {"_id": "$key", "count": {"$sum": "$count"}}
+    for field in spec["fields"]:
+        group[field] = {"$first": f"${field}"}
+    cursor = await rollups.aggregate([
+        {"$match": {"user_id": user_id, "kind": kind, "day": {"$gte": first_full_day}}},
+        {"$group": group},
+    ])
+    totals: Dict[Any, Dict[str, Any]] = {
+        doc["_id"]: _output(kind, {**doc, "key": doc["_id"]}) async for doc in cursor
+    }
+
+    if since < first_full_day:
+        for entry in await raw_top(user_id, kind, start=since, end=first_full_day):
+            key = entry[spec["output_key"]]
+            if key in totals:
+                totals[key]["play_count"] += entry["play_count"]
+            else:
+                totals[key] = entry
+
+    return sorted(totals.values(), key=lambda e: e["play_count"], reverse=True)[:limit]
+
+
+async def known_keys(user_id: str, kind: str, before: datetime) -> List[Any]:
+    """The `kind` keys (track ids, artist ids, album names) the user played on any day before `before`."""
+    # day < before skips the all-time buckets (day=None)
+    return await get_async_history_rollups_collection().distinct(
+        "key", {"user_id": user_id, "kind": kind, "day": {"$lt": _day(before)}}
+    )
+
+
+async def rebuild_rollups(user_id: str, batch_size: int = 1000) -> int:
+    """
+    Recompute one user's rollups from raw history. Returns the number of
+    rollup documents written.
+
+    Plays inserted while this runs may be missed or counted twice, so run
+    it with the poller stopped or follow it with a verify pass.
+    """
+    rollups = get_async_history_rollups_collection()
+    await rollups.delete_many({"user_id": user_id})
+
+    # Plays per (track, UTC day), then fanned out to each kind's keys
+    daily = await get_async_history_collection().aggregate([
+        {"$match": {"user_id": user_id}},
+        {"$group": {
+            "_id": {
+                "track_id": "$track_id",
+                "day": {"$dateTrunc": {"date": "$played_at", "unit": "day", "timezone": "UTC"}},
+            },
+            "count": {"$sum": 1},
+        }},
+    ], allowDiskUse=True, batchSize=batch_size)
+
+    counts: Counter = Counter()
+    fields: Dict[Tuple[str, Any], Dict[str, Any]] = {}
+
+    async def count_batch(rows: List[Dict[str, Any]]) -> None:
+        tracks = await track_catalog.get_many(row["_id"]["track_id"] for row in rows)
+        for row in rows:
+            track_id, day = row["_id"]["track_id"], row["_id"]["day"]
+            track = track_info(track_id, tracks.get(track_id))
+            for kind, spec in ROLLUP_KINDS.items():
+                for key, extra in spec["keys"](track):
+                    counts[(kind, key, day)] += row["count"]
+                    counts[(kind, key, None)] += row["count"]
+                    fields.setdefault((kind, key), extra)
+
+    rows: List[Dict[str, Any]] = []
+    async for row in daily:
+        rows.append(row)
+        if len(rows) >= batch_size:
+            await count_batch(rows)
+            rows = []
+    if rows:
+        await count_batch(rows)
+
+    written = 0
+    ops: List[InsertOne] = []
+    for (kind, key, day), count in counts.items():
+        ops.append(InsertOne({
+            "user_id": user_id, "kind": kind, "key": key, "day": day,
+            "count": count, **fields[(kind, key)],
+        }))
+        if len(ops) >= batch_size:
+            await rollups.bulk_write(ops, ordered=False)
+            written += len(ops)
+            ops = []
+    if ops:
+        await rollups.bulk_write(ops, ordered=False)
+        written += len(ops)
+    logger.debug(f"Rebuilt {written} rollup documents for {user_id}")
+    return written
@@ -0,0 +1,289 @@
+# app/crud/session.py
+
+import asyncio
+import logging
+import time
+import uuid
+import weakref
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+from datetime import datetime, timezone, timedelta
+from pymongo import DeleteMany, InsertOne, UpdateOne
+
+from ..config import settings
+from ..db.database import get_async_history_collection, get_async_listening_sessions_collection
+from .pagination import encode_cursor, decode_cursor, apply_before
+from .sync_state import acquire_sessions_lease, release_sessions_lease
+from ..services.history_cache import history_cache
+from ..services.track_catalog import track_catalog
+from ..schemas.history import SessionStatsOut
+
+logger = logging.getLogger(__name__)
+
+# Fields of a SessionOut row
+SESSION_FIELDS = ("start", "end", "plays", "duration_ms")
+
+# A span is one play or one stored session: (start, end, plays, stored _id)
+Span = Tuple[datetime, datetime, int, Optional[Any]]
+
+# How long one writer may hold a user's sessions, and how long others wait for it
+LEASE_SECONDS = 30.0
+LEASE_WAIT_SECONDS = 10.0
+
+
+def _gap() -> timedelta:
+    return timedelta(minutes=settings.SESSION_GAP_MINUTES)
+
+
+def _as_utc(value: datetime) -> datetime:
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def _extend(sessions: List[Dict[str, Any]], span: Span, gap: timedelta) -> None:
+    """
+    Add a span to `sessions` (built in start order): it joins the last
+    session when it starts at most `gap` after that session ends.
+    """
+    start, end, plays, stored_id = span
+    if sessions and start - sessions[-1]["end"] <= gap:
+        session = sessions[-1]
+        session["end"] = max(session["end"], end)
+        session["plays"] += plays
+    else:
+        session = {"start": start, "end": end, "plays": plays, "ids": [], "new": 0}
+        sessions.append(session)
+    if stored_id is None:
+        session["new"] += plays
+    else:
+        session["ids"].append(stored_id)
+
+
+def _session_doc(session: Dict[str, Any]) -> Dict[str, Any]:
+    return {
+        "start": session["start"],
+        "end": session["end"],
+        "plays": session["plays"],
+        "duration_ms": int((session["end"] - session["start"]).total_seconds() * 1_000),
+    }
+
+
+async def _play_spans(plays: List[Dict[str, Any]]) -> List[Span]:
+    """
+    One span per play, from when it started to when its track ended. Plays
+    without duration_ms take it from the catalog (0 if unknown).
+    """
+    tracks = await track_catalog.get_many(p.get("track_id") for p in plays if not p.get("duration_ms"))
+    spans = []
+    for play in plays:
+        duration = play.get("duration_ms") or tracks.get(play.get("track_id"), {}).get("duration_ms") or 0
+        start = _as_utc(play["played_at"])
+        spans.append((start, start + timedelta(milliseconds=duration), 1, None))
+    return spans
+
+
+async def _stored_spans(user_id: str, low: datetime, high: datetime) -> List[Span]:
+    """
+    The user's stored sessions that reach into [low, high]. Sessions are
+    disjoint, so of those starting before `low` only the latest can: two
+    bounded scans of sessions_user_start instead of every older session.
+    """
+    collection = get_async_listening_sessions_collection()
+    docs = await collection.find(
+        {"user_id": user_id, "start": {"$lt": low}}, sort=[("start", -1)], limit=1
+    ).to_list()
+    docs = [doc for doc in docs if _as_utc(doc["end"]) >= low]
+    docs += await collection.find({"user_id": user_id, "start": {"$gte": low, "$lte": high}}).to_list()
+    return [(_as_utc(doc["start"]), _as_utc(doc["end"]), doc["plays"], doc["_id"]) for doc in docs]
+
+
+async def _merge_sessions(user_id: str, user_plays: List[Dict[str, Any]], gap: timedelta) -> None:
+    spans = await _play_spans(user_plays)
+    low = min(span[0] for span in spans) - gap
+    high = max(span[1] for span in spans) + gap
+    spans += await _stored_spans(user_id, low, high)
+
+    sessions: List[Dict[str, Any]] = []
+    for span in sorted(spans, key=lambda s: s[0]):
+        _extend(sessions, span, gap)
+    ops = []
+    for session in sessions:
+        ids = session["ids"]
+        if not session["new"] and len(ids) == 1:
+            continue  # a stored session nothing was added to
+        doc = _session_doc(session)
+        if ids:
+            ops.append(UpdateOne({"_id": ids[0]}, {"$set": doc}))
+            if len(ids) > 1:
+                ops.append(DeleteMany({"_id": {"$in": ids[1:]}}))
+        else:
+            ops.append(InsertOne({"user_id": user_id, **doc}))
+    if ops:
+        await get_async_listening_sessions_collection().bulk_write(ops, ordered=False)
+
+
+# One merge per user at a time in this process (imports write batches in
+# parallel, next to the poller and reconciler); the lease covers other workers
+_user_locks: "weakref.WeakValueDictionary[str, asyncio.Lock]" = weakref.WeakValueDictionary()
+_HOLDER = uuid.uuid4().hex
+
+
+async def _locked_merge(user_id: str, user_plays: List[Dict[str, Any]], gap: timedelta) -> None:
+    lock = _user_locks.get(user_id)
+    if lock is None:
+        lock = _user_locks[user_id] = asyncio.Lock()
+    async with lock:
+        deadline = time.monotonic() + LEASE_WAIT_SECONDS
+        while not await acquire_sessions_lease(user_id, _HOLDER, LEASE_SECONDS):
+            if time.monotonic() >= deadline:
+                raise TimeoutError(f"sessions of {user_id} stayed locked for {LEASE_WAIT_SECONDS:g}s")
+            await asyncio.sleep(0.05)
+        try:
+            await _merge_sessions(user_id, user_plays, gap)
+        finally:
+            await release_sessions_lease(user_id, _HOLDER)
+
+
+async def record_sessions(plays: Iterable[Dict[str, Any]]) -> None:
+    """
+    Fold newly inserted plays (dicts with user_id, track_id, played_at and
+    optionally duration_ms) into the user's stored listening sessions.
+
+    A new play can only extend or join sessions, never split one, so only
+    the stored sessions within the gap of the new plays are read and merged
+    again; the first of a merged group keeps its _id, the rest are deleted.
+    That read-modify-write runs under a per-user lock and lease, so
+    concurrent writers can't split or duplicate sessions.
+    Like record_plays: only pass plays that were actually inserted, and a
+    failure is logged rather than raised; rebuild_sessions() repairs drift.
+    """
+    by_user: Dict[str, List[Dict[str, Any]]] = {}
+    for play in plays:
+        by_user.setdefault(play["user_id"], []).append(play)
+    if not by_user:
+        return
+
+    gap = _gap()
+    for user_id, user_plays in by_user.items():
+        try:
+            await _locked_merge(user_id, user_plays, gap)
+        except Exception as e:
+            # The plays themselves are stored; don't fail the history write over it
+            logger.error(f"Failed to update listening sessions of {user_id}: {e}")
+
+
+async def rebuild_sessions(user_id: str, batch_size: int = 1000) -> int:
+    """
+    Recompute one user's sessions from raw history (e.g. after changing
+    SESSION_GAP_MINUTES). Returns the number of sessions written.
+
+    Plays inserted while this runs may be missed, so run it with the
+    poller stopped or run it again afterwards.
+    """
+    gap = _gap()
+    cursor = (
+        get_async_history_collection()
+        .find({"user_id": user_id}, {"_id": 0, "track_id": 1, "played_at": 1}, batch_size=batch_size)
+        .sort("played_at", 1)
+    )
+    sessions: List[Dict[str, Any]] = []
+    batch: List[Dict[str, Any]] = []
+    async for doc in cursor:
+        batch.append(doc)
+        if len(batch) >= batch_size:
+            for span in await _play_spans(batch):
+                _extend(sessions, span, gap)
+            batch = []
+    if batch:
+        for span in await _play_spans(batch):
+            _extend(sessions, span, gap)
+
+    collection = get_async_listening_sessions_collection()
+    await collection.delete_many({"user_id": user_id})
+    docs = [{"user_id": user_id, **_session_doc(session)} for session in sessions]
+    for i in range(0, len(docs), batch_size):
+        await collection.insert_many(docs[i:i + batch_size], ordered=False)
+    await history_cache.invalidate_users([user_id])
+    return len(docs)
+
+
+async def get_sessions(
+    user_id: str,
+    limit: int = 50,
+    since: Optional[datetime] = None,
+    until: Optional[datetime] = None,
+    before: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    """
+    Return a page of one user's listening sessions that started in
+    [since, until), newest first, as SessionOut-shaped dicts, plus the
+    cursor for the next page (None on the last page). Raises ValueError on
+    a bad cursor.
+    """
+    query: Dict[str, Any] = {"user_id": user_id}
+    if since or until:
+        query["start"] = {}
+        if since:
+            query["start"]["$gte"] = since
+        if until:
+            query["start"]["$lt"] = until
+    if before:
+        apply_before(query, *decode_cursor(before), field="start")
+
+    cursor = (
+        get_async_listening_sessions_collection()
+        .find(query, {"user_id": 0})
+        .sort([("start", -1), ("_id", -1)])
+        .limit(limit)
+    )
+    docs = await cursor.to_list()
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor(docs[-1]["start"], docs[-1]["_id"])
+    return [{field: doc[field] for field in SESSION_FIELDS} for doc in docs], next_cursor
+
+
+async def get_session_stats(user_id: str, since: Optional[datetime] = None) -> SessionStatsOut:
+    """
+    Average and longest session and sessions per day for sessions started
+    since `since` (or all time), in one $group over the stored sessions.
+    Cached like the top-N reads (`since` is rounded down to the cache's bucket).
+    """
+    async def compute(since: Optional[datetime]) -> List[SessionStatsOut]:
+        match: Dict[str, Any] = {"user_id": user_id}
+        if since:
+            match["start"] = {"$gte": since}
+        cursor = await get_async_listening_sessions_collection().aggregate([
+            {"$match": match},
+            {"$group": {
+                "_id": None,
+                "sessions": {"$sum": 1},
+                "plays": {"$sum": "$plays"},
+                "average_ms": {"$avg": "$duration_ms"},
+                # Embedded documents compare field by field, duration first
+                "longest": {"$max": {
+                    "duration_ms": "$duration_ms", "start": "$start", "end": "$end", "plays": "$plays",
+                }},
+                "first_start": {"$min": "$start"},
+            }},
+        ])
+        result = await cursor.to_list()
+        if not result:
+            return [SessionStatsOut(
+                gap_minutes=settings.SESSION_GAP_MINUTES,
+                sessions=0, total_plays=0, average_session_ms=0, sessions_per_day=0.0
+            )]
+
+        stats = result[0]
+        first = _as_utc(since or stats["first_start"])
+        days = max((datetime.now(timezone.utc) - first) / timedelta(days=1), 1.0)
+        return [SessionStatsOut(
+            gap_minutes=settings.SESSION_GAP_MINUTES,
+            sessions=stats["sessions"],
+            total_plays=stats["plays"],
+            average_session_ms=round(stats["average_ms"] or 0),
+            longest_session=stats["longest"],
+            sessions_per_day=round(stats["sessions"] / days, 2),
+        )]
+
+    return (await history_cache.get_or_compute(user_id, "sessions", 0, since, compute))[0]
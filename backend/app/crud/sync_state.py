@@ -0,0 +1,55 @@
+# app/crud/sync_state.py
+
+from typing import Iterable
+from datetime import datetime, timezone, timedelta
+from pymongo import UpdateOne
+from pymongo.errors import DuplicateKeyError
+
+from ..db.database import get_async_sync_state_collection
+
+
+async def get_history_generation(user_id: str) -> int:
+    """How many times this user's history has changed (0 if never), read on sync_state_user_id."""
+    doc = await get_async_sync_state_collection().find_one({"user_id": user_id}, {"_id": 0, "history_generation": 1})
+    return doc.get("history_generation", 0) if doc else 0
+
+
+async def bump_history_generations(user_ids: Iterable[str]) -> None:
+    """Mark the history of these users as changed, for every worker's cache."""
+    now = datetime.now(timezone.utc)
+    ops = [
+        UpdateOne({"user_id": user_id}, {"$inc": {"history_generation": 1}, "$set": {"updated_at": now}}, upsert=True)
+        for user_id in set(user_ids)
+    ]
+    if ops:
+        await get_async_sync_state_collection().bulk_write(ops, ordered=False)
+
+
+async def acquire_sessions_lease(user_id: str, holder: str, seconds: float) -> bool:
+    """
+    Try to take the user's listening-sessions lease for `seconds`, so only
+    one writer (in any worker) merges their sessions at a time. A lease
+    whose holder died expires on its own. Returns False if it is taken.
+    """
+    now = datetime.now(timezone.utc)
+    try:
+        await get_async_sync_state_collection().update_one(
+            {
+                "user_id": user_id,
+                "$or": [{"sessions_lease_until": {"$exists": False}}, {"sessions_lease_until": {"$lt": now}}],
+            },
+            {"$set": {"sessions_lease_holder": holder, "sessions_lease_until": now + timedelta(seconds=seconds)}},
+            upsert=True,
+        )
+    except DuplicateKeyError:
+        # The filter didn't match because someone else holds the lease
+        return False
+    return True
+
+
+async def release_sessions_lease(user_id: str, holder: str) -> None:
+    """Give the lease back, unless it expired and was taken over meanwhile."""
+    await get_async_sync_state_collection().update_one(
+        {"user_id": user_id, "sessions_lease_holder": holder},
+        {"$unset": {"sessions_lease_holder": "", "sessions_lease_until": ""}},
+    )
@@ -0,0 +1,65 @@
+# app/crud/token.py
+
+from typing import Dict, Any, Optional
+from datetime import datetime, timezone
+
+from pymongo.errors import DuplicateKeyError
+
+from ..db.database import get_async_tokens_collection
+
+
+async def save_token(user_id: str, token_info: Dict[str, Any]) -> bool:
+    """
+    Store (or replace) the OAuth token for a user so the background
+    poller can act on their behalf.
+
+    The write is a single conditional upsert that never replaces a token
+    expiring later than this one, so concurrent refreshes can't roll the
+    stored token back. Returns False if a newer token was already stored.
+    """
+    expires_at = token_info.get("expires_at", 0)
+    try:
+        await get_async_tokens_collection().update_one(
+            {
+                "user_id": user_id,
+                "$or": [
+                    {"token_info.expires_at": {"$lt": expires_at}},
+                    {"token_info.expires_at": {"$exists": False}},
+                ],
+            },
+            {
+                "$set": {
+                    "user_id": user_id,
+                    "token_info": token_info,
+                    "updated_at": datetime.now(timezone.utc),
+                }
+            },
+            upsert=True
+        )
+    except DuplicateKeyError:
+        # The filter didn't match because a newer token is stored
+        return False
+    return True
+
+
+async def get_token(user_id: str) -> Optional[Dict[str, Any]]:
+    """
+    Return the stored OAuth token for a user, or None if we have none.
+    """
+    doc = await get_async_tokens_collection().find_one({"user_id": user_id}, {"_id": 0, "token_info": 1})
+    return doc["token_info"] if doc else None
+
+
+async def get_all_tokens() -> Dict[str, Dict[str, Any]]:
+    """
+    Return every stored token keyed by user_id.
+    """
+    cursor = get_async_tokens_collection().find({}, {"_id": 0, "user_id": 1, "token_info": 1})
+    return {doc["user_id"]: doc["token_info"] async for doc in cursor if doc.get("token_info")}
+
+
+async def delete_token(user_id: str) -> None:
+    """
+    Forget a user's token (e.g. after Spotify revoked the refresh token).
+    """
+    await get_async_tokens_collection().delete_one({"user_id": user_id})
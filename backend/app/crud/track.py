@@ -1,19 +1,29 @@
 # app/crud/track.py
 
-from typing import List, Dict, Any, Optional
+from typing import List, Dict, Any, Optional, Tuple, Union
 from datetime import datetime, timezone
-import spotipy
 
-from ..db.database import get_songs_collection
+from ..db.database import get_async_songs_collection, get_async_sync_state_collection
+from .pagination import encode_cursor, decode_cursor, apply_before
+from ..services.spotify_client import AsyncSpotify
+from ..services.identity import resolve_user_id
+from ..services.track_catalog import track_catalog
 
-def fetch_recently_played_spotify(
-    spotify_client: spotipy.Spotify,
+# Track metadata goes to the `tracks` catalog; a songs document only keeps these
+SONG_FIELDS = ("username", "user_id", "track_id", "played_at", "is_playing", "progress_ms")
+
+
+def _song_doc(info: Dict[str, Any]) -> Dict[str, Any]:
+    return {field: info[field] for field in SONG_FIELDS if field in info}
+
+async def fetch_recently_played_spotify(
+    spotify_client: AsyncSpotify,
     limit: int = 30
 ) -> List[Dict[str, Any]]:
     """
     Fetch the user's recently played tracks directly from Spotify.
     """
-    data = spotify_client.current_user_recently_played(limit=limit).get("items", [])
+    data = (await spotify_client.current_user_recently_played(limit=limit)).get("items", [])
     result = []
     for item in data:
         track = item.get("track", {})
@@ -32,63 +42,151 @@ def fetch_recently_played_spotify(
     return result
 
 
-def sync_recently_played_db(
-    spotify_client: spotipy.Spotify,
+def artist_refs(artists: List[Dict[str, Any]]) -> Tuple[List[str], List[str]]:
+    """
+    Parallel lists of artist ids and names from a Spotify track's `artists`
+    (artists without an id, e.g. on local files, are left out).
+    """
+    credited = [a for a in artists if a.get("id")]
+    return [a["id"] for a in credited], [a.get("name", "Unknown") for a in credited]
+
+
+def parse_played_at(value: Union[str, datetime]) -> datetime:
+    """
+    A played_at as an aware UTC datetime: either a date or an ISO-8601
+    string (e.g. Spotify's '2024-05-01T12:00:00.123Z'). Naive values, as
+    older rows stored them, are taken to be UTC already.
+    """
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace("Z", "+00:00"))
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+async def get_sync_cursor(username: str) -> Optional[int]:
+    """
+    Return the Spotify `after` cursor (unix ms) of the last recently-played sync,
+    or None if this user has never been synced incrementally.
+    """
+    doc = await get_async_sync_state_collection().find_one({"user_id": username}, {"_id": 0, "recently_played_after": 1})
+    return doc.get("recently_played_after") if doc else None
+
+
+async def set_sync_cursor(username: str, after: int) -> None:
+    await get_async_sync_state_collection().update_one(
+        {"user_id": username},
+        {"$set": {"recently_played_after": after, "updated_at": datetime.now(timezone.utc)}},
+        upsert=True,
+    )
+
+
+async def sync_recently_played_db(
+    spotify_client: AsyncSpotify,
     username: str,
     limit: int = 50
-) -> None:
+) -> List[Dict[str, Any]]:
     """
-    Pull down the user's latest plays from Spotify and append any new ones
-    to the songs_collection under the given username.
+    Pull down the plays Spotify recorded since the last sync (using the stored
+    `after` cursor) and append them to the songs_collection in one bulk insert.
+    Returns the newly inserted documents.
     """
-    items = spotify_client.current_user_recently_played(limit=limit).get("items", [])
-    latest = get_songs_collection().find_one(
-        {"username": username},
-        sort=[("played_at", -1)]
-    )
-    latest_time = latest["played_at"] if latest else None
+    after = await get_sync_cursor(username)
+    data = await spotify_client.current_user_recently_played(limit=limit, after=after)
+    items = data.get("items", [])
+
+    latest_time = None
+    if after is None:
+        # First incremental sync: skip whatever an earlier full sync already stored
+        latest = await get_async_songs_collection().find_one(
+            {"username": username},
+            {"played_at": 1},
+            sort=[("played_at", -1)]
+        )
+        if latest and latest.get("played_at"):
+            # Rows not yet migrated by scripts.migrate_songs_played_at still hold strings
+            latest_time = parse_played_at(latest["played_at"])
 
+    docs: List[Dict[str, Any]] = []
+    newest_ms = after
     for item in items:
-        played_at = item.get("played_at")
-        if not played_at:
+        raw_played_at = item.get("played_at")
+        track = item.get("track", {})
+        if not raw_played_at or not track:
             continue
-        if not latest_time or played_at > latest_time:
-            track = item.get("track", {})
-            if not track:
-                continue
-            album = track.get("album", {})
-            album_images = album.get("images", [])
-            doc = {
-                "username":    username,
-                "track_id":    track.get("id"),
-                "track_name":  track.get("name", "Unknown Track"),
-                "artist_name": ", ".join(a.get("name", "Unknown") for a in track.get("artists", [])),
-                "album_name":  album.get("name", "Unknown Album"),
-                "album_image": album_images[0]["url"] if album_images and len(album_images) > 0 else None,
-                "played_at":   played_at,
-            }
-            get_songs_collection().insert_one(doc)
+        played_at = parse_played_at(raw_played_at)
+        played_ms = int(played_at.timestamp() * 1_000)
+        if after is not None and played_ms <= after:
+            continue
+        newest_ms = max(newest_ms or 0, played_ms)
+        if latest_time and played_at <= latest_time:
+            continue
+        album = track.get("album", {})
+        album_images = album.get("images", [])
+        artist_ids, artist_names = artist_refs(track.get("artists", []))
+        docs.append({
+            "username":    username,
+            "track_id":    track.get("id"),
+            "track_name":  track.get("name", "Unknown Track"),
+            "artist_name": ", ".join(a.get("name", "Unknown") for a in track.get("artists", [])),
+            "artist_ids":  artist_ids,
+            "artist_names": artist_names,
+            "album_name":  album.get("name", "Unknown Album"),
+            "album_image": album_images[0]["url"] if album_images and len(album_images) > 0 else None,
+            "duration_ms": track.get("duration_ms", 0),
+            "played_at":   played_at,
+        })
+
+    if docs:
+        await track_catalog.remember(docs)
+        # insert_many adds _id to each dict; keep the returned docs JSON-friendly
+        await get_async_songs_collection().insert_many([_song_doc(d) for d in docs], ordered=False)
+
+    # Prefer Spotify's own cursor; fall back to the newest play we saw
+    cursor_after = (data.get("cursors") or {}).get("after")
+    if cursor_after:
+        newest_ms = max(newest_ms or 0, int(cursor_after))
+    if newest_ms is not None and newest_ms != after:
+        await set_sync_cursor(username, newest_ms)
+
+    return docs
 
 
-def get_recently_played_db(
+async def get_recently_played_db(
     username: str,
     skip: int = 0,
-    limit: int = 30
-) -> List[Dict[str, Any]]:
+    limit: int = 30,
+    before: Optional[str] = None
+) -> Tuple[List[Dict[str, Any]], Optional[str]]:
     """
-    Return a page of the plays we've stored for this username.
+    Return a page of the plays we've stored for this username, plus the
+    cursor for the next page (None on the last page).
+    Pass that cursor as `before` for O(limit) paging; raises ValueError on a bad cursor.
+
+    played_at is a date on every row once scripts/migrate_songs_played_at.py
+    has converted the ISO strings older rows were stored with.
     """
+    query: Dict[str, Any] = {"username": username}
+    if before:
+        apply_before(query, *decode_cursor(before))
+
     cursor = (
-        get_songs_collection()
-        .find({"username": username}, {"_id": 0})
-        .sort("played_at", -1)
+        get_async_songs_collection()
+        .find(query)
+        .sort([("played_at", -1), ("_id", -1)])
         .skip(skip)
         .limit(limit)
     )
-    return list(cursor)
+    docs = await cursor.to_list()
+    next_cursor = None
+    if len(docs) == limit:
+        next_cursor = encode_cursor(docs[-1]["played_at"], docs[-1]["_id"])
+    for doc in docs:
+        del doc["_id"]
+    return await track_catalog.attach(docs), next_cursor
 
 
-def get_songs_most_played() -> List[Dict[str, Any]]:
+async def get_songs_most_played() -> List[Dict[str, Any]]:
     """
     Aggregate songs_collection to find the most-played tracks,
     returning clean, JSON-serializable documents including play_count.
@@ -103,7 +201,8 @@ def get_songs_most_played() -> List[Dict[str, Any]]:
         },
         {"$sort": {"play_count": -1}}
     ]
-    results = list(get_songs_collection().aggregate(pipeline))
+    results = await (await get_async_songs_collection().aggregate(pipeline)).to_list()
+    await track_catalog.attach([r["doc"] for r in results])
     output: List[Dict[str, Any]] = []
 
     for r in results:
@@ -121,14 +220,14 @@ def get_songs_most_played() -> List[Dict[str, Any]]:
     return output
 
 
-def sync_currently_playing(
-    spotify_client: spotipy.Spotify
+async def sync_currently_playing(
+    spotify_client: AsyncSpotify
 ) -> Optional[Dict[str, Any]]:
     """
     Fetch the user's current playback, upsert it into songs_collection,
     and return a plain-Python dict safe for JSON serialization.
     """
-    playback = spotify_client.current_playback()
+    playback = await spotify_client.current_playback()
     if not playback or not playback.get("is_playing"):
         return None
 
@@ -137,39 +236,45 @@ def sync_currently_playing(
         # Can happen with podcasts, local files, or ads
         return None
 
-    user = spotify_client.current_user()
-    user_id = user["id"]
+    user_id = await resolve_user_id(spotify_client)
+    if not user_id:
+        return None
 
     # Safely access nested fields
     album = item.get("album", {})
     album_images = album.get("images", [])
+    artist_ids, artist_names = artist_refs(item.get("artists", []))
     
     info: Dict[str, Any] = {
         "user_id":     user_id,
         "track_id":    item.get("id"),
         "track_name":  item.get("name", "Unknown Track"),
         "artist_name": ", ".join(a.get("name", "Unknown") for a in item.get("artists", [])),
+        "artist_ids":  artist_ids,
+        "artist_names": artist_names,
         "album_name":  album.get("name", "Unknown Album"),
         "album_image": album_images[0]["url"] if album_images and len(album_images) > 0 else None,
         "is_playing":  playback.get("is_playing", False),
         "progress_ms": playback.get("progress_ms", 0),
         "duration_ms": item.get("duration_ms", 0),
-        # Use ISO string only—no datetime objects
-        "played_at":   datetime.now(timezone.utc).isoformat(),
+        "played_at":   datetime.now(timezone.utc),
     }
 
     # Only upsert if we have a valid track_id
     if info["track_id"]:
-        get_songs_collection().update_one(
+        await track_catalog.remember([info])
+        await get_async_songs_collection().update_one(
             {
                 "user_id":   user_id,
                 "track_id":  info["track_id"],
                 "played_at": info["played_at"],
             },
-            {"$setOnInsert": info},
+            {"$setOnInsert": _song_doc(info)},
             upsert=True,
         )
 
+    # Stored as a date; returned as an ISO string
+    info["played_at"] = info["played_at"].isoformat()
     # Ensure album_image is a plain string
     if info.get("album_image") is not None:
         info["album_image"] = str(info["album_image"])
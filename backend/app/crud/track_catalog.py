@@ -0,0 +1,67 @@
+# app/crud/track_catalog.py
+
+from datetime import datetime, timezone
+from typing import Any, Dict, Iterable, Optional
+from pymongo import UpdateOne
+
+from ..db.database import get_async_tracks_collection
+
+# Per-track metadata that lives in the `tracks` catalog (keyed by track_id)
+# instead of being repeated on every history / songs document, and the
+# values a play shows when its track is missing from the catalog
+TRACK_DEFAULTS: Dict[str, Any] = {
+    "track_name": "Unknown Track",
+    "artist_name": "Unknown",
+    "artist_ids": [],
+    "artist_names": [],
+    "album_name": "Unknown Album",
+    "album_image": None,
+    "duration_ms": None,
+}
+
+
+def catalog_entry(doc: Dict[str, Any]) -> Dict[str, Any]:
+    """
+    The catalog fields a play (or Spotify-shaped track dict) carries, leaving
+    out the ones it doesn't know (None or empty lists).
+    """
+    entry: Dict[str, Any] = {}
+    for field in TRACK_DEFAULTS:
+        value = doc.get(field)
+        if value is None or value == []:
+            continue
+        entry[field] = str(value) if field == "album_image" else value
+    return entry
+
+
+def track_info(track_id: str, entry: Optional[Dict[str, Any]]) -> Dict[str, Any]:
+    """A catalog entry with track_id and defaults filled in for missing fields."""
+    return {"track_id": track_id, **TRACK_DEFAULTS, **(entry or {})}
+
+
+async def find_tracks(track_ids: Iterable[str]) -> Dict[str, Dict[str, Any]]:
+    """Catalog entries for the given track ids (unknown ids are left out)."""
+    found: Dict[str, Dict[str, Any]] = {}
+    cursor = get_async_tracks_collection().find({"_id": {"$in": list(track_ids)}}, {"updated_at": 0})
+    async for doc in cursor:
+        found[doc.pop("_id")] = doc
+    return found
+
+
+async def upsert_tracks(entries: Dict[str, Dict[str, Any]]) -> None:
+    """
+    Write catalog entries in one unordered bulk_write. Entries with
+    artist_ids come from Spotify's API and overwrite what is stored;
+    entries without them (streaming history imports) only create tracks
+    the catalog doesn't have yet.
+    """
+    now = datetime.now(timezone.utc)
+    ops = []
+    for track_id, entry in entries.items():
+        if entry.get("artist_ids"):
+            update = {"$set": {**entry, "updated_at": now}}
+        else:
+            update = {"$setOnInsert": {**entry, "updated_at": now}}
+        ops.append(UpdateOne({"_id": track_id}, update, upsert=True))
+    if ops:
+        await get_async_tracks_collection().bulk_write(ops, ordered=False)
@@ -0,0 +1,48 @@
+# app/crud/tracker.py
+
+from typing import List, Tuple
+from datetime import datetime, timezone
+from pymongo import ReplaceOne, DeleteOne
+
+from ..db.database import get_async_tracker_state_collection
+
+
+async def save_tracker_entries(
+    upserts: List[Tuple[str, str, float]],
+    removals: List[str],
+    batch_size: int = 1000
+) -> None:
+    """
+    Persist changed last-saved tracker entries. `upserts` are
+    (user_id, track_id, expires_at) tuples with unix-time expiry.
+    """
+    ops = [
+        ReplaceOne(
+            {"_id": user_id},
+            {
+                "track_id": track_id,
+                # BSON date so the TTL index can expire it
+                "expires_at": datetime.fromtimestamp(expires_at, tz=timezone.utc),
+            },
+            upsert=True
+        )
+        for user_id, track_id, expires_at in upserts
+    ]
+    ops.extend(DeleteOne({"_id": user_id}) for user_id in removals)
+    for i in range(0, len(ops), batch_size):
+        await get_async_tracker_state_collection().bulk_write(ops[i:i + batch_size], ordered=False)
+
+
+async def load_tracker_entries() -> List[Tuple[str, str, float]]:
+    """
+    Return every unexpired snapshotted entry as (user_id, track_id, expires_at).
+    """
+    now = datetime.now(timezone.utc)
+    cursor = get_async_tracker_state_collection().find({"expires_at": {"$gt": now}})
+    entries = []
+    async for doc in cursor:
+        expires_at = doc["expires_at"]
+        if expires_at.tzinfo is None:
+            expires_at = expires_at.replace(tzinfo=timezone.utc)
+        entries.append((doc["_id"], doc["track_id"], expires_at.timestamp()))
+    return entries
@@ -0,0 +1,37 @@
+# app/crud/worker.py
+
+from typing import List
+from datetime import datetime, timezone, timedelta
+
+from ..db.database import get_async_workers_collection
+
+
+async def heartbeat(worker_id: str, host: str, pid: int) -> None:
+    """
+    Renew this worker's lease.
+    """
+    now = datetime.now(timezone.utc)
+    await get_async_workers_collection().update_one(
+        {"_id": worker_id},
+        {
+            "$set": {"heartbeat_at": now},
+            "$setOnInsert": {"host": host, "pid": pid, "started_at": now},
+        },
+        upsert=True
+    )
+
+
+async def get_live_workers(lease_seconds: float) -> List[str]:
+    """
+    Return the ids of all workers whose lease is still valid, sorted.
+    """
+    cutoff = datetime.now(timezone.utc) - timedelta(seconds=lease_seconds)
+    cursor = get_async_workers_collection().find({"heartbeat_at": {"$gte": cutoff}}, {"_id": 1})
+    return sorted([doc["_id"] async for doc in cursor])
+
+
+async def delete_worker(worker_id: str) -> None:
+    """
+    Give up this worker's lease so others take over its users immediately.
+    """
+    await get_async_workers_collection().delete_one({"_id": worker_id})
@@ -0,0 +1,86 @@
+# app/crud/year_review.py
+
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Tuple
+from datetime import datetime, timezone
+from pymongo.database import Database
+
+from ..db.database import (
+    get_async_history_collection, get_async_users_collection, get_async_year_reviews_collection,
+)
+
+
+def year_bounds(year: int) -> Tuple[datetime, datetime]:
+    """[start, end) of a calendar year in UTC."""
+    return datetime(year, 1, 1, tzinfo=timezone.utc), datetime(year + 1, 1, 1, tzinfo=timezone.utc)
+
+
+async def review_user_ids() -> List[str]:
+    """Every user who has logged in (and so may have history)."""
+    return sorted(await get_async_users_collection().distinct("user_id"))
+
+
+async def count_year_plays(user_id: str, year: int) -> int:
+    """Plays stored for one user in `year`, counted on history_user_time."""
+    start, end = year_bounds(year)
+    return await get_async_history_collection().count_documents(
+        {"user_id": user_id, "played_at": {"$gte": start, "$lt": end}},
+        hint="history_user_time",
+    )
+
+
+async def get_review_counts(year: int) -> Dict[str, int]:
+    """user_id -> how many plays that user's stored `year` report was computed from."""
+    cursor = get_async_year_reviews_collection().find({"year": year}, {"_id": 0, "user_id": 1, "plays_counted": 1})
+    return {doc["user_id"]: doc.get("plays_counted", 0) async for doc in cursor}
+
+
+async def save_year_review(user_id: str, year: int, report: Dict[str, Any], plays_counted: int) -> None:
+    """Replace the user's `year` report; `plays_counted` lets a re-run skip unchanged years."""
+    await get_async_year_reviews_collection().replace_one(
+        {"year": year, "user_id": user_id},
+        {
+            **report,
+            "user_id": user_id,
+            "year": year,
+            "plays_counted": plays_counted,
+            "computed_at": datetime.now(timezone.utc),
+        },
+        upsert=True,
+    )
+
+
+async def get_year_review(user_id: str, year: int) -> Optional[Dict[str, Any]]:
+    """The stored report, shaped like YearReviewOut, or None if it hasn't been computed."""
+    return await get_async_year_reviews_collection().find_one(
+        {"year": year, "user_id": user_id},
+        {"_id": 0, "user_id": 0, "plays_counted": 0},
+    )
+
+
+# Synchronous reads for the year-in-review worker processes, each of which
+# opens its own MongoClient (see services/year_review.py)
+
+def read_year_plays(db: Database, user_id: str, year: int) -> Iterator[Dict[str, Any]]:
+    """Stream one user's plays in `year` along history_user_time, as played_at + track_id."""
+    start, end = year_bounds(year)
+    return db["history"].find(
+        {"user_id": user_id, "played_at": {"$gte": start, "$lt": end}},
+        {"_id": 0, "played_at": 1, "track_id": 1},
+        batch_size=5000,
+    ).hint("history_user_time")
+
+
+def read_tracks(db: Database, track_ids: Iterable[str], batch_size: int = 1000) -> Dict[str, Dict[str, Any]]:
+    """Catalog entries for these track ids (unknown ids are left out)."""
+    track_ids = list(track_ids)
+    found: Dict[str, Dict[str, Any]] = {}
+    for i in range(0, len(track_ids), batch_size):
+        for doc in db["tracks"].find({"_id": {"$in": track_ids[i:i + batch_size]}}, {"updated_at": 0}):
+            found[doc.pop("_id")] = doc
+    return found
+
+
+def read_known_keys(db: Database, user_id: str, kind: str, year: int) -> List[Any]:
+    """Like rollup.known_keys(): the `kind` keys the user played on any day before `year`."""
+    start, _ = year_bounds(year)
+    return db["history_rollups"].distinct("key", {"user_id": user_id, "kind": kind, "day": {"$lt": start}})
@@ -1,33 +1,50 @@
 # app/db/database.py
 
 import logging
-from pymongo import MongoClient, ASCENDING
-from pymongo.errors import ConnectionFailure, ServerSelectionTimeoutError
+from pymongo import AsyncMongoClient, MongoClient, ASCENDING, DESCENDING
+from pymongo.errors import ConnectionFailure, OperationFailure, ServerSelectionTimeoutError
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 
 # MongoDB client with connection pooling settings
 client: MongoClient | None = None
+# Pooled async client used by the CRUD layer inside the event loop
+async_client: AsyncMongoClient | None = None
+async_db = None
 db_client = None
 songs_collection = None
 users_collection = None
 history_collection = None
+tokens_collection = None
+sync_state_collection = None
+workers_collection = None
+tracker_state_collection = None
+history_imports_collection = None
+history_rollups_collection = None
+tracks_collection = None
+listening_sessions_collection = None
+year_reviews_collection = None
+# Whether `history` is a time-series collection (decided by init_db)
+history_timeseries = False
+
+
+def _client_options() -> dict:
+    return dict(
+        maxPoolSize=50,
+        minPoolSize=5,
+        maxIdleTimeMS=30000,
+        serverSelectionTimeoutMS=5000,
+        connectTimeoutMS=10000,
+        retryWrites=True,
+    )
 
 
 def get_client() -> MongoClient:
     """Get or create the MongoDB client with proper connection pooling."""
     global client
     if client is None:
-        client = MongoClient(
-            settings.MONGO_URI,
-            maxPoolSize=50,
-            minPoolSize=5,
-            maxIdleTimeMS=30000,
-            serverSelectionTimeoutMS=5000,
-            connectTimeoutMS=10000,
-            retryWrites=True,
-        )
+        client = MongoClient(settings.MONGO_URI, **_client_options())
     return client
 
 
@@ -36,14 +53,33 @@ def init_db() -> None:
     Initialize database connection and create indexes.
     Call this during application startup.
     """
-    global db_client, songs_collection, users_collection, history_collection
+    global db_client, songs_collection, users_collection, history_collection, tokens_collection, sync_state_collection, workers_collection, tracker_state_collection, history_imports_collection, history_rollups_collection, tracks_collection, listening_sessions_collection, year_reviews_collection, history_timeseries
     
     mongo_client = get_client()
     db_client = mongo_client[settings.MONGO_DB_NAME]
     
     songs_collection = db_client["songs"]
     users_collection = db_client["users"]
+    if settings.HISTORY_STORAGE == "timeseries":
+        create_timeseries_history(db_client, "history")
     history_collection = db_client["history"]
+    # Go by what the collection actually is, so a half-done switch still works
+    history_timeseries = is_timeseries(db_client, "history")
+    if history_timeseries != (settings.HISTORY_STORAGE == "timeseries"):
+        logger.warning(
+            f"HISTORY_STORAGE={settings.HISTORY_STORAGE} but history is "
+            f"{'a time-series' if history_timeseries else 'an ordinary'} collection; "
+            "run scripts/migrate_history_timeseries.py"
+        )
+    tokens_collection = db_client["tokens"]
+    sync_state_collection = db_client["sync_state"]
+    workers_collection = db_client["workers"]
+    tracker_state_collection = db_client["tracker_state"]
+    history_imports_collection = db_client["history_imports"]
+    history_rollups_collection = db_client["history_rollups"]
+    tracks_collection = db_client["tracks"]
+    listening_sessions_collection = db_client["listening_sessions"]
+    year_reviews_collection = db_client["year_reviews"]
     
     # Create indexes for performance and data integrity
     _ensure_indexes()
@@ -51,21 +87,127 @@ def init_db() -> None:
     logger.info(f"Database initialized: {settings.MONGO_DB_NAME}")
 
 
-def _ensure_indexes() -> None:
-    """Create necessary indexes for optimal query performance."""
+async def init_async_db() -> None:
+    """
+    Create the pooled AsyncMongoClient the CRUD layer runs on. It belongs
+    to the running event loop, so call this from inside it (the app's
+    lifespan, or a script's asyncio.run), after init_db().
+    """
+    global async_client, async_db
+    if async_client is None:
+        async_client = AsyncMongoClient(settings.MONGO_URI, **_client_options())
+        await async_client.aconnect()
+    async_db = async_client[settings.MONGO_DB_NAME]
+
+
+async def close_async_db() -> None:
+    """Close the async client. Call this during application shutdown."""
+    global async_client, async_db
+    if async_client is not None:
+        await async_client.close()
+        async_client = None
+        async_db = None
+
+
+async def verify_async_connection() -> bool:
+    """verify_connection() for the async client, safe to call from the event loop."""
+    if async_client is None:
+        return False
+    try:
+        await async_client.admin.command('ping')
+        return True
+    except (ConnectionFailure, ServerSelectionTimeoutError) as e:
+        logger.error(f"MongoDB connection failed: {e}")
+        return False
+
+
+# Keyset-paginated reads: _id breaks played_at ties so pages are served
+# straight off the index. Databases created before _id was added are
+# migrated by scripts/migrate_keyset_indexes.py.
+HISTORY_USER_TIME_KEYS = [("user_id", ASCENDING), ("played_at", ASCENDING), ("_id", ASCENDING)]
+SONGS_USERNAME_TIME_KEYS = [("username", ASCENDING), ("played_at", ASCENDING), ("_id", ASCENDING)]
+
+# IndexOptionsConflict / IndexKeySpecsConflict: the name is taken by an older definition
+_INDEX_CONFLICT_CODES = (85, 86)
+
+
+def _create_index_or_warn(collection, keys, name: str, **kwargs) -> None:
+    """
+    create_index, but only warn if an index of that name exists with
+    other keys. Rebuilding it is left to a migration script, so workers
+    starting together never drop an index someone is reading from.
+    """
     try:
-        # History collection indexes
+        collection.create_index(keys, name=name, **kwargs)
+    except OperationFailure as e:
+        if e.code not in _INDEX_CONFLICT_CODES:
+            raise
+        logger.warning(
+            f"Index {collection.name}.{name} has an older definition; "
+            "run scripts/migrate_keyset_indexes.py"
+        )
+
+
+def is_timeseries(database, name: str) -> bool:
+    """Whether collection `name` exists and is a time-series collection."""
+    for info in database.list_collections(filter={"name": name}):
+        return info.get("type") == "timeseries"
+    return False
+
+
+def create_timeseries_history(database, name: str) -> None:
+    """
+    Create `name` as a time-series collection for plays (user_id is the
+    metaField, played_at the timeField) unless it already exists.
+    Requires MongoDB 6.0+.
+    """
+    if name in database.list_collection_names(filter={"name": name}):
+        return
+    database.create_collection(
+        name,
+        timeseries={"timeField": "played_at", "metaField": "user_id", "granularity": "minutes"},
+    )
+    logger.info(f"Created time-series collection {name}")
+
+
+def ensure_history_indexes(collection, timeseries: bool = False) -> None:
+    """
+    Create the indexes of a history collection in either storage layout.
+
+    Time-series collections can't have unique indexes, so there
+    (user_id, track_id, played_at) is a plain index that the write path
+    checks before inserting (see crud.history).
+    """
+    if timeseries:
+        collection.create_index(
+            [("user_id", ASCENDING), ("track_id", ASCENDING), ("played_at", ASCENDING)],
+            name="history_play"
+        )
+    else:
         # Unique compound index to prevent duplicate history entries
-        history_collection.create_index(
+        collection.create_index(
             [("user_id", ASCENDING), ("track_id", ASCENDING), ("played_at", ASCENDING)],
             unique=True,
             name="history_unique_play"
         )
-        # Index for efficient user history queries
-        history_collection.create_index(
-            [("user_id", ASCENDING), ("played_at", ASCENDING)],
-            name="history_user_time"
+    # Index for efficient user history queries
+    _create_index_or_warn(collection, HISTORY_USER_TIME_KEYS, name="history_user_time")
+    # Multikey index for per-artist plays; each credited artist is an entry
+    try:
+        collection.create_index(
+            [("user_id", ASCENDING), ("artist_ids", ASCENDING), ("played_at", ASCENDING), ("_id", ASCENDING)],
+            name="history_user_artist_time"
         )
+    except OperationFailure as e:
+        # Older servers refuse multikey indexes on time-series measurements;
+        # per-artist pages then scan the user's buckets instead
+        logger.warning(f"Skipping history_user_artist_time on {collection.name}: {e}")
+
+
+def _ensure_indexes() -> None:
+    """Create necessary indexes for optimal query performance."""
+    try:
+        ensure_history_indexes(history_collection, timeseries=history_timeseries)
         
         # Users collection indexes
         users_collection.create_index(
@@ -74,15 +216,74 @@ def _ensure_indexes() -> None:
             name="users_user_id"
         )
         
+        # Tokens collection indexes
+        # One stored OAuth token per user for background playback polling
+        tokens_collection.create_index(
+            [("user_id", ASCENDING)],
+            unique=True,
+            name="tokens_user_id"
+        )
+        
+        # Sync state indexes
+        # One incremental-sync cursor document per user
+        sync_state_collection.create_index(
+            [("user_id", ASCENDING)],
+            unique=True,
+            name="sync_state_user_id"
+        )
+        
+        # Workers collection indexes
+        # Dead workers' leases are garbage-collected by MongoDB; liveness
+        # itself is decided by comparing heartbeat_at to the lease length
+        workers_collection.create_index(
+            [("heartbeat_at", ASCENDING)],
+            expireAfterSeconds=3600,
+            name="workers_heartbeat_ttl"
+        )
+        
+        # Tracker state indexes
+        # Snapshotted last-saved entries disappear once they expire
+        tracker_state_collection.create_index(
+            [("expires_at", ASCENDING)],
+            expireAfterSeconds=0,
+            name="tracker_state_expiry"
+        )
+        
+        # History rollup indexes
+        # One counter per (user, kind, key, day); day is null for all-time totals
+        history_rollups_collection.create_index(
+            [("user_id", ASCENDING), ("kind", ASCENDING), ("key", ASCENDING), ("day", ASCENDING)],
+            unique=True,
+            name="history_rollups_unique"
+        )
+        # Top-N reads: all-time totals come back already sorted by count
+        history_rollups_collection.create_index(
+            [("user_id", ASCENDING), ("kind", ASCENDING), ("day", ASCENDING), ("count", DESCENDING)],
+            name="history_rollups_top"
+        )
+
+        # Listening session indexes
+        # Pages newest first; the incremental update looks sessions up by start too
+        listening_sessions_collection.create_index(
+            [("user_id", ASCENDING), ("start", DESCENDING), ("_id", DESCENDING)],
+            name="sessions_user_start"
+        )
+
+        # Year-in-review indexes
+        # One report per (user, year); the batch job reads a whole year's reports
+        year_reviews_collection.create_index(
+            [("year", ASCENDING), ("user_id", ASCENDING)],
+            unique=True,
+            name="year_reviews_year_user"
+        )
+        
+
         # Songs collection indexes
         songs_collection.create_index(
             [("user_id", ASCENDING), ("played_at", ASCENDING)],
             name="songs_user_time"
         )
-        songs_collection.create_index(
-            [("username", ASCENDING), ("played_at", ASCENDING)],
-            name="songs_username_time"
-        )
+        _create_index_or_warn(songs_collection, SONGS_USERNAME_TIME_KEYS, name="songs_username_time")
         
         logger.info("Database indexes created/verified")
     except Exception as e:
@@ -108,7 +309,7 @@ def close_db() -> None:
     Close database connection gracefully.
     Call this during application shutdown.
     """
-    global client, db_client, songs_collection, users_collection, history_collection
+    global client, db_client, songs_collection, users_collection, history_collection, tokens_collection, sync_state_collection, workers_collection, tracker_state_collection, history_imports_collection, history_rollups_collection, tracks_collection, listening_sessions_collection, year_reviews_collection, history_timeseries
     
     if client is not None:
         client.close()
@@ -117,6 +318,16 @@ def close_db() -> None:
         songs_collection = None
         users_collection = None
         history_collection = None
+        tokens_collection = None
+        sync_state_collection = None
+        workers_collection = None
+        tracker_state_collection = None
+        history_imports_collection = None
+        history_rollups_collection = None
+        tracks_collection = None
+        listening_sessions_collection = None
+        year_reviews_collection = None
+        history_timeseries = False
         logger.info("Database connection closed")
 
 
@@ -138,4 +349,139 @@ def get_history_collection():
     """Get the history collection. Must call init_db() first."""
     if history_collection is None:
         raise RuntimeError("Database not initialized. Call init_db() first.")
-    return history_collection
\ No newline at end of file
+    return history_collection
+
+
+def get_tokens_collection():
+    """Get the tokens collection. Must call init_db() first."""
+    if tokens_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return tokens_collection
+
+
+def get_sync_state_collection():
+    """Get the sync_state collection. Must call init_db() first."""
+    if sync_state_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return sync_state_collection
+
+
+def get_workers_collection():
+    """Get the workers collection. Must call init_db() first."""
+    if workers_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return workers_collection
+
+
+def get_tracker_state_collection():
+    """Get the tracker_state collection. Must call init_db() first."""
+    if tracker_state_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return tracker_state_collection
+
+
+def get_history_rollups_collection():
+    """Get the history_rollups collection. Must call init_db() first."""
+    if history_rollups_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return history_rollups_collection
+
+
+def get_history_imports_collection():
+    """Get the history_imports collection. Must call init_db() first."""
+    if history_imports_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return history_imports_collection
+
+
+def get_tracks_collection():
+    """Get the tracks collection. Must call init_db() first."""
+    if tracks_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return tracks_collection
+
+
+def get_listening_sessions_collection():
+    """Get the listening_sessions collection. Must call init_db() first."""
+    if listening_sessions_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return listening_sessions_collection
+
+
+def get_year_reviews_collection():
+    """Get the year_reviews collection. Must call init_db() first."""
+    if year_reviews_collection is None:
+        raise RuntimeError("Database not initialized. Call init_db() first.")
+    return year_reviews_collection
+
+
+def history_is_timeseries() -> bool:
+    """Whether the history collection is a time-series collection. Must call init_db() first."""
+    get_history_collection()
+    return history_timeseries
+
+
+def _async_collection(name: str):
+    if async_db is None:
+        raise RuntimeError("Async database not initialized. Call init_async_db() first.")
+    return async_db[name]
+
+
+def get_async_songs_collection():
+    """Get the songs collection on the async client. Must call init_async_db() first."""
+    return _async_collection("songs")
+
+
+def get_async_users_collection():
+    """Get the users collection on the async client. Must call init_async_db() first."""
+    return _async_collection("users")
+
+
+def get_async_history_collection():
+    """Get the history collection on the async client. Must call init_async_db() first."""
+    return _async_collection("history")
+
+
+def get_async_tokens_collection():
+    """Get the tokens collection on the async client. Must call init_async_db() first."""
+    return _async_collection("tokens")
+
+
+def get_async_sync_state_collection():
+    """Get the sync_state collection on the async client. Must call init_async_db() first."""
+    return _async_collection("sync_state")
+
+
+def get_async_workers_collection():
+    """Get the workers collection on the async client. Must call init_async_db() first."""
+    return _async_collection("workers")
+
+
+def get_async_tracker_state_collection():
+    """Get the tracker_state collection on the async client. Must call init_async_db() first."""
+    return _async_collection("tracker_state")
+
+
+def get_async_history_rollups_collection():
+    """Get the history_rollups collection on the async client. Must call init_async_db() first."""
+    return _async_collection("history_rollups")
+
+
+def get_async_history_imports_collection():
+    """Get the history_imports collection on the async client. Must call init_async_db() first."""
+    return _async_collection("history_imports")
+
+
+def get_async_tracks_collection():
+    """Get the tracks collection on the async client. Must call init_async_db() first."""
+    return _async_collection("tracks")
+
+
+def get_async_listening_sessions_collection():
+    """Get the listening_sessions collection on the async client. Must call init_async_db() first."""
+    return _async_collection("listening_sessions")
+
+
+def get_async_year_reviews_collection():
+    """Get the year_reviews collection on the async client. Must call init_async_db() first."""
+    return _async_collection("year_reviews")
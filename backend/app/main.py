@@ -12,8 +12,17 @@ from slowapi.util import get_remote_address
 from slowapi.errors import RateLimitExceeded
 
 from .config import settings
-from .db.database import init_db, close_db, verify_connection
-from .services.spotify_services import fetch_currently_playing
+from .db.database import init_db, close_db, verify_connection, init_async_db, close_async_db, verify_async_connection
+from .services.poller import PlaybackPoller
+from .services.spotify_client import shutdown_executors
+from .services.history_ingest import history_ingest
+from .services.reconciler import reconciler
+from .services.token_store import token_store
+from .services.coordination import coordinator
+from .services.rate_limit import governor
+from .services.history_cache import history_cache
+from .services.track_catalog import track_catalog
+from .services.year_review import year_review_job
 from .crud.artist import close_http_client
 from .routers import artist, auth, track, history
 
@@ -41,27 +50,55 @@ async def lifespan(app: FastAPI):
     if not verify_connection():
         logger.error("Failed to connect to MongoDB!")
         raise RuntimeError("Database connection failed")
+    # Everything that runs inside the event loop talks to MongoDB through this
+    await init_async_db()
     
-    # Start background task for tracking currently playing
-    background_task = asyncio.create_task(fetch_currently_playing())
-    logger.info("Background task started")
+    # Buffered history writer used by the poller
+    history_ingest.start()
+
+    # Register this worker so background work is sharded across all workers
+    await coordinator.beat()
+    coordinator_task = asyncio.create_task(coordinator.run())
+
+    # Start background task for tracking currently playing for every stored user
+    poller = PlaybackPoller(
+        max_concurrency=settings.POLLER_MAX_CONCURRENCY,
+        interval=settings.POLL_INTERVAL_SECONDS,
+        mode=settings.POLL_SCHEDULE_MODE,
+    )
+    coordinator.add_listener(poller.request_resync)
+    background_task = asyncio.create_task(poller.run())
+    # Incremental recently-played sync that back-fills plays the poller missed
+    reconcile_task = asyncio.create_task(reconciler.run())
+    # Refresh owned users' tokens shortly before they expire
+    refresh_task = asyncio.create_task(token_store.run_refresher(coordinator.owns))
+    # Year-in-review reports, refreshed by whichever worker is the leader
+    year_review_task = asyncio.create_task(year_review_job.run_scheduler(coordinator.is_leader))
+    logger.info("Background tasks started")
     
     yield
     
     # Shutdown
     logger.info("Shutting down Spotifetch API...")
     
-    # Cancel background task
-    background_task.cancel()
-    try:
-        await background_task
-    except asyncio.CancelledError:
-        logger.info("Background task cancelled")
+    # Cancel background tasks
+    for task in (background_task, reconcile_task, refresh_task, year_review_task, coordinator_task):
+        task.cancel()
+        try:
+            await task
+        except asyncio.CancelledError:
+            pass
+    logger.info("Background tasks cancelled")
+
+    # Write out any plays still buffered before the database goes away
+    await history_ingest.close()
     
     # Close HTTP client used for external API calls
     await close_http_client()
+    shutdown_executors()
     
-    # Close database connection
+    # Close database connections
+    await close_async_db()
     close_db()
     logger.info("Shutdown complete")
 
@@ -86,6 +123,8 @@ def create_app() -> FastAPI:
         allow_credentials=True,
         allow_methods=["*"],
         allow_headers=["*"],
+        # Let the frontend read the history pagination cursor
+        expose_headers=["X-Next-Cursor"],
     )
 
     # Session middleware
@@ -104,10 +143,14 @@ def create_app() -> FastAPI:
     @app.get("/health")
     async def health_check():
         """Health check endpoint for monitoring."""
-        db_healthy = verify_connection()
+        db_healthy = await verify_async_connection()
         return {
             "status": "healthy" if db_healthy else "unhealthy",
-            "database": "connected" if db_healthy else "disconnected"
+            "database": "connected" if db_healthy else "disconnected",
+            "history_ingest": history_ingest.stats(),
+            "spotify_rate_limit": governor.stats(),
+            "history_cache": history_cache.stats(),
+            "track_catalog": track_catalog.stats(),
         }
 
     return app
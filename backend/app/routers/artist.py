@@ -6,7 +6,8 @@ from fastapi.responses import JSONResponse
 from typing import Annotated
 import spotipy
 
-from ..services.spotify_services import sp_oauth
+from ..services.spotify_client import AsyncSpotify
+from .auth import get_token
 from ..crud.artist import (
     fetch_top_artists,
     fetch_artist_info,
@@ -42,11 +43,11 @@ def validate_artist_name(name: str) -> str:
     return sanitized
 
 
-def require_spotify_client(request: Request) -> spotipy.Spotify:
-    token = request.session.get("token_info")
-    if not token or sp_oauth.is_token_expired(token):
+async def require_spotify_client(request: Request) -> AsyncSpotify:
+    token = await get_token(request)
+    if not token:
         raise HTTPException(401, "Token not found or expired")
-    return spotipy.Spotify(auth=token["access_token"])
+    return AsyncSpotify.from_token_info(token)
 
 
 @router.get("/top_artists")
@@ -55,8 +56,8 @@ async def top_artists(
     time_range: Annotated[str, Query(pattern=r'^(short_term|medium_term|long_term)$')] = "medium_term",
     limit: Annotated[int, Query(ge=1, le=50)] = 10
 ):
-    client = require_spotify_client(request)
-    data = fetch_top_artists(client, time_range=time_range, limit=limit)
+    client = await require_spotify_client(request)
+    data = await fetch_top_artists(client, time_range=time_range, limit=limit)
     return JSONResponse({"top_artists": data})
 
 
@@ -65,9 +66,9 @@ async def artist_info(
     request: Request, 
     artist_id: Annotated[str, Path(pattern=SPOTIFY_ID_PATTERN, description="Spotify artist ID")]
 ):
-    client = require_spotify_client(request)
+    client = await require_spotify_client(request)
     try:
-        data = fetch_artist_info(client, artist_id)
+        data = await fetch_artist_info(client, artist_id)
         return JSONResponse(data)
     except spotipy.SpotifyException as e:
         raise HTTPException(400, f"Spotify error: {e}")
@@ -8,16 +8,20 @@ from spotipy.oauth2 import SpotifyOauthError
 from datetime import datetime, timezone
 
 from ..services.spotify_services import sp_oauth
-from ..db.database import get_users_collection
+from ..services.spotify_client import AsyncSpotify, get_access_token, refresh_access_token
+from ..services.identity import identity_cache, resolve_user_id
+from ..services.token_store import token_store
+from ..db.database import get_async_users_collection
 from ..config import settings
 
 logger = logging.getLogger(__name__)
 router = APIRouter()
 
 
-def get_token(request: Request):
+async def get_token(request: Request):
     """
     Retrieve and refresh (if needed) the Spotify OAuth token from the session.
+    Concurrent refreshes of the same token share one Spotify request.
     Returns None if no token or refresh fails.
     """
     token_info = request.session.get("token_info")
@@ -26,8 +30,23 @@ def get_token(request: Request):
 
     if sp_oauth.is_token_expired(token_info):
         try:
-            token_info = sp_oauth.refresh_access_token(token_info["refresh_token"])
+            # The expired access token's identity entry is gone by now; the
+            # refresh token outlives it
+            user_id = identity_cache.get_by_refresh_token(token_info["refresh_token"])
+            token_info = await refresh_access_token(token_info["refresh_token"])
             request.session["token_info"] = token_info
+            if user_id is None:
+                # Not seen by this worker (e.g. after a restart): one lookup per refresh
+                try:
+                    user_id = await resolve_user_id(AsyncSpotify.from_token_info(token_info))
+                except spotipy.SpotifyException as e:
+                    # The refresh itself worked; the next refresh tries again
+                    logger.warning(f"Could not resolve user for refreshed token: {e}")
+            if user_id:
+                # Same user, new access token: carry the resolved identity over
+                identity_cache.remember(token_info, user_id)
+                # and keep the background poller's copy current too
+                await token_store.save(user_id, token_info)
         except SpotifyOauthError as e:
             logger.warning(f"Failed to refresh token: {e}")
             request.session.pop("token_info", None)
@@ -53,7 +72,7 @@ async def callback(request: Request):
         raise HTTPException(status_code=400, detail="Authorization code not found")
 
     try:
-        token_info = sp_oauth.get_access_token(code, check_cache=False)
+        token_info = await get_access_token(code)
     except SpotifyOauthError as e:
         logger.error(f"OAuth error getting access token: {e}")
         raise HTTPException(status_code=400, detail="Failed to obtain access token")
@@ -64,8 +83,8 @@ async def callback(request: Request):
     request.session["token_info"] = token_info
 
     try:
-        sp = spotipy.Spotify(auth=token_info["access_token"])
-        user_info = sp.current_user()
+        sp = AsyncSpotify.from_token_info(token_info)
+        user_info = await sp.current_user()
     except spotipy.SpotifyException as e:
         logger.error(f"Spotify API error fetching user info: {e}")
         raise HTTPException(status_code=400, detail="Failed to fetch user info from Spotify")
@@ -75,6 +94,9 @@ async def callback(request: Request):
     if not user_id:
         raise HTTPException(status_code=400, detail="Invalid user data received from Spotify")
 
+    # Later requests with this token can skip the current_user() round trip
+    identity_cache.remember(token_info, user_id)
+
     # Safely extract profile image
     images = user_info.get("images") or []
     profile_image = images[0].get("url") if images and len(images) > 0 else None
@@ -90,30 +112,31 @@ async def callback(request: Request):
     }
 
     # Upsert user to avoid race conditions
-    get_users_collection().update_one(
+    await get_async_users_collection().update_one(
         {"user_id": user_id},
         {"$setOnInsert": user_data},
         upsert=True
     )
 
+    # Keep the token so the background poller tracks this user too
+    await token_store.save(user_id, token_info)
+
     return RedirectResponse(url="/auth/welcome")
 
 
 @router.get("/welcome")
 async def welcome(request: Request):
-    token_info = get_token(request)
+    token_info = await get_token(request)
     if not token_info:
         # Redirect to frontend with auth_required flag
         return RedirectResponse(url=f"{settings.CORS_ORIGINS.split(',')[0]}/?auth_required=true")
 
     try:
-        sp = spotipy.Spotify(auth=token_info["access_token"])
-        user_info = sp.current_user()
+        sp = AsyncSpotify.from_token_info(token_info)
+        await resolve_user_id(sp)
     except spotipy.SpotifyException as e:
         logger.error(f"Spotify API error in welcome: {e}")
         return RedirectResponse(url=f"{settings.CORS_ORIGINS.split(',')[0]}/?error=spotify_api_error")
-
-    user_id = user_info.get("id", "")
     
     # Only pass non-sensitive user_id - frontend will fetch full profile via /auth/user_info
     frontend_url = settings.CORS_ORIGINS.split(",")[0].strip()
@@ -129,13 +152,13 @@ async def logout(request: Request):
 
 @router.get("/user_info")
 async def user_info(request: Request):
-    token_info = get_token(request)
+    token_info = await get_token(request)
     if not token_info:
         raise HTTPException(status_code=401, detail="Not authenticated")
 
     try:
-        sp = spotipy.Spotify(auth=token_info["access_token"])
-        profile = sp.current_user()
+        sp = AsyncSpotify.from_token_info(token_info)
+        profile = await sp.current_user()
     except spotipy.SpotifyException as e:
         logger.error(f"Spotify API error fetching user info: {e}")
         raise HTTPException(status_code=503, detail="Failed to fetch user info from Spotify")
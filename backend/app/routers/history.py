@@ -1,31 +1,49 @@
 # app/routers/history.py
 
-from fastapi import APIRouter, Request, HTTPException, Query
-from typing import List, Optional
+from fastapi import APIRouter, Request, HTTPException, Path, Query
+from typing import List, Literal, Optional
 from datetime import datetime, timezone
-import spotipy
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
 
 from fastapi.encoders import jsonable_encoder
+from fastapi.responses import ORJSONResponse, StreamingResponse
 
-from ..services.spotify_services import sp_oauth
-from ..schemas.history import HistoryCreate, HistoryOut, TopTrackOut, TopArtistOut, TopAlbumOut
-from ..crud.history import save_history, get_user_history,get_top_tracks,get_top_artists, get_top_albums
+from ..services.spotify_client import AsyncSpotify
+from .auth import get_token
+from ..services.identity import resolve_user_id
+from ..services.analytics import listening_fingerprint, music_ratio
+from ..services.export import EXPORT_FIELDS, iter_ndjson, iter_csv
+from ..services.history_import import history_importer
+from ..crud.history_import import get_import_job
+from ..crud.heatmap import get_heatmap, get_play_series
+from ..crud.track import artist_refs
+from ..crud.session import get_sessions, get_session_stats
+from ..crud.year_review import get_year_review
+from ..schemas.history import (
+    HistoryCreate, HistoryOut, HistorySummaryOut, TopTrackOut, TopArtistOut, TopAlbumOut,
+    FingerprintOut, MusicRatioOut, HeatmapOut, PlaySeriesOut, SessionOut, SessionStatsOut, YearReviewOut,
+)
+from ..crud.history import save_history, get_user_history,get_top_tracks,get_top_artists, get_top_albums, get_history_summary, iter_user_history
 
 router = APIRouter(
     prefix="/user/{user_id}/history",
     tags=["history"],
 )
 
-def require_spotify_client(request: Request) -> spotipy.Spotify:
-    token = request.session.get("token_info")
-    if not token or sp_oauth.is_token_expired(token):
+# `since` of the cached aggregations is floored to the cache's one-minute
+# bucket, so reloads within a minute share one cached result
+CACHED_SINCE = "Only count from this time on, rounded down to the whole minute"
+
+
+async def require_spotify_client(request: Request) -> AsyncSpotify:
+    token = await get_token(request)
+    if not token:
         raise HTTPException(status_code=401, detail="Not authenticated")
-    return spotipy.Spotify(auth=token["access_token"])
+    return AsyncSpotify.from_token_info(token)
 
-def verify_user_authorization(sp: spotipy.Spotify, user_id: str) -> None:
+async def verify_user_authorization(sp: AsyncSpotify, user_id: str) -> None:
     """Verify that the authenticated user matches the requested user_id."""
-    current_user = sp.current_user()
-    if current_user["id"] != user_id:
+    if await resolve_user_id(sp) != user_id:
         raise HTTPException(status_code=403, detail="Access denied: You can only access your own data")
 
 @router.post(
@@ -34,10 +52,10 @@ def verify_user_authorization(sp: spotipy.Spotify, user_id: str) -> None:
     summary="Record the currently playing track to history"
 )
 async def record_history(request: Request, user_id: str):
-    sp = require_spotify_client(request)
-    verify_user_authorization(sp, user_id)
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
     
-    playback = sp.current_playback()
+    playback = await sp.current_playback()
     if not playback or not playback.get("is_playing"):
         raise HTTPException(status_code=404, detail="No track currently playing")
 
@@ -50,6 +68,7 @@ async def record_history(request: Request, user_id: str):
         raise HTTPException(status_code=404, detail="Track has no ID (likely a local file)")
     
     artists = item.get("artists", [])
+    artist_ids, artist_names = artist_refs(artists)
     album = item.get("album", {})
     album_images = album.get("images", [])
     
@@ -60,10 +79,13 @@ async def record_history(request: Request, user_id: str):
         artist_name=", ".join(a.get("name", "Unknown") for a in artists),
         album_name=album.get("name", "Unknown Album"),
         album_image=(album_images[0].get("url") if album_images else None),
-        played_at=datetime.now(timezone.utc)
+        played_at=datetime.now(timezone.utc),
+        artist_ids=artist_ids,
+        artist_names=artist_names,
+        duration_ms=item.get("duration_ms")
     )
 
-    saved = save_history(entry)
+    saved = await save_history(entry)
     # ensure ObjectIds or datetimes are encoded properly
     return jsonable_encoder(saved)
 
@@ -77,13 +99,247 @@ async def read_history(
     user_id: str,
     skip: int = Query(0, ge=0),
     limit: int = Query(50, ge=1, le=200),
-    since: Optional[datetime] = Query(None)
+    since: Optional[datetime] = Query(None),
+    before: Optional[str] = Query(None, description="Cursor from a previous page's X-Next-Cursor header"),
+    artist_id: Optional[str] = Query(None, description="Only plays crediting this Spotify artist id")
 ):
-    sp = require_spotify_client(request)
-    verify_user_authorization(sp, user_id)
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
     
     # Return listening history from our database (no Spotify API call required)
-    return get_user_history(user_id=user_id, skip=skip, limit=limit, since=since)
+    try:
+        items, next_cursor = await get_user_history(
+            user_id=user_id, skip=skip, limit=limit, since=since, before=before, artist_id=artist_id
+        )
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    # Rows come from our own documents: encode them as they are instead of
+    # re-validating them against response_model
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(items, headers=headers)
+
+@router.get(
+    "/export",
+    summary="Download a user's full listening history as NDJSON or CSV"
+)
+async def export_history(
+    request: Request,
+    user_id: str,
+    format: Literal["ndjson", "csv"] = Query("ndjson"),
+    since: Optional[datetime] = Query(None)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    # Async generator: Starlette pulls one cursor batch at a time, so
+    # memory stays flat however long the history is
+    docs = iter_user_history(user_id, EXPORT_FIELDS, since=since)
+    if format == "csv":
+        body, media_type = iter_csv(docs), "text/csv"
+    else:
+        body, media_type = iter_ndjson(docs), "application/x-ndjson"
+    filename = f"history-{user_id}.{format}"
+    return StreamingResponse(
+        body,
+        media_type=media_type,
+        headers={"Content-Disposition": f'attachment; filename="{filename}"'},
+    )
+
+@router.post(
+    "/import",
+    summary="Import a Spotify extended streaming history file (raw JSON request body)"
+)
+async def import_history(
+    request: Request,
+    user_id: str,
+    source: str = Query(..., min_length=1, max_length=200, description="File name; identifies the import for resuming"),
+    resume: bool = Query(True, description="Skip the records a previous attempt already imported"),
+    min_ms_played: int = Query(30_000, ge=0, description="Ignore plays shorter than this")
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    # The body is parsed as it streams in, never buffered whole
+    importer = history_importer(user_id, source, min_ms_played=min_ms_played)
+    try:
+        return await importer.run(request.stream(), resume=resume)
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=f"Invalid streaming history file: {e}")
+
+@router.get(
+    "/import/{source}",
+    summary="Get the progress of a streaming history import"
+)
+async def read_import_progress(request: Request, user_id: str, source: str):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    job = await get_import_job(user_id, source)
+    if not job:
+        raise HTTPException(status_code=404, detail="No import found for this file")
+    return jsonable_encoder(job)
+
+@router.get(
+    "/summary",
+    response_model=HistorySummaryOut,
+    summary="Get a user's dashboard data (top tracks, artists, albums and recent plays) in one call"
+)
+async def read_history_summary(
+    request: Request,
+    user_id: str,
+    since: Optional[datetime] = Query(None, description=CACHED_SINCE),
+    tracks_limit: int = Query(10, ge=0, le=100),
+    artists_limit: int = Query(10, ge=0, le=100),
+    albums_limit: int = Query(10, ge=0, le=100),
+    recent_limit: int = Query(20, ge=0, le=200)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    # One $facet aggregation instead of four separate requests
+    return ORJSONResponse(await get_history_summary(
+        user_id=user_id,
+        since=since,
+        tracks_limit=tracks_limit,
+        artists_limit=artists_limit,
+        albums_limit=albums_limit,
+        recent_limit=recent_limit,
+    ))
+
+@router.get(
+    "/fingerprint",
+    response_model=FingerprintOut,
+    summary="Get a user's listening fingerprint (0-100 scores) over the last days"
+)
+async def read_fingerprint(
+    request: Request,
+    user_id: str,
+    days: int = Query(30, ge=1, le=365),
+    utc_offset_minutes: int = Query(0, ge=-840, le=840, description="Client's offset from UTC, used to split plays into local days")
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    return await listening_fingerprint(user_id, days=days, utc_offset_minutes=utc_offset_minutes)
+
+@router.get(
+    "/music-ratio",
+    response_model=MusicRatioOut,
+    summary="Get unique tracks, albums and artists for the last days versus the period before"
+)
+async def read_music_ratio(
+    request: Request,
+    user_id: str,
+    days: int = Query(30, ge=1, le=365)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    return await music_ratio(user_id, days=days)
+
+def _validate_timezone(tz: str) -> str:
+    try:
+        ZoneInfo(tz)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise HTTPException(status_code=400, detail=f"Unknown timezone: {tz}")
+    return tz
+
+@router.get(
+    "/heatmap",
+    response_model=HeatmapOut,
+    summary="Get a user's plays by day of week and hour of day, in their timezone"
+)
+async def read_heatmap(
+    request: Request,
+    user_id: str,
+    tz: str = Query("UTC", description="IANA timezone, e.g. Europe/Paris"),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    return await get_heatmap(user_id, tz=_validate_timezone(tz), since=since, until=until)
+
+@router.get(
+    "/series",
+    response_model=PlaySeriesOut,
+    summary="Get a user's play counts per day, week or month, in their timezone"
+)
+async def read_play_series(
+    request: Request,
+    user_id: str,
+    unit: Literal["day", "week", "month"] = Query("day"),
+    tz: str = Query("UTC", description="IANA timezone, e.g. Europe/Paris"),
+    since: Optional[datetime] = Query(None),
+    until: Optional[datetime] = Query(None)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    return await get_play_series(user_id, unit=unit, tz=_validate_timezone(tz), since=since, until=until)
+
+@router.get(
+    "/sessions",
+    response_model=List[SessionOut],
+    summary="Get a user's listening sessions, newest first"
+)
+async def read_sessions(
+    request: Request,
+    user_id: str,
+    limit: int = Query(50, ge=1, le=200),
+    since: Optional[datetime] = Query(None, description="Only sessions that started at or after this time"),
+    until: Optional[datetime] = Query(None, description="Only sessions that started before this time"),
+    before: Optional[str] = Query(None, description="Cursor from a previous page's X-Next-Cursor header")
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    # Sessions are kept up to date as plays are saved, so this is a plain page read
+    try:
+        items, next_cursor = await get_sessions(user_id, limit=limit, since=since, until=until, before=before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    headers = {"X-Next-Cursor": next_cursor} if next_cursor else None
+    return ORJSONResponse(items, headers=headers)
+
+@router.get(
+    "/sessions/stats",
+    response_model=SessionStatsOut,
+    summary="Get a user's average and longest listening session and sessions per day"
+)
+async def read_session_stats(
+    request: Request,
+    user_id: str,
+    since: Optional[datetime] = Query(None, description=CACHED_SINCE)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    return await get_session_stats(user_id, since=since)
+
+@router.get(
+    "/year-in-review/{year}",
+    response_model=YearReviewOut,
+    summary="Get a user's precomputed year in review (top tracks, artists, albums, minutes, busiest day, discoveries)",
+    description=(
+        "Years run on UTC, and the busiest day is a UTC calendar day. Minutes add up the full "
+        "catalog duration of each play rather than how long it was actually listened to."
+    ),
+)
+async def read_year_review(
+    request: Request,
+    user_id: str,
+    year: int = Path(..., ge=2000, le=2100)
+):
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
+
+    # Computed by the background year-in-review job, never on request
+    review = await get_year_review(user_id, year)
+    if not review:
+        raise HTTPException(status_code=404, detail=f"No year in review for {year} yet")
+    return ORJSONResponse(review)
 
 @router.get(
     "/top",
@@ -94,13 +350,13 @@ async def read_top_tracks(
     request: Request,
     user_id: str,
     limit: int = Query(10, ge=1, le=100),
-    since: Optional[datetime] = Query(None)
+    since: Optional[datetime] = Query(None, description=CACHED_SINCE)
 ):
-    sp = require_spotify_client(request)
-    verify_user_authorization(sp, user_id)
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
     
     # Return most-played tracks computed from our DB
-    return get_top_tracks(user_id=user_id, limit=limit, since=since)
+    return ORJSONResponse(await get_top_tracks(user_id=user_id, limit=limit, since=since))
 
 @router.get(
     "/top-artists",
@@ -111,26 +367,26 @@ async def read_top_artists(
     request: Request,
     user_id: str,
     limit: int = Query(10, ge=1, le=100),
-    since: Optional[datetime] = Query(None)
+    since: Optional[datetime] = Query(None, description=CACHED_SINCE)
 ):
-    sp = require_spotify_client(request)
-    verify_user_authorization(sp, user_id)
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
     
     # Return most-played artists from our DB
-    return get_top_artists(user_id=user_id, limit=limit, since=since)
+    return ORJSONResponse(await get_top_artists(user_id=user_id, limit=limit, since=since))
 
 @router.get("/top-albums", response_model=List[TopAlbumOut])
 async def read_top_albums(
     request: Request,
     user_id: str,
     limit: int = Query(10, ge=1, le=100),
-    since: Optional[datetime] = Query(None),
+    since: Optional[datetime] = Query(None, description=CACHED_SINCE),
 ):
     """
     Get a user's most-played albums from our database.
     """
-    sp = require_spotify_client(request)
-    verify_user_authorization(sp, user_id)
+    sp = await require_spotify_client(request)
+    await verify_user_authorization(sp, user_id)
     
-    return get_top_albums(user_id, limit, since)
+    return ORJSONResponse(await get_top_albums(user_id, limit, since))
 
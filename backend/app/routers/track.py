@@ -2,12 +2,14 @@
 
 from fastapi import APIRouter, Request, HTTPException, Query, Response, status
 from fastapi.responses import JSONResponse
-import spotipy
+from typing import Optional
 
-from ..services.spotify_services import sp_oauth
+from ..services.spotify_client import AsyncSpotify
+from .auth import get_token
+from ..services.identity import resolve_user_id
+from ..services.reconciler import reconciler
 from ..crud.track import (
     fetch_recently_played_spotify,
-    sync_recently_played_db,
     get_recently_played_db,
     get_songs_most_played,
     sync_currently_playing,
@@ -16,17 +18,16 @@ from ..crud.track import (
 router = APIRouter()
 
 
-def require_spotify_client(request: Request) -> spotipy.Spotify:
-    token = request.session.get("token_info")
-    if not token or sp_oauth.is_token_expired(token):
+async def require_spotify_client(request: Request) -> AsyncSpotify:
+    token = await get_token(request)
+    if not token:
         raise HTTPException(status_code=401, detail="Token not found or expired")
-    return spotipy.Spotify(auth=token["access_token"])
+    return AsyncSpotify.from_token_info(token)
 
 
-def verify_user_authorization(sp: spotipy.Spotify, username: str) -> None:
+async def verify_user_authorization(sp: AsyncSpotify, username: str) -> None:
     """Verify that the authenticated user matches the requested username."""
-    current_user = sp.current_user()
-    if current_user.get("id") != username:
+    if await resolve_user_id(sp) != username:
         raise HTTPException(status_code=403, detail="Access denied: You can only access your own data")
 
 
@@ -36,9 +37,9 @@ async def recently_played(
     username: str,
     limit: int = Query(30, ge=1, le=50),
 ):
-    client = require_spotify_client(request)
-    verify_user_authorization(client, username)
-    tracks = fetch_recently_played_spotify(client, limit=limit)
+    client = await require_spotify_client(request)
+    await verify_user_authorization(client, username)
+    tracks = await fetch_recently_played_spotify(client, limit=limit)
     return {"recent_tracks": tracks}
 
 
@@ -48,26 +49,31 @@ async def recently_played_db(
     username: str,
     skip: int = Query(0, ge=0),
     limit: int = Query(30, ge=1, le=100),
+    before: Optional[str] = Query(None),
 ):
-    client = require_spotify_client(request)
-    verify_user_authorization(client, username)
-    # on first page, sync Spotify → Mongo
-    if skip == 0:
-        sync_recently_played_db(client, username)
-    tracks = get_recently_played_db(username, skip=skip, limit=limit)
-    return {"recent_tracks": tracks}
+    client = await require_spotify_client(request)
+    await verify_user_authorization(client, username)
+    # on first page, ask the background reconciler to sync Spotify → Mongo;
+    # never wait on Spotify here
+    if skip == 0 and not before:
+        reconciler.request_sync(username)
+    try:
+        tracks, next_cursor = await get_recently_played_db(username, skip=skip, limit=limit, before=before)
+    except ValueError:
+        raise HTTPException(status_code=400, detail="Invalid cursor")
+    return {"recent_tracks": tracks, "next_cursor": next_cursor}
 
 
 @router.get("/songs_most_played")
 async def songs_most_played():
-    songs = get_songs_most_played()
+    songs = await get_songs_most_played()
     return {"songs": songs}
 
 
 @router.get("/currently_playing")
 async def currently_playing(request: Request):
-    client = require_spotify_client(request)
-    info = sync_currently_playing(client)
+    client = await require_spotify_client(request)
+    info = await sync_currently_playing(client)
 
     if not info:
         # Truly empty 204: no body, no Content-Length header
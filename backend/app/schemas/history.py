@@ -2,7 +2,7 @@
 
 from pydantic import BaseModel, HttpUrl
 from datetime import datetime
-from typing import Optional
+from typing import List, Optional
 
 class HistoryCreate(BaseModel):
     user_id: str
@@ -12,6 +12,11 @@ class HistoryCreate(BaseModel):
     album_name: str
     album_image: Optional[HttpUrl]
     played_at: datetime
+    # One entry per credited artist, in Spotify's order (artist_name joins the names)
+    artist_ids: List[str] = []
+    artist_names: List[str] = []
+    # Catalog-only (not returned with plays)
+    duration_ms: Optional[int] = None
 
 class HistoryOut(BaseModel):
     track_id: str
@@ -20,6 +25,8 @@ class HistoryOut(BaseModel):
     album_name: str
     album_image: Optional[HttpUrl]
     played_at: datetime
+    artist_ids: List[str] = []
+    artist_names: List[str] = []
 
 class TopTrackOut(BaseModel):
     track_id: str
@@ -30,6 +37,7 @@ class TopTrackOut(BaseModel):
     play_count: int
 
 class TopArtistOut(BaseModel):
+    artist_id: Optional[str] = None
     artist_name: str
     play_count: int
     artist_image: Optional[HttpUrl]
@@ -38,4 +46,79 @@ class TopAlbumOut(BaseModel):
     album_name: str
     artist_name: str
     album_image: Optional[HttpUrl]
-    play_count: int
\ No newline at end of file
+    play_count: int
+
+class HistorySummaryOut(BaseModel):
+    top_tracks: List[TopTrackOut]
+    top_artists: List[TopArtistOut]
+    top_albums: List[TopAlbumOut]
+    recent: List[HistoryOut]
+    next_cursor: Optional[str] = None
+    total_plays: int
+
+class FingerprintOut(BaseModel):
+    consistency: int
+    discovery_rate: int
+    variance: int
+    concentration: int
+    replay_rate: int
+
+class MusicRatioOut(BaseModel):
+    tracks: int
+    albums: int
+    artists: int
+    last_tracks: int
+    last_albums: int
+    last_artists: int
+
+class HeatmapOut(BaseModel):
+    timezone: str
+    days: List[str]
+    hours: List[int]
+    matrix: List[List[int]]
+    total_plays: int
+
+class PlaySeriesBucket(BaseModel):
+    start: datetime
+    plays: int
+
+class PlaySeriesOut(BaseModel):
+    timezone: str
+    unit: str
+    buckets: List[PlaySeriesBucket]
+
+class SessionOut(BaseModel):
+    start: datetime
+    end: datetime
+    plays: int
+    duration_ms: int
+
+class SessionStatsOut(BaseModel):
+    gap_minutes: float
+    sessions: int
+    total_plays: int
+    average_session_ms: int
+    longest_session: Optional[SessionOut] = None
+    sessions_per_day: float
+
+class BusiestDayOut(BaseModel):
+    # UTC calendar day, YYYY-MM-DD
+    date: str
+    plays: int
+    # Catalog durations of the tracks played that day, not time actually listened
+    minutes: int
+
+class YearReviewOut(BaseModel):
+    year: int
+    total_plays: int
+    # Sum of the played tracks' catalog durations, not time actually listened
+    total_minutes: int
+    top_tracks: List[TopTrackOut]
+    top_artists: List[TopArtistOut]
+    top_albums: List[TopAlbumOut]
+    busiest_day: Optional[BusiestDayOut] = None
+    # Tracks and artists first played this year
+    new_tracks: int
+    new_artists: int
+    top_new_tracks: List[TopTrackOut]
+    computed_at: datetime
\ No newline at end of file
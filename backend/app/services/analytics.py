@@ -0,0 +1,194 @@
+# app/services/analytics.py
+
+from datetime import datetime, timezone, timedelta
+from typing import AsyncIterable, Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from ..crud.history import iter_plays
+from ..crud.track_catalog import track_info
+from ..schemas.history import FingerprintOut, MusicRatioOut
+from .track_catalog import track_catalog
+
+MS_PER_DAY = 86_400_000
+
+
+def _js_round(values):
+    """Round half up like the frontend's Math.round (numpy rounds half to even)."""
+    return np.floor(np.asarray(values, dtype=np.float64) + 0.5).astype(np.int64)
+
+
+def _play_array_builder(fields: Tuple[str, ...]):
+    """(add(doc), build()) pair shared by the async and sync loaders below."""
+    times = []
+    codes: Dict[str, list] = {field: [] for field in fields}
+    lookups: Dict[str, Dict[object, int]] = {field: {} for field in fields}
+
+    def add(doc: dict) -> None:
+        played_at = doc["played_at"]
+        if played_at.tzinfo is None:
+            played_at = played_at.replace(tzinfo=timezone.utc)
+        times.append(int(played_at.timestamp() * 1_000))
+        for field in fields:
+            lookup = lookups[field]
+            codes[field].append(lookup.setdefault(doc.get(field), len(lookup)))
+
+    def build() -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, List[object]]]:
+        return (
+            np.array(times, dtype=np.int64),
+            {field: np.array(values, dtype=np.int32) for field, values in codes.items()},
+            {field: list(lookup) for field, lookup in lookups.items()},
+        )
+
+    return add, build
+
+
+async def load_play_arrays(
+    docs: AsyncIterable[dict],
+    fields: Tuple[str, ...] = ("track_id",)
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, List[object]]]:
+    """
+    Turn play documents into compact arrays: played_at as int64 unix ms and
+    each of `fields` factorized into int32 codes (equal values, equal codes),
+    plus each field's distinct values in code order.
+    """
+    add, build = _play_array_builder(fields)
+    async for doc in docs:
+        add(doc)
+    return build()
+
+
+def play_arrays(
+    docs: Iterable[dict],
+    fields: Tuple[str, ...] = ("track_id",)
+) -> Tuple[np.ndarray, Dict[str, np.ndarray], Dict[str, List[object]]]:
+    """load_play_arrays() over a synchronous cursor (e.g. in a worker process)."""
+    add, build = _play_array_builder(fields)
+    for doc in docs:
+        add(doc)
+    return build()
+
+
+async def load_track_arrays(track_ids: List[str]) -> Tuple[np.ndarray, np.ndarray, np.ndarray]:
+    """
+    Catalog lookups for tracks coded 0..n-1 (in `track_ids` order): each
+    track's album code, and (track code, artist code) pairs for every
+    credited artist. Tracks without artist ids count by artist_name.
+    """
+    tracks = await track_catalog.get_many(track_ids)
+    albums: Dict[object, int] = {}
+    artists: Dict[object, int] = {}
+    album_codes: List[int] = []
+    pair_tracks: List[int] = []
+    pair_artists: List[int] = []
+    for code, track_id in enumerate(track_ids):
+        track = track_info(track_id, tracks.get(track_id))
+        album_codes.append(albums.setdefault(track["album_name"], len(albums)))
+        for artist in track["artist_ids"] or [track["artist_name"]]:
+            pair_tracks.append(code)
+            pair_artists.append(artists.setdefault(artist, len(artists)))
+    return (
+        np.array(album_codes, dtype=np.int32),
+        np.array(pair_tracks, dtype=np.int32),
+        np.array(pair_artists, dtype=np.int32),
+    )
+
+
+def compute_fingerprint(
+    played_ms: np.ndarray,
+    track_codes: np.ndarray,
+    days: int = 30,
+    utc_offset_minutes: int = 0
+) -> FingerprintOut:
+    """
+    Listening fingerprint over plays from the last `days` days, each 0-100.
+    Days are calendar days shifted by `utc_offset_minutes` (the user's local
+    time), matching what the reports page used to compute in the browser.
+    """
+    total = int(played_ms.size)
+    if total == 0:
+        return FingerprintOut(consistency=0, discovery_rate=0, variance=0, concentration=0, replay_rate=0)
+
+    local_day = (played_ms + utc_offset_minutes * 60_000) // MS_PER_DAY
+    _, per_day = np.unique(local_day, return_counts=True)
+    unique_tracks = int(np.unique(track_codes).size)
+
+    # 1) share of the window's days with at least one play (a rolling window
+    #    touches days + 1 calendar days, hence the cap)
+    consistency = min(int(_js_round(per_day.size / days * 100)), 100)
+    # 2) unique tracks per play
+    discovery_rate = _js_round(unique_tracks / total * 100)
+    # 3) coefficient of variation of plays per active day
+    mean = per_day.mean()
+    variance = _js_round(min(per_day.std() / mean * 100, 100))
+    # 4) share of plays on the five busiest days
+    top5 = np.sort(per_day)[::-1][:5].sum()
+    concentration = _js_round(top5 / total * 100)
+    # 5) plays per unique track, scaled x10
+    replay_rate = min(int(_js_round(total / unique_tracks * 10)), 100)
+
+    return FingerprintOut(
+        consistency=consistency,
+        discovery_rate=int(discovery_rate),
+        variance=int(variance),
+        concentration=int(concentration),
+        replay_rate=replay_rate,
+    )
+
+
+def compute_music_ratio(
+    played_ms: np.ndarray,
+    track_codes: np.ndarray,
+    album_codes: np.ndarray,
+    artist_pairs: Tuple[np.ndarray, np.ndarray],
+    split_ms: int
+) -> MusicRatioOut:
+    """
+    Unique tracks, albums and artists played at or after `split_ms` versus
+    before it (the previous period). `album_codes` and `artist_pairs` map
+    track codes to albums and artists (see load_track_arrays).
+    """
+    current = played_ms >= split_ms
+    pair_tracks, pair_artists = artist_pairs
+
+    def uniques(mask: np.ndarray) -> Tuple[int, int, int]:
+        tracks = np.unique(track_codes[mask])
+        albums = np.unique(album_codes[tracks]).size
+        artists = np.unique(pair_artists[np.isin(pair_tracks, tracks)]).size
+        return int(tracks.size), int(albums), int(artists)
+
+    tracks, albums, artists = uniques(current)
+    last_tracks, last_albums, last_artists = uniques(~current)
+    return MusicRatioOut(
+        tracks=tracks,
+        albums=albums,
+        artists=artists,
+        last_tracks=last_tracks,
+        last_albums=last_albums,
+        last_artists=last_artists,
+    )
+
+
+async def listening_fingerprint(
+    user_id: str,
+    days: int = 30,
+    utc_offset_minutes: int = 0,
+    now: Optional[datetime] = None
+) -> FingerprintOut:
+    """Fingerprint of one user's last `days` days, straight from history."""
+    now = now or datetime.now(timezone.utc)
+    docs = iter_plays(user_id, now - timedelta(days=days), now, ("track_id",))
+    played_ms, codes, _ = await load_play_arrays(docs, ("track_id",))
+    return compute_fingerprint(played_ms, codes["track_id"], days, utc_offset_minutes)
+
+
+async def music_ratio(user_id: str, days: int = 30, now: Optional[datetime] = None) -> MusicRatioOut:
+    """Music ratio for the last `days` days versus the `days` before that."""
+    now = now or datetime.now(timezone.utc)
+    split = now - timedelta(days=days)
+    docs = iter_plays(user_id, split - timedelta(days=days), now, ("track_id",))
+    played_ms, codes, values = await load_play_arrays(docs, ("track_id",))
+    album_codes, pair_tracks, pair_artists = await load_track_arrays(values["track_id"])
+    return compute_music_ratio(
+        played_ms, codes["track_id"], album_codes, (pair_tracks, pair_artists), int(split.timestamp() * 1_000)
+    )
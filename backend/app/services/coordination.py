@@ -0,0 +1,101 @@
+# app/services/coordination.py
+
+import asyncio
+import hashlib
+import logging
+import os
+import socket
+import time
+import uuid
+from typing import Callable, List
+
+from ..config import settings
+from ..crud.worker import heartbeat, get_live_workers, delete_worker
+
+logger = logging.getLogger(__name__)
+
+# Shard key of work that must run on exactly one worker at a time
+LEADER_KEY = "__leader__"
+
+
+def _weight(worker_id: str, key: str) -> int:
+    digest = hashlib.blake2b(f"{worker_id}:{key}".encode(), digest_size=8).digest()
+    return int.from_bytes(digest, "big")
+
+
+class WorkerCoordinator:
+    """
+    Shards background work across every uvicorn worker and replica.
+
+    Each process holds a lease in the `workers` collection that it renews
+    every `heartbeat_interval` seconds; a worker whose lease is older than
+    `lease_seconds` is considered dead. Users are assigned to live workers
+    with rendezvous (highest-random-weight) hashing, so when a worker joins
+    or dies only its share of users moves and total poll work stays constant.
+    """
+    def __init__(self, heartbeat_interval: float = 10.0, lease_seconds: float = 30.0):
+        self._heartbeat_interval = heartbeat_interval
+        self._lease_seconds = lease_seconds
+        self.host = socket.gethostname()
+        self.pid = os.getpid()
+        self.worker_id = f"{self.host}:{self.pid}:{uuid.uuid4().hex[:8]}"
+        self._live: List[str] = [self.worker_id]
+        self._last_heartbeat = float("-inf")
+        self._listeners: List[Callable[[], None]] = []
+
+    def add_listener(self, callback: Callable[[], None]) -> None:
+        """Call `callback` whenever the set of live workers changes."""
+        self._listeners.append(callback)
+
+    @property
+    def live_workers(self) -> List[str]:
+        return list(self._live)
+
+    def owns(self, key: str) -> bool:
+        """True if this worker is responsible for `key` (usually a user_id)."""
+        # Fence ourselves off if we couldn't renew our lease: the others
+        # already consider us dead and will have taken over our users
+        if time.monotonic() - self._last_heartbeat > self._lease_seconds:
+            return False
+        owner = max(self._live, key=lambda worker_id: _weight(worker_id, key))
+        return owner == self.worker_id
+
+    def is_leader(self) -> bool:
+        """True on the one live worker that runs cluster-wide jobs."""
+        return self.owns(LEADER_KEY)
+
+    async def beat(self) -> None:
+        """Renew our lease and refresh the live worker set."""
+        try:
+            await heartbeat(self.worker_id, self.host, self.pid)
+            self._last_heartbeat = time.monotonic()
+            live = await get_live_workers(self._lease_seconds)
+        except Exception as e:
+            logger.error(f"Worker heartbeat failed: {e}")
+            return
+
+        if self.worker_id not in live:
+            live = sorted(live + [self.worker_id])
+        if live != self._live:
+            logger.info(f"Live workers changed: {len(self._live)} -> {len(live)}; rebalancing")
+            self._live = live
+            for callback in self._listeners:
+                callback()
+
+    async def run(self) -> None:
+        """Heartbeat loop. Runs until cancelled, then releases the lease."""
+        try:
+            while True:
+                await self.beat()
+                await asyncio.sleep(self._heartbeat_interval)
+        finally:
+            try:
+                await delete_worker(self.worker_id)
+            except Exception as e:
+                logger.warning(f"Failed to release worker lease: {e}")
+
+
+coordinator = WorkerCoordinator(
+    heartbeat_interval=settings.WORKER_HEARTBEAT_SECONDS,
+    lease_seconds=settings.WORKER_LEASE_SECONDS,
+)
@@ -0,0 +1,50 @@
+# app/services/export.py
+
+import csv
+import io
+import json
+from datetime import datetime, timezone
+from typing import Any, AsyncIterable, AsyncIterator, Dict, List
+
+# Column order for exports (and the fields projected out of Mongo)
+EXPORT_FIELDS: List[str] = [
+    "played_at", "track_id", "track_name", "artist_name", "album_name", "album_image",
+]
+
+
+def _iso(value: Any) -> Any:
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.isoformat()
+    return value
+
+
+async def iter_ndjson(docs: AsyncIterable[Dict[str, Any]], rows_per_chunk: int = 500) -> AsyncIterator[bytes]:
+    """Encode history documents as newline-delimited JSON, a chunk of rows at a time."""
+    chunk: List[str] = []
+    async for doc in docs:
+        chunk.append(json.dumps({field: _iso(doc.get(field)) for field in EXPORT_FIELDS}))
+        if len(chunk) >= rows_per_chunk:
+            yield ("\n".join(chunk) + "\n").encode()
+            chunk = []
+    if chunk:
+        yield ("\n".join(chunk) + "\n").encode()
+
+
+async def iter_csv(docs: AsyncIterable[Dict[str, Any]], rows_per_chunk: int = 500) -> AsyncIterator[bytes]:
+    """Encode history documents as CSV with a header row, a chunk of rows at a time."""
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(EXPORT_FIELDS)
+    rows = 0
+    async for doc in docs:
+        writer.writerow([_iso(doc.get(field)) for field in EXPORT_FIELDS])
+        rows += 1
+        if rows >= rows_per_chunk:
+            yield buffer.getvalue().encode()
+            buffer.seek(0)
+            buffer.truncate()
+            rows = 0
+    if buffer.tell():
+        yield buffer.getvalue().encode()
@@ -0,0 +1,164 @@
+# app/services/history_cache.py
+
+import logging
+import time
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Any, Awaitable, Callable, Dict, Iterable, List, Optional, Set, Tuple
+
+from ..config import settings
+from ..crud.sync_state import get_history_generation, bump_history_generations
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[str, str, int, Optional[int]]
+
+
+class HistoryResultCache:
+    """
+    LRU cache for per-user history aggregations (the top-N endpoints).
+
+    Entries are keyed by (user_id, endpoint, limit, since-bucket), where
+    `since` is floored to `since_bucket_seconds` so dashboards asking for
+    "the last 30 days" on every reload share one entry. Size is bounded
+    both by entry count and by the total number of cached rows, counting
+    the rows nested in a summary too.
+
+    Writers call invalidate_users() after inserting plays: it drops the
+    users' entries here and bumps their history generation in MongoDB.
+    Every entry remembers the generation it was computed under and is
+    only served while that is still current, so plays inserted by any
+    worker invalidate it at once; the one indexed read this costs is far
+    cheaper than the aggregation it saves. `ttl_seconds` is a backstop.
+    """
+    def __init__(
+        self,
+        max_entries: int = 10_000,
+        max_rows: int = 200_000,
+        ttl_seconds: float = 30.0,
+        since_bucket_seconds: int = 60,
+    ):
+        self._max_entries = max_entries
+        self._max_rows = max_rows
+        self._ttl = ttl_seconds
+        self._since_bucket = since_bucket_seconds
+        # key -> (expires_at, generation, rows, weight)
+        self._entries: "OrderedDict[CacheKey, Tuple[float, int, List[Any], int]]" = OrderedDict()
+        self._by_user: Dict[str, Set[CacheKey]] = {}
+        self._rows = 0
+        self._hits = 0
+        self._misses = 0
+        self._invalidations = 0
+        self._evictions = 0
+
+    def bucket_since(self, since: Optional[datetime]) -> Optional[datetime]:
+        """Floor `since` to the cache's bucket size (naive datetimes are UTC)."""
+        if since is None:
+            return None
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        ts = int(since.timestamp()) // self._since_bucket * self._since_bucket
+        return datetime.fromtimestamp(ts, tz=timezone.utc)
+
+    async def get_or_compute(
+        self,
+        user_id: str,
+        endpoint: str,
+        limit: int,
+        since: Optional[datetime],
+        compute: Callable[[Optional[datetime]], Awaitable[List[Any]]],
+    ) -> List[Any]:
+        """
+        Return the cached rows for this query, or await compute(bucketed_since)
+        and cache what it returns.
+        """
+        since = self.bucket_since(since)
+        key: CacheKey = (user_id, endpoint, limit, int(since.timestamp()) if since else None)
+        # Read before computing: a play inserted meanwhile bumps it past
+        # this value, so the result stored below is dropped on its next read
+        generation = await get_history_generation(user_id)
+        now = time.monotonic()
+
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > now and entry[1] == generation:
+                self._entries.move_to_end(key)
+                self._hits += 1
+                return list(entry[2])
+            self._discard(key)
+        self._misses += 1
+
+        rows = await compute(since)
+        self._store(key, generation, rows, now)
+        return list(rows)
+
+    async def invalidate_users(self, user_ids: Iterable[str]) -> None:
+        """
+        Forget every cached result for these users, on every worker (call
+        after inserting their plays). A failure to reach MongoDB is logged;
+        other workers then catch up within `ttl_seconds`.
+        """
+        user_ids = set(user_ids)
+        for user_id in user_ids:
+            keys = self._by_user.pop(user_id, None)
+            if not keys:
+                continue
+            for key in keys:
+                entry = self._entries.pop(key, None)
+                if entry is not None:
+                    self._rows -= entry[3]
+            self._invalidations += 1
+        try:
+            await bump_history_generations(user_ids)
+        except Exception as e:
+            logger.error(f"Failed to publish history cache invalidation: {e}")
+
+    @staticmethod
+    def _weight(rows: List[Any]) -> int:
+        """Rows counted against max_rows: each row plus the rows listed inside it."""
+        weight = 0
+        for row in rows:
+            weight += 1
+            if isinstance(row, dict):
+                weight += sum(len(value) for value in row.values() if isinstance(value, list))
+        return weight
+
+    def _store(self, key: CacheKey, generation: int, rows: List[Any], now: float) -> None:
+        self._discard(key)
+        weight = self._weight(rows)
+        self._entries[key] = (now + self._ttl, generation, list(rows), weight)
+        self._by_user.setdefault(key[0], set()).add(key)
+        self._rows += weight
+        while self._entries and (len(self._entries) > self._max_entries or self._rows > self._max_rows):
+            oldest = next(iter(self._entries))
+            self._discard(oldest)
+            self._evictions += 1
+
+    def _discard(self, key: CacheKey) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._rows -= entry[3]
+        keys = self._by_user.get(key[0])
+        if keys is not None:
+            keys.discard(key)
+            if not keys:
+                del self._by_user[key[0]]
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "rows": self._rows,
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "invalidations": self._invalidations,
+            "evictions": self._evictions,
+        }
+
+
+history_cache = HistoryResultCache(
+    max_entries=settings.HISTORY_CACHE_MAX_ENTRIES,
+    ttl_seconds=settings.HISTORY_CACHE_TTL_SECONDS,
+)
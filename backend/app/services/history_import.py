@@ -0,0 +1,308 @@
+# app/services/history_import.py
+
+import asyncio
+import codecs
+import json
+import logging
+import re
+from datetime import datetime, timezone, timedelta
+from typing import Any, AsyncIterator, Callable, Dict, List, Optional, Tuple
+
+from ..config import settings
+from ..crud.history import save_history_many, get_play_times
+from ..crud.history_import import get_import_job, save_import_progress
+from ..schemas.history import HistoryCreate
+from .track_catalog import track_catalog
+
+logger = logging.getLogger(__name__)
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+# What may still follow the part of a number decoded so far ("-3" of "-3.5e2")
+_NUMBER_TAIL = re.compile(r"[0-9.eE+\-]*")
+
+
+class JsonArrayStream:
+    """
+    Incremental parser for one top-level JSON array fed in text chunks:
+    yields each element as soon as it is complete, so a multi-gigabyte
+    export never has to be held in memory.
+    """
+    def __init__(self, max_element_chars: int = 1_000_000):
+        self._decoder = json.JSONDecoder()
+        self._buffer = ""
+        self._state = "start"   # start -> first -> (value <-> after) -> done
+        self._max_element_chars = max_element_chars
+
+    def feed(self, text: str) -> List[Any]:
+        """Add a chunk and return every element it completed. Raises ValueError on bad input."""
+        buf = self._buffer + text
+        pos = 0
+        items: List[Any] = []
+        while True:
+            pos = _WHITESPACE.match(buf, pos).end()
+            if pos == len(buf):
+                break
+            ch = buf[pos]
+            if self._state == "start":
+                if ch != "[":
+                    raise ValueError("expected a JSON array")
+                self._state = "first"
+                pos += 1
+            elif self._state == "done":
+                raise ValueError("unexpected data after the JSON array")
+            elif ch == "]" and self._state in ("first", "after"):
+                self._state = "done"
+                pos += 1
+            elif self._state == "after":
+                if ch != ",":
+                    raise ValueError(f"expected ',' or ']' but found {ch!r}")
+                self._state = "value"
+                pos += 1
+            else:
+                try:
+                    item, end = self._decoder.raw_decode(buf, pos)
+                except json.JSONDecodeError:
+                    # Most likely an element cut off at the end of this chunk
+                    if len(buf) - pos > self._max_element_chars:
+                        raise ValueError("malformed or oversized array element")
+                    break
+                if _NUMBER_TAIL.fullmatch(buf, end):
+                    # A number may go on in the next chunk ("12" then "34", or
+                    # "-3." then "5"); in a whole array whitespace, ',' or ']'
+                    # always follows it, so wait for that
+                    break
+                items.append(item)
+                pos = end
+                self._state = "after"
+        self._buffer = buf[pos:]
+        return items
+
+    def close(self) -> None:
+        """Raise ValueError unless the array was complete."""
+        if self._state != "done" or self._buffer.strip():
+            raise ValueError("truncated JSON array")
+
+
+def record_to_history(user_id: str, record: Dict[str, Any], min_ms_played: int = 30_000) -> Optional[HistoryCreate]:
+    """
+    Map one extended streaming history record to a history entry, or None
+    for podcasts, local files and plays shorter than `min_ms_played`.
+
+    `ts` is when playback stopped; like the poller, we record roughly when
+    the track started (ts - ms_played). The export carries no artist ids;
+    the importer takes them from the `tracks` catalog, and
+    scripts/migrate_artist_ids.py fills in tracks the catalog doesn't know.
+    """
+    uri = record.get("spotify_track_uri")
+    ts = record.get("ts")
+    ms_played = record.get("ms_played") or 0
+    if not uri or not ts or ms_played < min_ms_played:
+        return None
+
+    ended = datetime.fromisoformat(ts)
+    if ended.tzinfo is None:
+        ended = ended.replace(tzinfo=timezone.utc)
+    return HistoryCreate(
+        user_id=user_id,
+        track_id=uri.rsplit(":", 1)[-1],
+        track_name=record.get("master_metadata_track_name") or "Unknown Track",
+        artist_name=record.get("master_metadata_album_artist_name") or "Unknown",
+        album_name=record.get("master_metadata_album_album_name") or "Unknown Album",
+        album_image=None,
+        played_at=(ended - timedelta(milliseconds=ms_played)).replace(microsecond=0),
+    )
+
+
+def unrecorded(
+    plays: List[Tuple[HistoryCreate, datetime]],
+    recorded: Dict[str, List[datetime]],
+    slack: timedelta
+) -> List[HistoryCreate]:
+    """
+    The imported plays, as (entry, ended) pairs, that aren't stored yet.
+
+    The poller stores when a play started and the reconciler when it
+    finished, neither to the second the export has, so like the reconciler
+    a stored play of the same track in [start - slack, ended + slack]
+    counts as this one. Each stored play matches at most one imported
+    play (the nearest), so a track played twice in a row stays twice.
+    """
+    available = {track_id: sorted(times) for track_id, times in recorded.items()}
+    missing = []
+    for entry, ended in sorted(plays, key=lambda play: play[0].played_at):
+        times = available.get(entry.track_id, [])
+        low, high = entry.played_at - slack, ended + slack
+        candidates = [t for t in times if low <= t <= high]
+        if candidates:
+            times.remove(min(candidates, key=lambda t: abs(t - entry.played_at)))
+        else:
+            missing.append(entry)
+    return missing
+
+
+class HistoryImporter:
+    """
+    Imports one Spotify extended streaming history file for one user.
+
+    Records are parsed as the bytes arrive, mapped to history entries and
+    written with save_history_many in batches, `parallelism` batches at a
+    time. Plays the poller or reconciler already stored (matched within
+    `match_slack`, see unrecorded()) are left out, so are plays imported
+    before, so re-importing is harmless. Artist ids and track metadata
+    come from the `tracks` catalog where it knows the track.
+
+    Progress is stored per (user, source) as the number of records whose
+    batches have all been written; with resume=True a re-run skips that
+    many records.
+    """
+    def __init__(
+        self,
+        user_id: str,
+        source: str,
+        batch_size: int = 1000,
+        parallelism: int = 4,
+        min_ms_played: int = 30_000,
+        match_slack: float = 120.0,
+        on_progress: Optional[Callable[[Dict[str, Any]], None]] = None,
+    ):
+        self.user_id = user_id
+        self.source = source
+        self._batch_size = batch_size
+        self._parallelism = parallelism
+        self._min_ms_played = min_ms_played
+        self._match_slack = timedelta(seconds=match_slack)
+        self._on_progress = on_progress
+        self._progress: Dict[str, Any] = {}
+        # batch number -> record count once that batch is written
+        self._completed: Dict[int, int] = {}
+        self._next_to_commit = 0
+
+    async def run(self, chunks: AsyncIterator[bytes], resume: bool = True) -> Dict[str, Any]:
+        """Consume the file's bytes and import it. Returns the final progress."""
+        job = await get_import_job(self.user_id, self.source) if resume else None
+        resume_from = job["records_done"] if job else 0
+        self._progress = {
+            "status": "running",
+            "resumed_from": resume_from,
+            "records_done": resume_from,
+            "imported": job.get("imported", 0) if job else 0,
+            "duplicates": job.get("duplicates", 0) if job else 0,
+            "skipped": job.get("skipped", 0) if job else 0,
+            "error": None,
+        }
+        await save_import_progress(self.user_id, self.source, self._progress)
+
+        parser = JsonArrayStream()
+        decoder = codecs.getincrementaldecoder("utf-8-sig")()
+        semaphore = asyncio.Semaphore(self._parallelism)
+        tasks: List[asyncio.Task] = []
+        # (entry, when playback stopped) pairs
+        batch: List[Tuple[HistoryCreate, datetime]] = []
+        skipped = 0
+        records = 0
+        batch_no = 0
+
+        async def submit() -> None:
+            nonlocal batch, skipped, batch_no
+            await semaphore.acquire()
+            task = asyncio.create_task(self._write(batch_no, batch, skipped, records, semaphore))
+            tasks.append(task)
+            batch, skipped = [], 0
+            batch_no += 1
+
+        try:
+            async for chunk in chunks:
+                for record in parser.feed(decoder.decode(chunk)):
+                    records += 1
+                    if records <= resume_from:
+                        continue
+                    entry = record_to_history(self.user_id, record, self._min_ms_played) if isinstance(record, dict) else None
+                    if entry is None:
+                        skipped += 1
+                    else:
+                        batch.append((entry, entry.played_at + timedelta(milliseconds=record["ms_played"])))
+                    if len(batch) >= self._batch_size:
+                        await submit()
+                # Surface a failed batch without waiting for the whole file
+                for task in tasks:
+                    if task.done() and task.exception():
+                        raise task.exception()
+                tasks = [task for task in tasks if not task.done()]
+            parser.feed(decoder.decode(b"", final=True))
+            parser.close()
+            if records > resume_from:
+                await submit()
+            await asyncio.gather(*tasks)
+        except BaseException as e:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            self._progress["status"] = "failed"
+            self._progress["error"] = str(e) or type(e).__name__
+            await save_import_progress(self.user_id, self.source, self._progress)
+            raise
+
+        self._progress["status"] = "done"
+        self._progress["records_total"] = records
+        await save_import_progress(self.user_id, self.source, self._progress)
+        logger.info(
+            f"[Import] {self.user_id}/{self.source}: {records} records, "
+            f"{self._progress['imported']} imported, {self._progress['duplicates']} duplicates"
+        )
+        return dict(self._progress)
+
+    async def _write(
+        self,
+        batch_no: int,
+        batch: List[Tuple[HistoryCreate, datetime]],
+        skipped: int,
+        records_done: int,
+        semaphore: asyncio.Semaphore
+    ) -> None:
+        try:
+            inserted = await save_history_many(await self._new_plays(batch)) if batch else []
+        finally:
+            semaphore.release()
+
+        self._progress["imported"] += len(inserted)
+        self._progress["duplicates"] += len(batch) - len(inserted)
+        self._progress["skipped"] += skipped
+        # Only advance the resume point over an unbroken run of written batches
+        self._completed[batch_no] = records_done
+        advanced = False
+        while self._next_to_commit in self._completed:
+            self._progress["records_done"] = self._completed.pop(self._next_to_commit)
+            self._next_to_commit += 1
+            advanced = True
+        if advanced:
+            await save_import_progress(self.user_id, self.source, self._progress)
+            if self._on_progress:
+                self._on_progress(dict(self._progress))
+
+
+    async def _new_plays(self, batch: List[Tuple[HistoryCreate, datetime]]) -> List[HistoryCreate]:
+        """The batch's plays not stored yet, with artists and metadata from the catalog."""
+        start = min(entry.played_at for entry, _ in batch) - self._match_slack
+        end = max(ended for _, ended in batch) + self._match_slack
+        recorded = await get_play_times(self.user_id, start, end)
+        entries = unrecorded(batch, recorded, self._match_slack)
+
+        catalog = await track_catalog.get_many(entry.track_id for entry in entries)
+        for entry in entries:
+            track = catalog.get(entry.track_id)
+            if not track or not track.get("artist_ids"):
+                continue
+            entry.artist_ids = track["artist_ids"]
+            entry.artist_names = track.get("artist_names") or []
+            entry.artist_name = track.get("artist_name") or entry.artist_name
+            entry.album_name = track.get("album_name") or entry.album_name
+            entry.album_image = track.get("album_image") or entry.album_image
+            entry.duration_ms = track.get("duration_ms")
+        return entries
+
+
+def history_importer(user_id: str, source: str, **kwargs) -> HistoryImporter:
+    """A HistoryImporter using the configured batch size and parallelism."""
+    kwargs.setdefault("batch_size", settings.HISTORY_IMPORT_BATCH_SIZE)
+    kwargs.setdefault("parallelism", settings.HISTORY_IMPORT_PARALLELISM)
+    return HistoryImporter(user_id, source, **kwargs)
@@ -0,0 +1,125 @@
+# app/services/history_ingest.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, List
+
+from ..config import settings
+from ..crud.history import save_history_many
+from ..schemas.history import HistoryCreate
+
+logger = logging.getLogger(__name__)
+
+
+class HistoryIngestQueue:
+    """
+    Buffers play events from the poller and writes them in batches.
+
+    A batch is flushed as soon as `max_batch` events are waiting, or
+    `flush_interval` seconds after the previous flush, whichever comes
+    first. Each flush is one unordered bulk_write of $setOnInsert upserts.
+    """
+    def __init__(self, max_batch: int = 500, flush_interval: float = 1.0, max_pending: int = 50_000):
+        self._max_batch = max_batch
+        self._flush_interval = flush_interval
+        self._max_pending = max_pending
+        self._pending: List[HistoryCreate] = []
+        self._flush_now = asyncio.Event()
+        self._task: asyncio.Task | None = None
+        self._stats: Dict[str, Any] = {
+            "flushes": 0,
+            "events": 0,
+            "inserted": 0,
+            "failed_flushes": 0,
+            "last_batch_size": 0,
+            "max_batch_size": 0,
+            "last_flush_ms": 0.0,
+            "max_flush_ms": 0.0,
+            "total_flush_ms": 0.0,
+        }
+
+    def put(self, entry: HistoryCreate) -> None:
+        """Queue a play event for the next flush."""
+        self._pending.append(entry)
+        if len(self._pending) >= self._max_batch:
+            self._flush_now.set()
+
+    def start(self) -> None:
+        if self._task is None:
+            self._task = asyncio.create_task(self._run())
+
+    async def close(self) -> None:
+        """Stop the flush loop and write out everything still buffered."""
+        if self._task is not None:
+            self._task.cancel()
+            try:
+                await self._task
+            except asyncio.CancelledError:
+                pass
+            self._task = None
+        await self.flush()
+        logger.info(f"History ingest closed: {self.stats()}")
+
+    async def _run(self) -> None:
+        while True:
+            try:
+                await asyncio.wait_for(self._flush_now.wait(), timeout=self._flush_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._flush_now.clear()
+            await self.flush()
+
+    async def flush(self) -> None:
+        """Write all pending events, one bulk_write per `max_batch` events."""
+        while self._pending:
+            batch = self._pending[:self._max_batch]
+            del self._pending[:self._max_batch]
+
+            start = time.perf_counter()
+            try:
+                inserted = await save_history_many(batch)
+            except asyncio.CancelledError:
+                # Cancelled mid-write by close(): the upserts are idempotent,
+                # so hand the batch back for the final flush
+                self._pending[:0] = batch
+                raise
+            except Exception as e:
+                logger.exception(f"History flush of {len(batch)} events failed: {e}")
+                self._stats["failed_flushes"] += 1
+                # Put the batch back so the next flush retries it
+                self._pending[:0] = batch
+                if len(self._pending) > self._max_pending:
+                    dropped = len(self._pending) - self._max_pending
+                    del self._pending[:dropped]
+                    logger.error(f"History ingest backlog full; dropped {dropped} oldest events")
+                return
+            elapsed_ms = (time.perf_counter() - start) * 1_000
+
+            stats = self._stats
+            stats["flushes"] += 1
+            stats["events"] += len(batch)
+            stats["inserted"] += len(inserted)
+            stats["last_batch_size"] = len(batch)
+            stats["max_batch_size"] = max(stats["max_batch_size"], len(batch))
+            stats["last_flush_ms"] = round(elapsed_ms, 2)
+            stats["max_flush_ms"] = round(max(stats["max_flush_ms"], elapsed_ms), 2)
+            stats["total_flush_ms"] += elapsed_ms
+            logger.debug(
+                f"Flushed {len(batch)} history events ({len(inserted)} new) in {elapsed_ms:.1f}ms"
+            )
+
+    def stats(self) -> Dict[str, Any]:
+        """Flush counters plus average flush latency and batch size."""
+        stats = dict(self._stats)
+        flushes = stats["flushes"]
+        stats["pending"] = len(self._pending)
+        stats["avg_flush_ms"] = round(stats.pop("total_flush_ms") / flushes, 2) if flushes else 0.0
+        stats["avg_batch_size"] = round(stats["events"] / flushes, 1) if flushes else 0.0
+        return stats
+
+
+history_ingest = HistoryIngestQueue(
+    max_batch=settings.HISTORY_FLUSH_BATCH_SIZE,
+    flush_interval=settings.HISTORY_FLUSH_INTERVAL_SECONDS,
+)
@@ -0,0 +1,98 @@
+# app/services/identity.py
+
+import hashlib
+import time
+from typing import TYPE_CHECKING, Any, Dict, Optional, Tuple
+
+if TYPE_CHECKING:
+    # spotify_client looks identities up here to key its rate limiting
+    from .spotify_client import AsyncSpotify
+
+
+class IdentityCache:
+    """
+    Maps a fingerprint of an access token to the Spotify user id it belongs to,
+    so authorization checks don't need a current_user() round trip each time.
+    Entries expire together with the access token they were resolved from.
+
+    The refresh token of a remembered token_info is mapped too (for
+    `refresh_ttl`), so the identity can be carried over to the new access
+    token once the old one has expired and been refreshed.
+    """
+    def __init__(self, max_entries: int = 10_000, default_ttl: int = 3600, refresh_ttl: int = 30 * 86400):
+        self._data: Dict[str, Tuple[str, float]] = {}
+        self._max_entries = max_entries
+        self._default_ttl = default_ttl
+        self._refresh_ttl = refresh_ttl
+
+    @staticmethod
+    def fingerprint(access_token: str) -> str:
+        # Never keep raw tokens around as dict keys
+        return hashlib.sha256(access_token.encode()).hexdigest()
+
+    def get(self, access_token: str) -> Optional[str]:
+        return self._lookup(self.fingerprint(access_token))
+
+    def get_by_refresh_token(self, refresh_token: str) -> Optional[str]:
+        """The user a refresh token was issued to, if a token_info with it was remembered."""
+        return self._lookup("refresh:" + self.fingerprint(refresh_token))
+
+    def _lookup(self, key: str) -> Optional[str]:
+        entry = self._data.get(key)
+        if entry is None:
+            return None
+        user_id, expires_at = entry
+        if time.time() >= expires_at:
+            self._data.pop(key, None)
+            return None
+        return user_id
+
+    def set(self, access_token: str, user_id: str, expires_at: Optional[float] = None) -> None:
+        if expires_at is None:
+            expires_at = time.time() + self._default_ttl
+        self._store(self.fingerprint(access_token), user_id, expires_at)
+
+    def _store(self, key: str, user_id: str, expires_at: float) -> None:
+        if len(self._data) >= self._max_entries:
+            self.cleanup_expired()
+            # Still full: drop the oldest entries (dicts keep insertion order)
+            while len(self._data) >= self._max_entries:
+                self._data.pop(next(iter(self._data)))
+        self._data[key] = (user_id, expires_at)
+
+    def remember(self, token_info: Dict[str, Any], user_id: str) -> None:
+        """Cache the user id for a spotipy token_info dict and its refresh token."""
+        self.set(token_info["access_token"], user_id, token_info.get("expires_at"))
+        if token_info.get("refresh_token"):
+            self._store(
+                "refresh:" + self.fingerprint(token_info["refresh_token"]), user_id, time.time() + self._refresh_ttl
+            )
+
+    def cleanup_expired(self) -> int:
+        """Remove all expired entries. Returns count of removed entries."""
+        now = time.time()
+        expired = [key for key, (_, expires_at) in self._data.items() if now >= expires_at]
+        for key in expired:
+            self._data.pop(key, None)
+        return len(expired)
+
+
+identity_cache = IdentityCache()
+
+
+async def resolve_user_id(sp: "AsyncSpotify") -> Optional[str]:
+    """
+    Return the Spotify user id behind this client's access token,
+    calling current_user() only when the token hasn't been seen yet.
+    """
+    user_id = sp.user_id or identity_cache.get(sp.access_token)
+    if user_id is not None:
+        sp.user_id = user_id
+        return user_id
+
+    user = await sp.current_user()
+    user_id = user.get("id")
+    if user_id:
+        identity_cache.set(sp.access_token, user_id, sp.expires_at)
+        sp.user_id = user_id
+    return user_id
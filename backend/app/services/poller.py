@@ -0,0 +1,339 @@
+# app/services/poller.py
+
+import asyncio
+import heapq
+import logging
+import random
+import time
+from datetime import datetime, timezone
+from typing import Any, Dict, List, Optional, Set, Tuple
+from spotipy.oauth2 import SpotifyOauthError
+from spotipy.exceptions import SpotifyException
+
+from ..crud.track import artist_refs
+from ..crud.tracker import save_tracker_entries, load_tracker_entries
+from ..schemas.history import HistoryCreate
+from .spotify_services import LastSavedTracker
+from .spotify_client import AsyncSpotify
+from .rate_limit import retry_after_seconds
+from .token_store import token_store
+from .coordination import coordinator
+from .history_ingest import history_ingest
+
+logger = logging.getLogger(__name__)
+
+
+class PlaybackPoller:
+    """
+    Polls current_playback() for every user in the token store.
+
+    Only users assigned to this worker by the coordinator are polled.
+    They all share one asyncio loop: a min-heap keyed on each user's
+    next poll time decides who is due, and a semaphore bounds how many
+    polls are in flight at once. Errors back off per user, so one bad
+    token never slows down everyone else.
+
+    In "adaptive" mode the next poll is timed for when the current track
+    should end (plus jitter), idle users back off exponentially, and only
+    the poll right after a track change is short. "fixed" mode polls
+    every `interval` seconds.
+    """
+    def __init__(
+        self,
+        max_concurrency: int = 20,
+        interval: float = 10.0,
+        max_backoff: float = 300.0,
+        user_refresh_interval: float = 60.0,
+        cleanup_interval: float = 3600.0,
+        snapshot_interval: float = 60.0,
+        mode: str = "adaptive",
+        min_interval: float = 2.0,
+        max_playing_interval: float = 120.0,
+        idle_interval: float = 30.0,
+        max_idle_interval: float = 300.0,
+        max_jitter: float = 2.0,
+    ):
+        if mode not in ("adaptive", "fixed"):
+            raise ValueError(f"Unknown poll schedule mode: {mode}")
+        self._mode = mode
+        self._interval = interval
+        self._min_interval = min_interval
+        self._max_playing_interval = max_playing_interval
+        self._idle_interval = idle_interval
+        self._max_idle_interval = max_idle_interval
+        self._max_jitter = max_jitter
+        self._max_backoff = max_backoff
+        self._user_refresh_interval = user_refresh_interval
+        self._cleanup_interval = cleanup_interval
+        self._snapshot_interval = snapshot_interval
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        # (due, user_id) pairs; entries whose due no longer matches
+        # _next_poll[user_id] are stale and skipped when popped
+        self._heap: List[Tuple[float, str]] = []
+        self._next_poll: Dict[str, float] = {}
+        self._backoff: Dict[str, float] = {}
+        # Consecutive polls that found nothing playing, per user
+        self._idle_polls: Dict[str, int] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+        self._wakeup = asyncio.Event()
+        self._next_sync = 0.0
+        self._restore_pending = False
+        self._last_saved = LastSavedTracker(ttl_seconds=3600)
+
+    def schedule(self, user_id: str, delay: float = 0.0) -> None:
+        """(Re)schedule a user to be polled `delay` seconds from now."""
+        due = time.monotonic() + delay
+        self._next_poll[user_id] = due
+        heapq.heappush(self._heap, (due, user_id))
+        self._wakeup.set()
+
+    def unschedule(self, user_id: str) -> None:
+        self._next_poll.pop(user_id, None)
+        self._backoff.pop(user_id, None)
+        self._idle_polls.pop(user_id, None)
+        self._last_saved.forget(user_id)
+
+    def request_resync(self) -> None:
+        """Re-read the user set on the next loop iteration (e.g. after a rebalance)."""
+        self._next_sync = 0.0
+        # Users moving to us bring their last-saved state from the snapshot
+        self._restore_pending = True
+        self._wakeup.set()
+
+    async def _sync_users(self) -> None:
+        """
+        Pick up newly logged-in users and drop ones whose token is gone,
+        keeping only the users this worker owns.
+        """
+        try:
+            await token_store.load()
+        except Exception as e:
+            logger.error(f"Failed to reload token store: {e}")
+        known = {uid for uid in token_store.user_ids() if coordinator.owns(uid)}
+        for user_id in known - self._next_poll.keys() - self._in_flight:
+            self.schedule(user_id)
+        gone = [user_id for user_id in self._next_poll if user_id not in known]
+        if gone:
+            # Hand the latest state of users we lose over to their new owner
+            await self._snapshot_tracker()
+        for user_id in gone:
+            self.unschedule(user_id)
+
+    async def _restore_tracker(self) -> None:
+        """
+        Reload last-saved state of the users this worker owns, so a restart
+        or rebalance doesn't re-save every current track.
+        """
+        try:
+            entries = [entry for entry in await load_tracker_entries() if coordinator.owns(entry[0])]
+            restored = self._last_saved.restore(entries)
+            logger.info(f"Restored {restored} last-saved tracker entries")
+        except Exception as e:
+            logger.error(f"Failed to restore last-saved tracker: {e}")
+
+    async def _snapshot_tracker(self) -> None:
+        """Persist tracker entries changed since the previous snapshot."""
+        upserts, removals = self._last_saved.drain_dirty()
+        if not upserts and not removals:
+            return
+        try:
+            await save_tracker_entries(upserts, removals)
+        except Exception as e:
+            logger.error(f"Failed to snapshot last-saved tracker: {e}")
+
+    async def run(self) -> None:
+        """Main scheduling loop. Runs until cancelled."""
+        await self._restore_tracker()
+        self._next_sync = 0.0
+        next_cleanup = time.monotonic() + self._cleanup_interval
+        next_snapshot = time.monotonic() + self._snapshot_interval
+        try:
+            while True:
+                now = time.monotonic()
+                if now >= self._next_sync:
+                    if self._restore_pending:
+                        self._restore_pending = False
+                        await self._restore_tracker()
+                    await self._sync_users()
+                    self._next_sync = now + self._user_refresh_interval
+
+                if now >= next_cleanup:
+                    removed = self._last_saved.cleanup_expired()
+                    if removed > 0:
+                        logger.debug(f"Cleaned up {removed} expired last_saved entries")
+                    next_cleanup = now + self._cleanup_interval
+
+                if now >= next_snapshot:
+                    await self._snapshot_tracker()
+                    next_snapshot = now + self._snapshot_interval
+
+                while self._heap and self._heap[0][0] <= time.monotonic():
+                    due, user_id = heapq.heappop(self._heap)
+                    if self._next_poll.get(user_id) != due:
+                        continue
+                    del self._next_poll[user_id]
+                    # Blocks here while max_concurrency polls are running
+                    await self._semaphore.acquire()
+                    self._in_flight.add(user_id)
+                    task = asyncio.create_task(self._run_one(user_id))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+
+                now = time.monotonic()
+                timeout = min(self._next_sync, next_snapshot) - now
+                if self._heap:
+                    timeout = min(timeout, self._heap[0][0] - now)
+                self._wakeup.clear()
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), timeout=max(timeout, 0.0))
+                except asyncio.TimeoutError:
+                    pass
+        finally:
+            for task in self._tasks:
+                task.cancel()
+            if self._tasks:
+                await asyncio.gather(*self._tasks, return_exceptions=True)
+            await self._snapshot_tracker()
+
+    async def _run_one(self, user_id: str) -> None:
+        delay: Optional[float] = None
+        try:
+            delay = await self._poll_user(user_id)
+            # Reset backoff on success
+            self._backoff.pop(user_id, None)
+
+        except SpotifyOauthError as e:
+            logger.error(f"OAuth error polling {user_id}: {e}")
+            # OAuth errors need longer backoff - user may need to re-auth
+            delay = self._increase_backoff(user_id)
+
+        except SpotifyException as e:
+            if e.http_status == 429:
+                # The governor already paused all Spotify traffic; just come
+                # back once Retry-After has passed
+                delay = retry_after_seconds(e.headers) + random.uniform(0, self._max_jitter)
+                logger.info(f"Rate limited while polling {user_id}; retrying in {delay:.0f}s")
+            else:
+                logger.error(f"Spotify API error polling {user_id}: {e}")
+                delay = self._increase_backoff(user_id)
+
+        except KeyError as e:
+            logger.error(f"Missing expected key in Spotify response for {user_id}: {e}")
+            # Don't increase backoff for data issues
+            delay = self._interval
+
+        except Exception as e:
+            logger.exception(f"Unexpected error polling {user_id}: {e}")
+            delay = self._increase_backoff(user_id)
+
+        finally:
+            self._in_flight.discard(user_id)
+            self._semaphore.release()
+
+        if delay is not None and coordinator.owns(user_id) and await token_store.get(user_id) is not None:
+            self.schedule(user_id, delay)
+
+    def _increase_backoff(self, user_id: str) -> float:
+        backoff = min(self._backoff.get(user_id, self._interval) * 2, self._max_backoff)
+        self._backoff[user_id] = backoff
+        logger.info(f"Backing off {user_id} for {backoff}s")
+        return backoff
+
+    def _next_delay(
+        self,
+        user_id: str,
+        playback: Optional[Dict[str, Any]],
+        changed: bool = False,
+    ) -> float:
+        """
+        Decide how long to wait before polling this user again.
+        """
+        if self._mode == "fixed":
+            return self._interval
+
+        if not playback or not playback.get("is_playing"):
+            # Paused or stopped: back off until playback resumes
+            idle = self._idle_polls.get(user_id, 0)
+            self._idle_polls[user_id] = idle + 1
+            return min(self._idle_interval * (2 ** idle), self._max_idle_interval)
+
+        self._idle_polls.pop(user_id, None)
+        jitter = random.uniform(0, self._max_jitter)
+        if changed:
+            # Users often skip through several tracks in a row right after
+            # a change, so take one quick look before trusting the boundary
+            return self._interval + jitter
+
+        item = playback.get("item") or {}
+        duration_ms = item.get("duration_ms")
+        progress_ms = playback.get("progress_ms")
+        if not duration_ms or progress_ms is None:
+            return self._interval + jitter
+
+        remaining = max(duration_ms - progress_ms, 0) / 1_000
+        # Cap the wait so a skip mid-track is still noticed reasonably soon
+        return max(min(remaining, self._max_playing_interval), self._min_interval) + jitter
+
+    async def _poll_user(self, user_id: str) -> Optional[float]:
+        """
+        Poll one user's playback and save the track if it changed.
+        Returns the delay until the next poll, or None to stop polling.
+        """
+        token_info = await token_store.fresh_token(user_id)
+        if not token_info:
+            # No token, or it was revoked; the user has to log in again
+            self.unschedule(user_id)
+            return None
+
+        sp = AsyncSpotify.from_token_info(token_info, background=True, user_id=user_id)
+        playback = await sp.current_playback()
+        if playback and playback.get("is_playing"):
+            item = playback.get("item")
+            if item is None:
+                # Can happen with podcasts or local files
+                logger.debug("Playback active but no track item (possibly podcast/local file)")
+                return self._next_delay(user_id, playback)
+
+            track_id = item.get("id")
+            if track_id is None:
+                # Local files don't have IDs
+                logger.debug("Track has no ID (likely local file)")
+                return self._next_delay(user_id, playback)
+
+            # only save if it's a different song than last time
+            changed = self._last_saved.get(user_id) != track_id
+            if changed:
+                # Spotify gives you ms-precision timestamp
+                ts_ms = playback.get("timestamp", 0)
+                played_at = datetime.fromtimestamp(ts_ms / 1_000, tz=timezone.utc)
+
+                album = item.get("album", {})
+                album_images = album.get("images", [])
+                artist_ids, artist_names = artist_refs(item.get("artists", []))
+                entry = HistoryCreate(
+                    user_id=user_id,
+                    track_id=track_id,
+                    track_name=item.get("name", "Unknown Track"),
+                    artist_name=", ".join(a.get("name", "Unknown") for a in item.get("artists", [])),
+                    album_name=album.get("name", "Unknown Album"),
+                    album_image=(album_images[0]["url"] if album_images else None),
+                    played_at=played_at,
+                    artist_ids=artist_ids,
+                    artist_names=artist_names,
+                    duration_ms=item.get("duration_ms"),
+                )
+                history_ingest.put(entry)
+                self._last_saved.set(user_id, track_id)
+                logger.info(f"[History] {user_id} -> {item.get('name')} @ {played_at.isoformat()}")
+
+            return self._next_delay(user_id, playback, changed=changed)
+
+        else:
+            # playback paused or stopped: clear so a restart
+            # of the same track still counts as "new."
+            if self._last_saved.get(user_id):
+                self._last_saved.remove(user_id)
+                logger.debug(f"Playback stopped for user {user_id}, cleared last saved")
+
+        return self._next_delay(user_id, playback)
@@ -0,0 +1,173 @@
+# app/services/rate_limit.py
+
+import asyncio
+import logging
+import time
+from typing import Any, Dict, Optional
+
+from ..config import settings
+
+logger = logging.getLogger(__name__)
+
+
+class TokenBucket:
+    """Classic token bucket: `rate` tokens per second, holding at most `capacity`."""
+    __slots__ = ("rate", "capacity", "tokens", "updated")
+
+    def __init__(self, rate: float, capacity: float):
+        self.rate = rate
+        self.capacity = capacity
+        self.tokens = capacity
+        self.updated = time.monotonic()
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, now: float, needed: float = 1.0) -> float:
+        """Seconds until `needed` tokens are available (0 if they already are)."""
+        self._refill(now)
+        if self.tokens >= needed:
+            return 0.0
+        return (needed - self.tokens) / self.rate
+
+    def take(self, now: float, amount: float = 1.0) -> None:
+        self._refill(now)
+        self.tokens -= amount
+
+
+class SpotifyRateGovernor:
+    """
+    Process-wide throttle shared by every spotipy call.
+
+    Each call needs a token from the app-wide bucket (Spotify rate-limits per
+    client id) and, when it acts for a user, from that user's bucket. A 429's
+    Retry-After pauses all traffic until it passes. Interactive requests go
+    first: background calls wait while an interactive call is queued on the
+    app bucket, and may never use its last `background_reserve` share.
+    """
+    def __init__(
+        self,
+        app_rate: float = 20.0,
+        app_burst: float = 40.0,
+        user_rate: float = 1.0,
+        user_burst: float = 10.0,
+        background_reserve: float = 0.25,
+        idle_bucket_seconds: float = 600.0,
+    ):
+        self._app = TokenBucket(app_rate, app_burst)
+        self._user_rate = user_rate
+        self._user_burst = user_burst
+        self._users: Dict[str, TokenBucket] = {}
+        self._reserve = app_burst * background_reserve
+        self._idle_bucket_seconds = idle_bucket_seconds
+        self._next_prune = time.monotonic() + idle_bucket_seconds
+        self._blocked_until = 0.0
+        self._interactive_waiting = 0
+        self._stats: Dict[str, Dict[str, float]] = {
+            name: {"calls": 0, "queued": 0, "total_wait_ms": 0.0, "max_wait_ms": 0.0}
+            for name in ("interactive", "background")
+        }
+        self._rate_limited = 0
+
+    def _user_bucket(self, user_key: str, now: float) -> TokenBucket:
+        bucket = self._users.get(user_key)
+        if bucket is None:
+            bucket = self._users[user_key] = TokenBucket(self._user_rate, self._user_burst)
+        if now >= self._next_prune:
+            # Drop buckets that have been idle long enough to be full again
+            cutoff = now - self._idle_bucket_seconds
+            for key in [k for k, b in self._users.items() if b.updated < cutoff]:
+                del self._users[key]
+            self._users[user_key] = bucket
+            self._next_prune = now + self._idle_bucket_seconds
+        return bucket
+
+    async def acquire(self, user_key: Optional[str] = None, background: bool = False) -> float:
+        """
+        Wait until a Spotify call may be made. Returns the queueing delay in seconds.
+        """
+        start = time.monotonic()
+        counted = False
+        try:
+            while True:
+                now = time.monotonic()
+                wait = self._blocked_until - now
+                app_wait = 0.0
+                if wait <= 0:
+                    if background and self._interactive_waiting:
+                        # Let queued interactive calls drain first
+                        wait = 0.05
+                    else:
+                        needed = 1.0 + (self._reserve if background else 0.0)
+                        app_wait = self._app.wait_time(now, needed)
+                        user_wait = 0.0
+                        user_bucket = None
+                        if user_key is not None:
+                            user_bucket = self._user_bucket(user_key, now)
+                            user_wait = user_bucket.wait_time(now)
+                        wait = max(app_wait, user_wait)
+                        if wait <= 0:
+                            self._app.take(now)
+                            if user_bucket is not None:
+                                user_bucket.take(now)
+                            break
+
+                blocks_app = app_wait > 0 or self._blocked_until > now
+                if not background and blocks_app != counted:
+                    self._interactive_waiting += 1 if blocks_app else -1
+                    counted = blocks_app
+                await asyncio.sleep(wait)
+        finally:
+            if counted:
+                self._interactive_waiting -= 1
+
+        delay = time.monotonic() - start
+        stats = self._stats["background" if background else "interactive"]
+        stats["calls"] += 1
+        if delay > 0.001:
+            stats["queued"] += 1
+            stats["total_wait_ms"] += delay * 1_000
+            stats["max_wait_ms"] = max(stats["max_wait_ms"], delay * 1_000)
+            if delay > 1.0:
+                kind = "background" if background else "interactive"
+                logger.debug(f"Spotify {kind} call queued for {delay:.2f}s")
+        return delay
+
+    def on_rate_limited(self, retry_after: float) -> None:
+        """Spotify answered 429: hold back every caller until Retry-After passes."""
+        self._rate_limited += 1
+        self._blocked_until = max(self._blocked_until, time.monotonic() + retry_after)
+        logger.warning(f"Spotify rate limit hit; pausing all Spotify calls for {retry_after:.1f}s")
+
+    def stats(self) -> Dict[str, Any]:
+        """Queueing delay per priority, plus how often Spotify answered 429."""
+        result: Dict[str, Any] = {
+            "rate_limited": self._rate_limited,
+            "paused_for_s": round(max(self._blocked_until - time.monotonic(), 0.0), 1),
+            "tracked_users": len(self._users),
+        }
+        for name, stats in self._stats.items():
+            calls = stats["calls"]
+            result[name] = {
+                "calls": calls,
+                "queued": stats["queued"],
+                "avg_wait_ms": round(stats["total_wait_ms"] / calls, 2) if calls else 0.0,
+                "max_wait_ms": round(stats["max_wait_ms"], 2),
+            }
+        return result
+
+
+def retry_after_seconds(headers: Optional[Dict[str, str]], default: float = 5.0) -> float:
+    """Parse a Retry-After header (seconds form), falling back to `default`."""
+    try:
+        return max(float((headers or {}).get("Retry-After")), 0.0)
+    except (TypeError, ValueError):
+        return default
+
+
+governor = SpotifyRateGovernor(
+    app_rate=settings.SPOTIFY_APP_RATE_PER_SECOND,
+    app_burst=settings.SPOTIFY_APP_RATE_PER_SECOND * 2,
+    user_rate=settings.SPOTIFY_USER_RATE_PER_SECOND,
+)
@@ -0,0 +1,135 @@
+# app/services/reconciler.py
+
+import asyncio
+import logging
+import time
+from datetime import timedelta
+from typing import Dict, Set
+
+from ..config import settings
+from ..crud.history import get_play_times
+from ..crud.track import sync_recently_played_db
+from ..schemas.history import HistoryCreate
+from .spotify_client import AsyncSpotify
+from .history_ingest import history_ingest
+from .token_store import token_store
+from .coordination import coordinator
+
+logger = logging.getLogger(__name__)
+
+
+class RecentlyPlayedReconciler:
+    """
+    Background job that incrementally syncs each user's recently-played list
+    into the songs collection and back-fills history plays the poller missed
+    (e.g. skips between adaptive polls, or plays while a user was backed off).
+
+    Request handlers never call Spotify for this; they can only ask for a
+    user to be synced soon via request_sync(), on whichever worker got
+    the request. The sync cursor is shared, so whoever advances it must
+    also back-fill the plays it passed over; both steps are idempotent.
+    """
+    def __init__(
+        self,
+        interval: float = 1800.0,
+        max_concurrency: int = 5,
+        min_user_interval: float = 60.0,
+        match_slack: float = 120.0,
+    ):
+        self._interval = interval
+        self._min_user_interval = min_user_interval
+        self._match_slack = timedelta(seconds=match_slack)
+        self._semaphore = asyncio.Semaphore(max_concurrency)
+        self._last_run: Dict[str, float] = {}
+        self._in_flight: Set[str] = set()
+        self._tasks: Set[asyncio.Task] = set()
+
+    def request_sync(self, user_id: str) -> None:
+        """
+        Schedule a background sync for one user unless one ran very recently
+        on this worker.
+        """
+        if user_id in self._in_flight:
+            return
+        if time.monotonic() - self._last_run.get(user_id, float("-inf")) < self._min_user_interval:
+            return
+        task = asyncio.create_task(self._reconcile_guarded(user_id))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def run(self) -> None:
+        """Reconcile every user this worker owns, then sleep `interval`. Runs until cancelled."""
+        try:
+            while True:
+                user_ids = [uid for uid in token_store.user_ids() if coordinator.owns(uid)]
+                await asyncio.gather(*(self._reconcile_guarded(uid) for uid in user_ids))
+                logger.debug(f"Reconciled recently played for {len(user_ids)} users")
+                await asyncio.sleep(self._interval)
+        finally:
+            for task in self._tasks:
+                task.cancel()
+
+    async def _reconcile_guarded(self, user_id: str) -> None:
+        if user_id in self._in_flight:
+            return
+        self._in_flight.add(user_id)
+        try:
+            async with self._semaphore:
+                await self.reconcile_user(user_id)
+        except Exception as e:
+            logger.error(f"Recently-played reconcile failed for {user_id}: {e}")
+        finally:
+            self._last_run[user_id] = time.monotonic()
+            self._in_flight.discard(user_id)
+
+    async def reconcile_user(self, user_id: str) -> int:
+        """
+        Sync one user's recently played tracks and queue any plays missing
+        from history. Returns the number of back-filled history plays.
+        """
+        token_info = await token_store.fresh_token(user_id)
+        if not token_info:
+            return 0
+
+        sp = AsyncSpotify.from_token_info(token_info, background=True, user_id=user_id)
+        new_songs = await sync_recently_played_db(sp, user_id)
+        new_songs = [s for s in new_songs if s.get("track_id")]
+        if not new_songs:
+            return 0
+
+        # Spotify's played_at is when the track finished; the poller records
+        # roughly when it started. A play counts as already recorded if the
+        # same track shows up anywhere in [finish - duration - slack, finish + slack].
+        longest = max(timedelta(milliseconds=s.get("duration_ms") or 0) for s in new_songs)
+        start = min(s["played_at"] for s in new_songs) - longest - self._match_slack
+        end = max(s["played_at"] for s in new_songs) + self._match_slack
+        recorded = await get_play_times(user_id, start, end)
+
+        missing = 0
+        for song in new_songs:
+            finished = song["played_at"]
+            duration = timedelta(milliseconds=song.get("duration_ms") or 0)
+            window_start = finished - duration - self._match_slack
+            window_end = finished + self._match_slack
+            if any(window_start <= t <= window_end for t in recorded.get(song["track_id"], [])):
+                continue
+            history_ingest.put(HistoryCreate(
+                user_id=user_id,
+                track_id=song["track_id"],
+                track_name=song["track_name"],
+                artist_name=song["artist_name"],
+                album_name=song["album_name"],
+                album_image=song["album_image"],
+                played_at=finished,
+                artist_ids=song.get("artist_ids", []),
+                artist_names=song.get("artist_names", []),
+                duration_ms=song.get("duration_ms"),
+            ))
+            missing += 1
+
+        if missing:
+            logger.info(f"[Reconcile] {user_id}: back-filled {missing} plays missed by the poller")
+        return missing
+
+
+reconciler = RecentlyPlayedReconciler(interval=settings.RECONCILE_INTERVAL_SECONDS)
@@ -0,0 +1,219 @@
+# app/services/spotify_client.py
+
+import asyncio
+import functools
+import hashlib
+import logging
+import time
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, Optional
+import requests
+import spotipy
+from spotipy.exceptions import SpotifyException
+from urllib3.util.retry import Retry
+
+from ..config import settings
+from .spotify_services import sp_oauth
+from .rate_limit import governor, retry_after_seconds
+from .identity import identity_cache
+
+logger = logging.getLogger(__name__)
+
+# spotipy is a blocking client, so every call runs on a bounded thread pool
+# instead of the event loop. Background polling gets its own pool so a slow
+# upstream can never exhaust the threads interactive requests rely on.
+_executors: Dict[str, ThreadPoolExecutor] = {}
+
+
+def _get_executor(background: bool) -> ThreadPoolExecutor:
+    name = "background" if background else "interactive"
+    executor = _executors.get(name)
+    if executor is None:
+        max_workers = (
+            settings.SPOTIFY_BACKGROUND_MAX_WORKERS if background
+            else settings.SPOTIFY_MAX_WORKERS
+        )
+        executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix=f"spotify-{name}")
+        _executors[name] = executor
+    return executor
+
+
+def shutdown_executors() -> None:
+    """Stop the Spotify worker threads and close the shared HTTP session. Call during application shutdown."""
+    global _session
+    for executor in _executors.values():
+        executor.shutdown(wait=False, cancel_futures=True)
+    _executors.clear()
+    if _session is not None:
+        _session.shutdown()
+        _session = None
+    logger.info("Spotify executors shut down")
+
+
+async def run_blocking(func: Callable[..., Any], *args: Any, background: bool = False, **kwargs: Any) -> Any:
+    """Run a blocking Spotify call on the appropriate executor and await it."""
+    loop = asyncio.get_running_loop()
+    return await loop.run_in_executor(
+        _get_executor(background), functools.partial(func, *args, **kwargs)
+    )
+
+
+async def _governed(func: Callable[..., Any], *args: Any, rate_key: Optional[str] = None, background: bool = False, **kwargs: Any) -> Any:
+    """Run a Spotify call through the shared rate governor."""
+    await governor.acquire(rate_key, background=background)
+    try:
+        return await run_blocking(func, *args, background=background, **kwargs)
+    except SpotifyException as e:
+        if e.http_status == 429:
+            governor.on_rate_limited(retry_after_seconds(e.headers))
+        raise
+
+
+class _SharedSession(requests.Session):
+    """
+    The one requests session every spotipy client uses. spotipy closes its
+    session when a client is garbage-collected, which would drop everyone's
+    pooled connections, so close() is a no-op and shutdown() closes it.
+    """
+    def close(self) -> None:
+        pass
+
+    def shutdown(self) -> None:
+        super().close()
+
+
+_session: Optional[_SharedSession] = None
+
+
+def _get_session() -> _SharedSession:
+    """
+    The shared session, created on first use. It retries 5xx only. 429s
+    are left to the governor: urllib3's default Retry would sleep out
+    Retry-After on a worker thread without telling anyone else, and spotipy
+    then raises a 429 without the header. Its pool holds a connection for
+    every executor thread.
+    """
+    global _session
+    if _session is None:
+        retry = Retry(
+            total=3,
+            connect=None,
+            read=False,
+            allowed_methods=frozenset(["GET", "POST", "PUT", "DELETE"]),
+            status=3,
+            backoff_factor=0.3,
+            status_forcelist=(500, 502, 503, 504),
+            respect_retry_after_header=False,
+        )
+        adapter = requests.adapters.HTTPAdapter(
+            pool_maxsize=settings.SPOTIFY_MAX_WORKERS + settings.SPOTIFY_BACKGROUND_MAX_WORKERS,
+            max_retries=retry,
+        )
+        _session = _SharedSession()
+        _session.mount("http://", adapter)
+        _session.mount("https://", adapter)
+    return _session
+
+
+class AsyncSpotify:
+    """
+    Awaitable wrapper around spotipy.Spotify.
+    Only the endpoints the app actually uses are exposed.
+    Every call is throttled by the shared rate governor, against the
+    user's bucket once the user id is known (so a refreshed token keeps
+    the same budget), else against one keyed by the token.
+    """
+    def __init__(
+        self,
+        access_token: str,
+        expires_at: Optional[float] = None,
+        background: bool = False,
+        user_id: Optional[str] = None
+    ):
+        self._sp = spotipy.Spotify(auth=access_token, requests_session=_get_session())
+        self._background = background
+        self._token_key = hashlib.sha256(access_token.encode()).hexdigest()[:16]
+        self.access_token = access_token
+        self.expires_at = expires_at
+        self.user_id = user_id if user_id is not None else identity_cache.get(access_token)
+
+    @classmethod
+    def from_token_info(
+        cls, token_info: Dict[str, Any], background: bool = False, user_id: Optional[str] = None
+    ) -> "AsyncSpotify":
+        return cls(token_info["access_token"], token_info.get("expires_at"), background=background, user_id=user_id)
+
+    async def _call(self, func: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+        rate_key = f"user:{self.user_id}" if self.user_id else self._token_key
+        return await _governed(func, *args, rate_key=rate_key, background=self._background, **kwargs)
+
+    async def current_user(self) -> Dict[str, Any]:
+        return await self._call(self._sp.current_user)
+
+    async def current_playback(self) -> Optional[Dict[str, Any]]:
+        return await self._call(self._sp.current_playback)
+
+    async def current_user_recently_played(self, limit: int = 50, after: Optional[int] = None, before: Optional[int] = None) -> Dict[str, Any]:
+        return await self._call(self._sp.current_user_recently_played, limit=limit, after=after, before=before)
+
+    async def current_user_top_artists(self, limit: int = 20, time_range: str = "medium_term") -> Dict[str, Any]:
+        return await self._call(self._sp.current_user_top_artists, limit=limit, time_range=time_range)
+
+    async def artist(self, artist_id: str) -> Dict[str, Any]:
+        return await self._call(self._sp.artist, artist_id)
+
+    async def artist_top_tracks(self, artist_id: str, country: str = "US") -> Dict[str, Any]:
+        return await self._call(self._sp.artist_top_tracks, artist_id, country=country)
+
+
+async def get_access_token(code: str) -> Optional[Dict[str, Any]]:
+    """Exchange an authorization code for a token without blocking the loop."""
+    return await _governed(sp_oauth.get_access_token, code, check_cache=False)
+
+
+# Single-flight token refresh: at most one refresh request per refresh token
+# is in flight, and its result is reused until the new token is itself due
+_refreshes_in_flight: Dict[str, "asyncio.Task[Dict[str, Any]]"] = {}
+_refreshed_tokens: Dict[str, Dict[str, Any]] = {}
+_REFRESHED_TOKENS_MAX = 10_000
+
+
+def _remember_refreshed(refresh_token: str, token_info: Dict[str, Any]) -> None:
+    """Cache a refreshed token, first evicting expired ones (then the oldest) when full."""
+    if len(_refreshed_tokens) >= _REFRESHED_TOKENS_MAX:
+        now = time.time()
+        for key in [k for k, t in _refreshed_tokens.items() if t.get("expires_at", 0) <= now]:
+            del _refreshed_tokens[key]
+        while len(_refreshed_tokens) >= _REFRESHED_TOKENS_MAX:
+            del _refreshed_tokens[next(iter(_refreshed_tokens))]
+    _refreshed_tokens[refresh_token] = token_info
+
+
+async def refresh_access_token(refresh_token: str, background: bool = False, min_ttl: float = 0) -> Dict[str, Any]:
+    """
+    Refresh an access token without blocking the loop.
+    Concurrent callers refreshing the same token share one request. A
+    recently refreshed token is reused only while it is not expired and
+    has more than `min_ttl` seconds left, so early refreshes get a new one.
+    """
+    recent = _refreshed_tokens.get(refresh_token)
+    if recent is not None:
+        if not sp_oauth.is_token_expired(recent) and recent.get("expires_at", 0) - time.time() > min_ttl:
+            return recent
+        _refreshed_tokens.pop(refresh_token, None)
+
+    task = _refreshes_in_flight.get(refresh_token)
+    if task is None:
+        task = asyncio.ensure_future(
+            _governed(sp_oauth.refresh_access_token, refresh_token, background=background)
+        )
+        _refreshes_in_flight[refresh_token] = task
+
+        def _done(t: "asyncio.Task[Dict[str, Any]]") -> None:
+            _refreshes_in_flight.pop(refresh_token, None)
+            if not t.cancelled() and t.exception() is None:
+                _remember_refreshed(refresh_token, t.result())
+
+        task.add_done_callback(_done)
+    # One impatient waiter must not cancel the refresh for everyone else
+    return await asyncio.shield(task)
@@ -1,64 +1,123 @@
 # app/services/spotify_services.py
 
-import asyncio
+import heapq
 import logging
 import time
-from datetime import datetime, timezone
-from typing import Dict
-import spotipy
-from spotipy.oauth2 import SpotifyOAuth, SpotifyOauthError
-from spotipy.exceptions import SpotifyException
+from typing import Dict, Iterable, List, Set, Tuple
+from spotipy.oauth2 import SpotifyOAuth
 
 from ..config import settings
-from ..crud.history import save_history
-from ..schemas.history import HistoryCreate
 
 # Set up logging
 logger = logging.getLogger(__name__)
 
 
+class _TrackerEntry:
+    __slots__ = ("track_id", "expires_at")
+
+    def __init__(self, track_id: str, expires_at: float):
+        self.track_id = track_id
+        self.expires_at = expires_at
+
+
 class LastSavedTracker:
     """
-    Thread-safe tracker for last saved tracks per user with TTL-based cleanup.
+    Tracker for last saved tracks per user with TTL-based cleanup.
     Prevents memory leaks from accumulating stale user entries.
+
+    Entries are compact __slots__ objects, and a min-heap of
+    (expires_at, user_id) lets cleanup_expired() pop only what has
+    expired instead of scanning every user. Heap entries for users
+    that were set again since are skipped lazily.
+
+    Changes since the last drain_dirty() call are tracked so the
+    state can be snapshotted incrementally and restored after a restart.
     """
     def __init__(self, ttl_seconds: int = 3600):  # 1 hour TTL
-        self._data: Dict[str, Dict[str, any]] = {}
+        self._data: Dict[str, _TrackerEntry] = {}
+        self._heap: List[Tuple[float, str]] = []
+        self._dirty: Set[str] = set()
         self._ttl = ttl_seconds
 
+    def __len__(self) -> int:
+        return len(self._data)
+
     def get(self, user_id: str) -> str | None:
         entry = self._data.get(user_id)
         if entry is None:
             return None
         # Check TTL
-        if time.time() - entry["timestamp"] > self._ttl:
-            self._data.pop(user_id, None)
+        if time.time() >= entry.expires_at:
+            del self._data[user_id]
             return None
-        return entry["track_id"]
+        return entry.track_id
 
     def set(self, user_id: str, track_id: str) -> None:
-        self._data[user_id] = {
-            "track_id": track_id,
-            "timestamp": time.time()
-        }
+        self._put(user_id, track_id, time.time() + self._ttl)
+        self._dirty.add(user_id)
+
+    def _put(self, user_id: str, track_id: str, expires_at: float) -> None:
+        self._data[user_id] = _TrackerEntry(track_id, expires_at)
+        heapq.heappush(self._heap, (expires_at, user_id))
+        # Rebuild if stale heap entries start to dominate
+        if len(self._heap) > 2 * len(self._data) + 1024:
+            self._heap = [(e.expires_at, uid) for uid, e in self._data.items()]
+            heapq.heapify(self._heap)
 
     def remove(self, user_id: str) -> None:
+        if self._data.pop(user_id, None) is not None:
+            self._dirty.add(user_id)
+
+    def forget(self, user_id: str) -> None:
+        """
+        Drop a user's entry from memory only (e.g. it moved to another
+        worker), leaving the snapshot to whoever tracks the user now.
+        """
         self._data.pop(user_id, None)
+        self._dirty.discard(user_id)
 
     def cleanup_expired(self) -> int:
         """Remove all expired entries. Returns count of removed entries."""
         now = time.time()
-        expired = [
-            uid for uid, entry in self._data.items()
-            if now - entry["timestamp"] > self._ttl
-        ]
-        for uid in expired:
-            self._data.pop(uid, None)
-        return len(expired)
-
+        removed = 0
+        while self._heap and self._heap[0][0] <= now:
+            expires_at, uid = heapq.heappop(self._heap)
+            entry = self._data.get(uid)
+            if entry is not None and entry.expires_at == expires_at:
+                del self._data[uid]
+                removed += 1
+        return removed
+
+    def drain_dirty(self) -> Tuple[List[Tuple[str, str, float]], List[str]]:
+        """
+        Return (upserts, removals) changed since the last call:
+        upserts are (user_id, track_id, expires_at) tuples, removals are user_ids.
+        """
+        upserts: List[Tuple[str, str, float]] = []
+        removals: List[str] = []
+        for uid in self._dirty:
+            entry = self._data.get(uid)
+            if entry is None:
+                removals.append(uid)
+            else:
+                upserts.append((uid, entry.track_id, entry.expires_at))
+        self._dirty.clear()
+        return upserts, removals
+
+    def restore(self, entries: Iterable[Tuple[str, str, float]]) -> int:
+        """
+        Load (user_id, track_id, expires_at) entries, skipping expired ones.
+        An entry replaces the in-memory one only if it was saved later.
+        """
+        now = time.time()
+        restored = 0
+        for uid, track_id, expires_at in entries:
+            current = self._data.get(uid)
+            if expires_at > now and (current is None or expires_at > current.expires_at):
+                self._put(uid, track_id, expires_at)
+                restored += 1
+        return restored
 
-# Use TTL-based tracker instead of plain dict
-_last_saved = LastSavedTracker(ttl_seconds=3600)
 
 sp_oauth = SpotifyOAuth(
     client_id=settings.SPOTIPY_CLIENT_ID,
@@ -70,122 +129,3 @@ sp_oauth = SpotifyOAuth(
         "user-read-email user-read-recently-played"
     ),
 )
-
-async def fetch_currently_playing():
-    """
-    Every 10s: poll current_playback(), and if the user's track_id
-    differs from what we last recorded, save it once.
-    
-    Uses exponential backoff on errors, capped at 5 minutes.
-    Includes periodic cleanup of stale entries to prevent memory leaks.
-    """
-    backoff_seconds = 10
-    max_backoff = 300  # 5 minutes
-    cleanup_counter = 0
-    cleanup_interval = 360  # Cleanup every ~1 hour (360 * 10 seconds)
-    
-    while True:
-        try:
-            # Periodic cleanup of expired entries
-            cleanup_counter += 1
-            if cleanup_counter >= cleanup_interval:
-                removed = _last_saved.cleanup_expired()
-                if removed > 0:
-                    logger.debug(f"Cleaned up {removed} expired last_saved entries")
-                cleanup_counter = 0
-
-            token_info = sp_oauth.get_cached_token()
-            if not token_info:
-                logger.info("No token cached; waiting for user login...")
-                await asyncio.sleep(30)
-                continue
-
-            if sp_oauth.is_token_expired(token_info):
-                logger.debug("Token expired, refreshing...")
-                try:
-                    token_info = sp_oauth.refresh_access_token(token_info["refresh_token"])
-                except SpotifyOauthError as e:
-                    logger.error(f"OAuth error refreshing token: {e}")
-                    # Token is invalid, wait for user to re-authenticate
-                    await asyncio.sleep(60)
-                    continue
-
-            sp = spotipy.Spotify(auth=token_info["access_token"])
-            user = sp.current_user()
-            user_id = user.get("id")
-            
-            if not user_id:
-                logger.warning("Could not get user ID from Spotify")
-                await asyncio.sleep(backoff_seconds)
-                continue
-
-            playback = sp.current_playback()
-            if playback and playback.get("is_playing"):
-                item = playback.get("item")
-                if item is None:
-                    # Can happen with podcasts or local files
-                    logger.debug("Playback active but no track item (possibly podcast/local file)")
-                    await asyncio.sleep(backoff_seconds)
-                    continue
-                    
-                track_id = item.get("id")
-                if track_id is None:
-                    # Local files don't have IDs
-                    logger.debug("Track has no ID (likely local file)")
-                    await asyncio.sleep(backoff_seconds)
-                    continue
-
-                # only save if it's a different song than last time
-                if _last_saved.get(user_id) != track_id:
-                    # Spotify gives you ms-precision timestamp
-                    ts_ms = playback.get("timestamp", 0)
-                    played_at = datetime.fromtimestamp(ts_ms / 1_000, tz=timezone.utc)
-
-                    album = item.get("album", {})
-                    album_images = album.get("images", [])
-                    entry = HistoryCreate(
-                        user_id=user_id,
-                        track_id=track_id,
-                        track_name=item.get("name", "Unknown Track"),
-                        artist_name=", ".join(a.get("name", "Unknown") for a in item.get("artists", [])),
-                        album_name=album.get("name", "Unknown Album"),
-                        album_image=(album_images[0]["url"] if album_images else None),
-                        played_at=played_at,
-                    )
-                    save_history(entry)
-                    _last_saved.set(user_id, track_id)
-                    logger.info(f"[History] {user_id} -> {item.get('name')} @ {played_at.isoformat()}")
-
-            else:
-                # playback paused or stopped: clear so a restart
-                # of the same track still counts as "new."
-                if _last_saved.get(user_id):
-                    _last_saved.remove(user_id)
-                    logger.debug(f"Playback stopped for user {user_id}, cleared last saved")
-
-            # Reset backoff on success
-            backoff_seconds = 10
-
-        except SpotifyOauthError as e:
-            logger.error(f"OAuth error in fetch_currently_playing: {e}")
-            # OAuth errors need longer backoff - user may need to re-auth
-            backoff_seconds = min(backoff_seconds * 2, max_backoff)
-            logger.info(f"Backing off for {backoff_seconds}s due to OAuth error")
-
-        except SpotifyException as e:
-            logger.error(f"Spotify API error in fetch_currently_playing: {e}")
-            # Apply exponential backoff for Spotify errors
-            backoff_seconds = min(backoff_seconds * 2, max_backoff)
-            logger.info(f"Backing off for {backoff_seconds}s")
-            
-        except KeyError as e:
-            logger.error(f"Missing expected key in Spotify response: {e}")
-            # Don't increase backoff for data issues
-            
-        except Exception as e:
-            logger.exception(f"Unexpected error in fetch_currently_playing: {e}")
-            # Apply backoff for unexpected errors
-            backoff_seconds = min(backoff_seconds * 2, max_backoff)
-
-        await asyncio.sleep(backoff_seconds)
-
@@ -0,0 +1,135 @@
+# app/services/token_store.py
+
+import asyncio
+import logging
+import time
+from typing import Callable, Dict, Any, List, Optional
+from spotipy.oauth2 import SpotifyOauthError
+
+from ..crud.token import save_token, get_token, get_all_tokens, delete_token
+from .spotify_services import sp_oauth
+from .spotify_client import refresh_access_token
+from .identity import identity_cache
+
+logger = logging.getLogger(__name__)
+
+
+class TokenStore:
+    """
+    Per-user OAuth token store: MongoDB is the source of truth,
+    with an in-memory cache in front so the poller never has to
+    hit the database just to look up a token.
+    """
+    def __init__(self):
+        self._cache: Dict[str, Dict[str, Any]] = {}
+
+    async def load(self) -> int:
+        """Warm the cache from MongoDB. Returns the number of users loaded."""
+        self._cache = await get_all_tokens()
+        logger.debug(f"Loaded {len(self._cache)} stored tokens")
+        return len(self._cache)
+
+    async def get(self, user_id: str) -> Optional[Dict[str, Any]]:
+        token_info = self._cache.get(user_id)
+        if token_info is None:
+            token_info = await get_token(user_id)
+            if token_info is not None:
+                self._cache[user_id] = token_info
+        return token_info
+
+    async def save(self, user_id: str, token_info: Dict[str, Any]) -> bool:
+        """Store a token. Returns False if a newer one was already stored (and is now cached)."""
+        if await save_token(user_id, token_info):
+            self._cache[user_id] = token_info
+            return True
+        # Someone else already stored a newer token; use that one
+        newer = await get_token(user_id)
+        if newer is not None:
+            self._cache[user_id] = newer
+        return False
+
+    async def remove(self, user_id: str) -> None:
+        self._cache.pop(user_id, None)
+        await delete_token(user_id)
+
+    def user_ids(self) -> List[str]:
+        return list(self._cache.keys())
+
+    async def fresh_token(self, user_id: str) -> Optional[Dict[str, Any]]:
+        """
+        Return a non-expired token for background work, refreshing it if needed.
+        Returns None if we have no token or Spotify revoked the refresh token
+        (in which case the stored token is dropped).
+        """
+        token_info = await self.get(user_id)
+        if not token_info or not sp_oauth.is_token_expired(token_info):
+            return token_info
+
+        logger.debug(f"Token expired for {user_id}, refreshing...")
+        try:
+            token_info = await refresh_access_token(token_info["refresh_token"], background=True)
+        except SpotifyOauthError as e:
+            if e.error == "invalid_grant":
+                # Refresh token revoked; the user has to log in again
+                logger.warning(f"Refresh token revoked for {user_id}; dropping stored token")
+                await self.remove(user_id)
+                return None
+            raise
+        await self.save(user_id, token_info)
+        identity_cache.remember(token_info, user_id)
+        return self._cache.get(user_id, token_info)
+
+    async def refresh_expiring(
+        self, lead_seconds: float, owns: Callable[[str], bool], concurrency: int = 8
+    ) -> int:
+        """
+        Refresh tokens that expire within `lead_seconds`, for users `owns` accepts,
+        so callers rarely have to wait on a refresh. Up to `concurrency` refreshes
+        run at once, so a large shard still fits in the lead time (the rate
+        governor paces them against Spotify). Returns the number of new tokens
+        actually stored.
+        """
+        deadline = time.time() + lead_seconds
+        due = [
+            uid for uid, token_info in self._cache.items()
+            if token_info.get("expires_at", 0) < deadline and owns(uid)
+        ]
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def refresh(uid: str) -> bool:
+            async with semaphore:
+                token_info = self._cache.get(uid)
+                if not token_info:
+                    return False
+                try:
+                    # Skip a cached token that would itself be due within the lead time
+                    new_token = await refresh_access_token(
+                        token_info["refresh_token"], background=True, min_ttl=lead_seconds
+                    )
+                except SpotifyOauthError as e:
+                    if e.error == "invalid_grant":
+                        logger.warning(f"Refresh token revoked for {uid}; dropping stored token")
+                        await self.remove(uid)
+                    else:
+                        logger.error(f"Early token refresh failed for {uid}: {e}")
+                    return False
+                except Exception as e:
+                    logger.error(f"Early token refresh failed for {uid}: {e}")
+                    return False
+                saved = await self.save(uid, new_token)
+                identity_cache.remember(new_token, uid)
+                return saved
+
+        refreshed = sum(await asyncio.gather(*(refresh(uid) for uid in due)))
+        if refreshed:
+            logger.debug(f"Refreshed {refreshed} tokens ahead of expiry")
+        return refreshed
+
+    async def run_refresher(self, owns: Callable[[str], bool], interval: float = 60.0, lead_seconds: float = 300.0) -> None:
+        """Background loop that refreshes tokens before they expire. Runs until cancelled."""
+        while True:
+            await self.refresh_expiring(lead_seconds, owns)
+            await asyncio.sleep(interval)
+
+
+token_store = TokenStore()
@@ -0,0 +1,154 @@
+# app/services/track_catalog.py
+
+import logging
+import time
+from collections import OrderedDict
+from typing import Any, AsyncIterable, AsyncIterator, Dict, Iterable, List, Optional, Tuple
+
+from ..config import settings
+from ..crud.track_catalog import TRACK_DEFAULTS, catalog_entry, find_tracks, upsert_tracks
+
+logger = logging.getLogger(__name__)
+
+
+class TrackCatalog:
+    """
+    In-process LRU over the `tracks` catalog.
+
+    Plays are stored as (user_id, track_id, played_at); every read that
+    shows track names or artwork joins them back through get_many() /
+    attach(), which only go to Mongo for tracks this worker hasn't seen
+    within `ttl_seconds`. remember() keeps the catalog up to date from the
+    write path and skips tracks whose cached entry already matches, so a
+    track played over and over costs one catalog write per worker.
+    """
+    def __init__(self, max_entries: int = 50_000, ttl_seconds: float = 3600.0):
+        self._max_entries = max_entries
+        self._ttl = ttl_seconds
+        # track_id -> (expires_at, entry)
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any]]]" = OrderedDict()
+        self._hits = 0
+        self._misses = 0
+        self._writes = 0
+        self._evictions = 0
+
+    def _cached(self, track_id: str, now: float) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(track_id)
+        if entry is None:
+            return None
+        if entry[0] <= now:
+            del self._entries[track_id]
+            return None
+        self._entries.move_to_end(track_id)
+        return entry[1]
+
+    def _put(self, track_id: str, entry: Dict[str, Any], now: float) -> None:
+        self._entries[track_id] = (now + self._ttl, entry)
+        self._entries.move_to_end(track_id)
+        while len(self._entries) > self._max_entries:
+            self._entries.popitem(last=False)
+            self._evictions += 1
+
+    async def get_many(self, track_ids: Iterable[Optional[str]]) -> Dict[str, Dict[str, Any]]:
+        """Catalog entries for these track ids; ids the catalog doesn't know are left out."""
+        now = time.monotonic()
+        found: Dict[str, Dict[str, Any]] = {}
+        missing: List[str] = []
+        for track_id in set(track_ids):
+            if not track_id:
+                continue
+            entry = self._cached(track_id, now)
+            if entry is None:
+                missing.append(track_id)
+            else:
+                found[track_id] = entry
+        self._hits += len(found)
+        self._misses += len(missing)
+
+        if missing:
+            fetched = await find_tracks(missing)
+            for track_id, entry in fetched.items():
+                self._put(track_id, entry, now)
+            found.update(fetched)
+        return found
+
+    async def remember(self, docs: Iterable[Dict[str, Any]]) -> None:
+        """
+        Upsert the catalog entries of tracks carried by freshly fetched
+        plays (dicts with track_id and the TRACK_DEFAULTS fields).
+        """
+        now = time.monotonic()
+        pending: Dict[str, Dict[str, Any]] = {}
+        for doc in docs:
+            track_id = doc.get("track_id")
+            if not track_id or track_id in pending:
+                continue
+            entry = catalog_entry(doc)
+            cached = self._cached(track_id, now)
+            if cached is not None and (
+                # Entries without artist ids never overwrite the catalog
+                not entry.get("artist_ids")
+                or all(cached.get(field) == value for field, value in entry.items())
+            ):
+                continue
+            pending[track_id] = entry
+        if not pending:
+            return
+
+        await upsert_tracks(pending)
+        self._writes += len(pending)
+        for track_id, entry in pending.items():
+            if entry.get("artist_ids"):
+                cached = self._cached(track_id, now) or {}
+                self._put(track_id, {**cached, **entry}, now)
+            else:
+                # $setOnInsert may have kept a different stored entry
+                self._entries.pop(track_id, None)
+
+    async def attach(self, docs: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+        """
+        Fill the track metadata of stored plays in from the catalog, in
+        place. Fields a document already has (plays stored before the
+        catalog existed) win over the catalog.
+        """
+        tracks = await self.get_many(doc.get("track_id") for doc in docs)
+        for doc in docs:
+            track = tracks.get(doc.get("track_id"), {})
+            for field, default in TRACK_DEFAULTS.items():
+                if doc.get(field) in (None, []):
+                    doc[field] = track.get(field, default)
+        return docs
+
+    async def iter_attached(
+        self,
+        docs: AsyncIterable[Dict[str, Any]],
+        batch_size: int = 500
+    ) -> AsyncIterator[Dict[str, Any]]:
+        """attach() over a stream of plays, `batch_size` at a time."""
+        batch: List[Dict[str, Any]] = []
+        async for doc in docs:
+            batch.append(doc)
+            if len(batch) >= batch_size:
+                for attached in await self.attach(batch):
+                    yield attached
+                batch = []
+        if batch:
+            for attached in await self.attach(batch):
+                yield attached
+
+    def stats(self) -> Dict[str, Any]:
+        lookups = self._hits + self._misses
+        return {
+            "entries": len(self._entries),
+            "hits": self._hits,
+            "misses": self._misses,
+            "hit_rate": round(self._hits / lookups, 3) if lookups else 0.0,
+            "writes": self._writes,
+            "evictions": self._evictions,
+        }
+
+
+track_catalog = TrackCatalog(
+    max_entries=settings.TRACK_CATALOG_CACHE_SIZE,
+    ttl_seconds=settings.TRACK_CATALOG_TTL_SECONDS,
+)
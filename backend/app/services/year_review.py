@@ -0,0 +1,234 @@
+# app/services/year_review.py
+
+import asyncio
+import logging
+import multiprocessing
+import os
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime, timezone
+from typing import Any, Callable, Dict, List, Optional, Set
+
+import numpy as np
+
+from ..config import settings
+from ..crud.track_catalog import track_info
+from ..crud.year_review import (
+    review_user_ids, count_year_plays, get_review_counts, save_year_review,
+    read_year_plays, read_tracks, read_known_keys,
+)
+from ..db.database import get_client
+from .analytics import MS_PER_DAY, play_arrays
+
+logger = logging.getLogger(__name__)
+
+
+def _ranked(counts: np.ndarray, limit: int) -> np.ndarray:
+    """Indexes of the `limit` largest non-zero counts, largest first (ties by index)."""
+    order = np.argsort(-counts, kind="stable")[:limit]
+    return order[counts[order] > 0]
+
+
+def compute_year_review(
+    played_ms: np.ndarray,
+    track_codes: np.ndarray,
+    tracks: List[Dict[str, Any]],
+    known_tracks: Set[str],
+    known_artists: Set[str],
+    limit: int = 10
+) -> Dict[str, Any]:
+    """
+    Build one user's year-in-review report from a year of plays: played_at
+    as unix ms and track codes indexing `tracks` (track_info dicts). Tracks
+    and artists in `known_*` were played before the year, so aren't new.
+
+    Pure numpy over its arguments, so it can run in a worker process.
+    """
+    n_tracks = len(tracks)
+    counts = np.bincount(track_codes, minlength=n_tracks).astype(np.int64)
+    durations = np.array([track["duration_ms"] or 0 for track in tracks], dtype=np.int64)
+    play_ms = durations[track_codes]
+
+    def track_row(code: int) -> Dict[str, Any]:
+        track = tracks[code]
+        return {
+            "track_id": track["track_id"],
+            "play_count": int(counts[code]),
+            "track_name": track["track_name"],
+            "artist_name": track["artist_name"],
+            "album_name": track["album_name"],
+            "album_image": track["album_image"],
+        }
+
+    # Artists and albums, coded in order of their tracks' play counts so the
+    # first track seen for each gives its image
+    artists: Dict[str, int] = {}
+    artist_rows: List[Dict[str, Any]] = []
+    albums: Dict[str, int] = {}
+    album_rows: List[Dict[str, Any]] = []
+    pair_tracks: List[int] = []
+    pair_artists: List[int] = []
+    album_codes = np.zeros(n_tracks, dtype=np.int64)
+    for code in np.argsort(-counts, kind="stable"):
+        track = tracks[code]
+        names = track["artist_names"] or []
+        for i, artist_id in enumerate(track["artist_ids"] or []):
+            if artist_id not in artists:
+                artists[artist_id] = len(artists)
+                artist_rows.append({
+                    "artist_id": artist_id,
+                    "artist_name": names[i] if i < len(names) else track["artist_name"],
+                    "artist_image": track["album_image"],
+                })
+            pair_tracks.append(code)
+            pair_artists.append(artists[artist_id])
+        album = track["album_name"]
+        if album not in albums:
+            albums[album] = len(albums)
+            album_rows.append({
+                "album_name": album,
+                "artist_name": track["artist_name"],
+                "album_image": track["album_image"],
+            })
+        album_codes[code] = albums[album]
+
+    artist_counts = np.bincount(
+        np.array(pair_artists, dtype=np.int64),
+        weights=counts[np.array(pair_tracks, dtype=np.int64)],
+        minlength=len(artists),
+    ).astype(np.int64)
+    album_counts = np.bincount(album_codes, weights=counts, minlength=len(albums)).astype(np.int64)
+
+    busiest_day = None
+    if len(played_ms):
+        days, day_codes = np.unique(played_ms // MS_PER_DAY, return_inverse=True)
+        day_plays = np.bincount(day_codes)
+        busiest = int(np.argmax(day_plays))
+        busiest_day = {
+            "date": datetime.fromtimestamp(int(days[busiest]) * 86_400, tz=timezone.utc).date().isoformat(),
+            "plays": int(day_plays[busiest]),
+            "minutes": int(play_ms[day_codes == busiest].sum() // 60_000),
+        }
+
+    new_track_counts = counts * np.array([track["track_id"] not in known_tracks for track in tracks], dtype=bool)
+    new_artists = [artist_id for artist_id, code in artists.items() if artist_counts[code] and artist_id not in known_artists]
+
+    return {
+        "total_plays": int(len(played_ms)),
+        "total_minutes": int(play_ms.sum() // 60_000),
+        "top_tracks": [track_row(code) for code in _ranked(counts, limit)],
+        "top_artists": [
+            {**artist_rows[code], "play_count": int(artist_counts[code])} for code in _ranked(artist_counts, limit)
+        ],
+        "top_albums": [
+            {**album_rows[code], "play_count": int(album_counts[code])} for code in _ranked(album_counts, limit)
+        ],
+        "busiest_day": busiest_day,
+        "new_tracks": int(np.count_nonzero(new_track_counts)),
+        "new_artists": len(new_artists),
+        "top_new_tracks": [track_row(code) for code in _ranked(new_track_counts, limit)],
+    }
+
+
+# The worker process's database, opened by _init_worker()
+_worker_db = None
+
+
+def _init_worker() -> None:
+    """ProcessPoolExecutor initializer: every worker process opens its own MongoClient."""
+    global _worker_db
+    _worker_db = get_client()[settings.MONGO_DB_NAME]
+
+
+def review_user(user_id: str, year: int, limit: int = 10) -> Dict[str, Any]:
+    """
+    Read one user's year of plays, the catalog entries of its tracks and
+    what they played before, and build the report. Runs in a worker
+    process, on that process's own client.
+    """
+    played_ms, codes, values = play_arrays(read_year_plays(_worker_db, user_id, year))
+    track_ids = values["track_id"]
+    catalog = read_tracks(_worker_db, track_ids)
+    tracks = [track_info(track_id, catalog.get(track_id)) for track_id in track_ids]
+    known_tracks = set(read_known_keys(_worker_db, user_id, "track", year))
+    known_artists = set(read_known_keys(_worker_db, user_id, "artist", year))
+    return compute_year_review(played_ms, codes["track_id"], tracks, known_tracks, known_artists, limit)
+
+
+class YearReviewJob:
+    """
+    Precomputes year-in-review reports into `year_reviews`, so the endpoint
+    is a single document read.
+
+    Users are spread over a ProcessPoolExecutor, one user per task: each
+    worker process reads the user's plays with its own MongoClient and
+    builds the report (review_user()), so decoding a year of plays never
+    runs in the calling process; that only counts plays and stores the
+    results. Re-runs are incremental: a user's report is only recomputed
+    when the number of plays stored for the year differs from the count it
+    was built from (late plays from imports or the reconciler), unless
+    `full` is given.
+    """
+    def __init__(self, processes: int = 0, interval_seconds: float = 86400.0, limit: int = 10):
+        self._processes = processes or os.cpu_count() or 1
+        self._interval = interval_seconds
+        self._limit = limit
+
+    async def run(self, year: int, user_ids: Optional[List[str]] = None, full: bool = False) -> Dict[str, int]:
+        """Compute (or refresh) the `year` report of every user, or just `user_ids`."""
+        if user_ids is None:
+            user_ids = await review_user_ids()
+        stored = await get_review_counts(year)
+        stats = {"users": len(user_ids), "computed": 0, "unchanged": 0, "failed": 0}
+        loop = asyncio.get_running_loop()
+        # Counting the next users' plays overlaps with the current reviews
+        semaphore = asyncio.Semaphore(self._processes * 2)
+        # spawn: forking a process that holds MongoClient sockets isn't safe
+        pool = ProcessPoolExecutor(
+            self._processes, mp_context=multiprocessing.get_context("spawn"), initializer=_init_worker
+        )
+
+        async def one(user_id: str) -> None:
+            async with semaphore:
+                try:
+                    plays = await count_year_plays(user_id, year)
+                    if not full and stored.get(user_id, 0) == plays:
+                        stats["unchanged"] += 1
+                        return
+                    report = await loop.run_in_executor(pool, review_user, user_id, year, self._limit)
+                    await save_year_review(user_id, year, report, plays_counted=report["total_plays"])
+                    stats["computed"] += 1
+                except Exception as e:
+                    logger.exception(f"Year in review {year} failed for {user_id}: {e}")
+                    stats["failed"] += 1
+
+        try:
+            await asyncio.gather(*(one(user_id) for user_id in user_ids))
+        finally:
+            pool.shutdown(wait=False, cancel_futures=True)
+        logger.info(f"Year in review {year}: {stats}")
+        return stats
+
+    async def run_scheduler(self, is_leader: Callable[[], bool], startup_delay: float = 60.0) -> None:
+        """
+        Every `interval_seconds`, refresh this and last year's reports if
+        this worker is the leader. Runs until cancelled.
+        """
+        if self._interval <= 0:
+            return
+        # Let the coordinator see the other workers before electing a leader
+        await asyncio.sleep(startup_delay)
+        while True:
+            if is_leader():
+                this_year = datetime.now(timezone.utc).year
+                for year in (this_year - 1, this_year):
+                    try:
+                        await self.run(year)
+                    except Exception as e:
+                        logger.error(f"Year in review {year} run failed: {e}")
+            await asyncio.sleep(self._interval)
+
+
+year_review_job = YearReviewJob(
+    processes=settings.YEAR_REVIEW_PROCESSES,
+    interval_seconds=settings.YEAR_REVIEW_INTERVAL_SECONDS,
+)
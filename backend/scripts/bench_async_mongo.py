@@ -0,0 +1,149 @@
+"""
+Benchmark: history page throughput with the async driver vs blocking PyMongo calls on the event loop.
+
+What it does:
+- Seeds a throwaway user with --plays synthetic plays into `history`.
+- For each in-flight level (--levels, default 1..64), keeps that many
+  requests running for --seconds, each fetching a 50-play page:
+    async     app.crud.history.get_user_history (AsyncMongoClient), what the
+              routers do now
+    blocking  the same find() on the synchronous client, called straight
+              from the coroutine, as the routers used to
+- Prints requests/s, p50/p95 latency and the worst event-loop stall seen
+  by a 10 ms ticker. Async throughput should climb with the in-flight
+  count until the pool or server saturates; blocking stays flat because
+  only one query is ever on the wire.
+- Deletes the synthetic plays afterwards unless --keep is given.
+
+Run (from backend/):
+    python -m scripts.bench_async_mongo [--plays 20000] [--seconds 5] [--levels 1,4,16,64]
+
+Be sure to have your environment configured (MONGO_URI etc.); use a
+scratch MONGO_DB_NAME.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+from typing import Awaitable, Callable, Dict, List
+
+from app.db.database import init_db, close_db, init_async_db, close_async_db, get_history_collection
+from app.crud.history import get_user_history
+from app.services.track_catalog import track_catalog
+
+PAGE = 50
+
+
+def seed(user_id: str, plays: int, batch: int = 10_000) -> None:
+    history = get_history_collection()
+    end = datetime.now(timezone.utc)
+    rng = random.Random(42)
+    docs = []
+    for i in range(plays):
+        docs.append({
+            "user_id": user_id,
+            "track_id": f"track{rng.randrange(5_000):05d}",
+            "played_at": end - timedelta(seconds=rng.randrange(365 * 86_400), microseconds=i % 1000 * 1000),
+            "artist_ids": [f"artist{rng.randrange(1_000):04d}"],
+        })
+        if len(docs) >= batch:
+            history.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        history.insert_many(docs, ordered=False)
+
+
+def page_requests(user_id: str) -> Dict[str, Callable[[int], Awaitable[object]]]:
+    """One coroutine per mode fetching the page starting at play `offset`."""
+    async def async_page(offset: int) -> object:
+        return await get_user_history(user_id, skip=offset, limit=PAGE)
+
+    async def blocking_page(offset: int) -> object:
+        docs = list(
+            get_history_collection()
+            .find({"user_id": user_id}, {"user_id": 0})
+            .sort([("played_at", -1), ("_id", -1)])
+            .skip(offset)
+            .limit(PAGE)
+        )
+        return await track_catalog.attach(docs)
+
+    return {"async": async_page, "blocking": blocking_page}
+
+
+async def run_level(request: Callable[[int], Awaitable[object]], in_flight: int, seconds: float) -> Dict[str, float]:
+    latencies: List[float] = []
+    worst_stall = 0.0
+    deadline = time.perf_counter() + seconds
+    rng = random.Random(in_flight)
+
+    async def ticker() -> None:
+        nonlocal worst_stall
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            await asyncio.sleep(0.01)
+            worst_stall = max(worst_stall, (time.perf_counter() - start - 0.01) * 1_000)
+
+    async def worker() -> None:
+        while time.perf_counter() < deadline:
+            start = time.perf_counter()
+            # One of the first 20 pages, like users paging back through recent plays
+            await request(rng.randrange(20) * PAGE)
+            latencies.append((time.perf_counter() - start) * 1_000)
+
+    await asyncio.gather(ticker(), *(worker() for _ in range(in_flight)))
+    latencies.sort()
+    return {
+        "rps": len(latencies) / seconds,
+        "p50": statistics.median(latencies),
+        "p95": latencies[min(len(latencies) - 1, int(round(0.95 * (len(latencies) - 1))))],
+        "stall": worst_stall,
+    }
+
+
+async def run(args, user_id: str) -> None:
+    await init_async_db()
+    try:
+        requests = page_requests(user_id)
+        # Warm the track catalog and the server's cache for both modes
+        for request in requests.values():
+            await request(0)
+        print(f"{args.plays} plays, {PAGE}-play pages, {args.seconds:.0f}s per level")
+        print(f"  {'in flight':>9} {'mode':<9} {'req/s':>9} {'p50 ms':>8} {'p95 ms':>8} {'loop stall ms':>14}")
+        for level in args.levels:
+            for mode, request in requests.items():
+                r = await run_level(request, level, args.seconds)
+                print(f"  {level:>9} {mode:<9} {r['rps']:9.0f} {r['p50']:8.1f} {r['p95']:8.1f} {r['stall']:14.1f}")
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=20_000)
+    parser.add_argument("--seconds", type=float, default=5.0)
+    parser.add_argument(
+        "--levels", default="1,2,4,8,16,32,64",
+        type=lambda s: [int(n) for n in s.split(",")], help="comma-separated in-flight request counts",
+    )
+    parser.add_argument("--keep", action="store_true", help="leave the synthetic plays in place")
+    args = parser.parse_args()
+
+    init_db()
+    user_id = f"bench-async-{uuid.uuid4().hex[:8]}"
+    try:
+        seed(user_id, args.plays)
+        asyncio.run(run(args, user_id))
+        return 0
+    finally:
+        if not args.keep:
+            get_history_collection().delete_many({"user_id": user_id})
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,120 @@
+"""
+Benchmark: request latency while the background poller stalls on a slow upstream.
+
+What it does:
+- Serves a trivial FastAPI route in-process (httpx ASGITransport, same event loop
+  as the app would use).
+- Runs a fake poller that calls a blocking "Spotify" function which sleeps for
+  `--upstream-delay` seconds, the way spotipy blocks on a slow response.
+- Fires requests at a fixed rate for a fixed time and reports p50/p99/max latency for three
+  scenarios: no poller, poller calling spotipy inline (the old behaviour), and
+  poller going through app.services.spotify_client.run_blocking.
+
+Run (from backend/): python -m scripts.bench_event_loop_latency
+
+No MongoDB or Spotify credentials are needed, but the usual settings must be
+resolvable (e.g. from .env) because app.config is imported.
+"""
+import argparse
+import asyncio
+import statistics
+import time
+
+import httpx
+from fastapi import FastAPI
+
+from app.services.spotify_client import run_blocking, shutdown_executors
+
+
+def slow_upstream(delay: float) -> dict:
+    """Stand-in for a spotipy call stuck on a slow Spotify response."""
+    time.sleep(delay)
+    return {"is_playing": False}
+
+
+async def fake_poller(mode: str, delay: float, concurrency: int) -> None:
+    async def poll_loop():
+        while True:
+            if mode == "inline":
+                slow_upstream(delay)
+            else:
+                await run_blocking(slow_upstream, delay, background=True)
+            await asyncio.sleep(0.05)
+
+    await asyncio.gather(*(poll_loop() for _ in range(concurrency)))
+
+
+def build_app() -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/ping")
+    async def ping():
+        return {"ok": True}
+
+    return app
+
+
+async def measure(mode: str, args: argparse.Namespace) -> list[float]:
+    app = build_app()
+    poller = None
+    if mode != "none":
+        poller = asyncio.create_task(fake_poller(mode, args.upstream_delay, args.poller_concurrency))
+        # Let the poller get going before measuring
+        await asyncio.sleep(0.05)
+
+    latencies: list[float] = []
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench") as client:
+        async def one_request(scheduled: float):
+            r = await client.get("/ping")
+            r.raise_for_status()
+            # Measure from when the request was due, not when the blocked
+            # loop finally got around to sending it
+            latencies.append((time.perf_counter() - scheduled) * 1_000)
+
+        interval = 1 / args.rate
+        next_send = time.perf_counter()
+        deadline = next_send + args.duration
+        pending = []
+        while next_send < deadline:
+            while next_send <= time.perf_counter() and next_send < deadline:
+                pending.append(asyncio.create_task(one_request(next_send)))
+                next_send += interval
+            await asyncio.sleep(max(next_send - time.perf_counter(), 0))
+        await asyncio.gather(*pending)
+
+    if poller is not None:
+        poller.cancel()
+        try:
+            await poller
+        except asyncio.CancelledError:
+            pass
+    return latencies
+
+
+def report(mode: str, latencies: list[float]) -> None:
+    latencies.sort()
+    p50 = statistics.median(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{mode:>10}: p50={p50:8.2f}ms  p99={p99:8.2f}ms  max={latencies[-1]:8.2f}ms  n={len(latencies)}")
+
+
+async def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--duration", type=float, default=3.0, help="seconds of load per scenario")
+    parser.add_argument("--rate", type=float, default=100.0, help="requests per second")
+    parser.add_argument("--upstream-delay", type=float, default=0.5, help="seconds each fake Spotify call blocks")
+    parser.add_argument("--poller-concurrency", type=int, default=4, help="concurrent fake polls")
+    args = parser.parse_args()
+
+    print(
+        f"{args.duration:.0f}s of requests @ {args.rate:.0f}/s, upstream delay {args.upstream_delay}s, "
+        f"{args.poller_concurrency} concurrent polls"
+    )
+    for mode in ("none", "inline", "executor"):
+        report(mode, await measure(mode, args))
+    shutdown_executors()
+
+
+if __name__ == "__main__":
+    asyncio.run(main())
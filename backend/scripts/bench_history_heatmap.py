@@ -0,0 +1,110 @@
+"""
+Benchmark: heatmap and play-series latency for a synthetic heavy user.
+
+What it does:
+- Seeds a throwaway user with --plays synthetic plays (default 1M) spread
+  over the last --years years, directly into `history`.
+- Calls app.crud.heatmap.get_heatmap and get_play_series (day/week/month)
+  --runs times each, in a non-UTC timezone, and reports p50/p95/max
+  latency against the --p95-budget-ms target (non-zero exit if exceeded).
+- Deletes the synthetic plays afterwards unless --keep is given.
+
+Run (from backend/):
+    python -m scripts.bench_history_heatmap [--plays 1000000] [--runs 30] [--tz Europe/Paris]
+
+Be sure to have your environment configured (MONGO_URI etc.); use a
+scratch MONGO_DB_NAME, the seeding writes a million documents.
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import sys
+import time
+import uuid
+from datetime import datetime, timezone, timedelta
+
+from app.db.database import init_db, close_db, init_async_db, close_async_db, get_history_collection
+from app.crud.heatmap import get_heatmap, get_play_series
+
+
+def seed(user_id: str, plays: int, years: float, batch: int = 10_000) -> None:
+    history = get_history_collection()
+    end = datetime.now(timezone.utc)
+    span = int(years * 365 * 86_400)
+    rng = random.Random(42)
+    start = time.perf_counter()
+    docs = []
+    for i in range(plays):
+        played_at = end - timedelta(seconds=rng.randrange(span), microseconds=i % 1000 * 1000)
+        docs.append({
+            "user_id": user_id,
+            "track_id": f"track{rng.randrange(20_000):05d}",
+            "played_at": played_at,
+            "artist_ids": [f"artist{rng.randrange(2_000):04d}"],
+        })
+        if len(docs) >= batch:
+            history.insert_many(docs, ordered=False)
+            docs = []
+    if docs:
+        history.insert_many(docs, ordered=False)
+    print(f"Seeded {plays} plays in {time.perf_counter() - start:.1f}s")
+
+
+async def measure(label: str, fn, runs: int, budget_ms: float) -> bool:
+    await fn()  # warm the cache / plan
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        await fn()
+        samples.append((time.perf_counter() - start) * 1_000)
+    samples.sort()
+    p50 = statistics.median(samples)
+    p95 = samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+    ok = p95 <= budget_ms
+    print(f"  {label:<16} p50 {p50:8.1f} ms   p95 {p95:8.1f} ms   max {samples[-1]:8.1f} ms   {'ok' if ok else 'OVER BUDGET'}")
+    return ok
+
+
+async def run(args, user_id: str) -> bool:
+    await init_async_db()
+    try:
+        results = [
+            await measure("heatmap", lambda: get_heatmap(user_id, tz=args.tz), args.runs, args.p95_budget_ms),
+        ]
+        for unit in ("day", "week", "month"):
+            results.append(await measure(
+                f"series ({unit})",
+                lambda unit=unit: get_play_series(user_id, unit=unit, tz=args.tz),
+                args.runs,
+                args.p95_budget_ms,
+            ))
+        return all(results)
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=1_000_000)
+    parser.add_argument("--years", type=float, default=5.0)
+    parser.add_argument("--runs", type=int, default=30)
+    parser.add_argument("--tz", default="Europe/Paris")
+    parser.add_argument("--p95-budget-ms", type=float, default=1_000.0)
+    parser.add_argument("--keep", action="store_true", help="leave the synthetic plays in place")
+    args = parser.parse_args()
+
+    init_db()
+    user_id = f"bench-heatmap-{uuid.uuid4().hex[:8]}"
+    try:
+        seed(user_id, args.plays, args.years)
+        print(f"{args.plays} plays, tz={args.tz}, {args.runs} runs each")
+        return 0 if asyncio.run(run(args, user_id)) else 1
+    finally:
+        if not args.keep:
+            get_history_collection().delete_many({"user_id": user_id})
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,135 @@
+"""
+Benchmark: history and top-N response serialization, per-row models vs trusted rows.
+
+What it does:
+- Builds synthetic plays shaped like what get_user_history has after the
+  catalog join (and top-track rows shaped like the rollups' output).
+- Serves them through two in-process FastAPI routes per payload:
+    models   a Pydantic model per row (HttpUrl parsing included), returned
+             against response_model, the way the routers used to
+    trusted  HistoryOut-shaped dicts encoded with ORJSONResponse, the way
+             they do now
+- Times --runs requests of --rows rows each (default 200 and 10,000) through
+  TestClient and prints p50/p95 and the speed-up, after checking that both
+  routes return the same JSON.
+
+No database needed. Run (from backend/):
+    python -m scripts.bench_history_serialization [--rows 200,10000] [--runs 30]
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Any, Callable, Dict, List
+
+from bson import ObjectId
+from fastapi import FastAPI
+from fastapi.responses import ORJSONResponse
+from fastapi.testclient import TestClient
+
+from app.crud.history import _history_row
+from app.schemas.history import HistoryOut, TopTrackOut
+
+
+def make_plays(rows: int) -> List[Dict[str, Any]]:
+    rng = random.Random(rows)
+    # Mongo hands back naive UTC datetimes with millisecond precision
+    end = datetime.now(timezone.utc).replace(tzinfo=None, microsecond=0)
+    plays = []
+    for i in range(rows):
+        artists = rng.randrange(1, 3)
+        plays.append({
+            "_id": ObjectId(),
+            "track_id": f"track{rng.randrange(20_000):05d}",
+            "played_at": end - timedelta(seconds=i * 200, milliseconds=rng.randrange(1000)),
+            "artist_ids": [f"artist{rng.randrange(2_000):04d}" for _ in range(artists)],
+            "track_name": f"Track {i}",
+            "artist_name": ", ".join(f"Artist {n}" for n in range(artists)),
+            "artist_names": [f"Artist {n}" for n in range(artists)],
+            "album_name": f"Album {rng.randrange(5_000)}",
+            "album_image": f"https://i.scdn.co/image/ab67616d0000b273{rng.getrandbits(96):024x}",
+            "duration_ms": rng.randrange(120_000, 300_000),
+        })
+    return plays
+
+
+def make_top_tracks(rows: int) -> List[Dict[str, Any]]:
+    return [
+        {
+            "track_id": play["track_id"],
+            "play_count": rows - i,
+            "track_name": play["track_name"],
+            "artist_name": play["artist_name"],
+            "album_name": play["album_name"],
+            "album_image": play["album_image"],
+        }
+        for i, play in enumerate(make_plays(rows))
+    ]
+
+
+def build_app(plays: List[Dict[str, Any]], top: List[Dict[str, Any]]) -> FastAPI:
+    app = FastAPI()
+
+    @app.get("/models/history", response_model=List[HistoryOut])
+    async def history_models():
+        return [HistoryOut(**doc) for doc in plays]
+
+    @app.get("/trusted/history", response_model=List[HistoryOut])
+    async def history_trusted():
+        return ORJSONResponse([_history_row(doc) for doc in plays])
+
+    @app.get("/models/top", response_model=List[TopTrackOut])
+    async def top_models():
+        return [TopTrackOut(**doc) for doc in top]
+
+    @app.get("/trusted/top", response_model=List[TopTrackOut])
+    async def top_trusted():
+        return ORJSONResponse(top)
+
+    return app
+
+
+def measure(fn: Callable[[], object], runs: int) -> List[float]:
+    fn()  # warm up
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000)
+    return sorted(samples)
+
+
+def p95(samples: List[float]) -> float:
+    return samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--rows", default="200,10000", type=lambda s: [int(n) for n in s.split(",")])
+    parser.add_argument("--runs", type=int, default=30)
+    args = parser.parse_args()
+
+    status = 0
+    print(f"  {'payload':<8} {'rows':>6} {'models p50/p95 ms':>20} {'trusted p50/p95 ms':>20} {'speed-up':>9}")
+    for rows in args.rows:
+        client = TestClient(build_app(make_plays(rows), make_top_tracks(rows)))
+        for payload in ("history", "top"):
+            old, new = client.get(f"/models/{payload}"), client.get(f"/trusted/{payload}")
+            if old.json() != new.json():
+                print(f"  {payload:<8} {rows:>6} responses differ!", file=sys.stderr)
+                status = 1
+                continue
+            models = measure(lambda: client.get(f"/models/{payload}"), args.runs)
+            trusted = measure(lambda: client.get(f"/trusted/{payload}"), args.runs)
+            print(
+                f"  {payload:<8} {rows:>6} {statistics.median(models):9.1f} / {p95(models):8.1f}"
+                f" {statistics.median(trusted):9.1f} / {p95(trusted):8.1f}"
+                f" {statistics.median(models) / statistics.median(trusted):8.1f}x"
+            )
+    return status
+
+
+if __name__ == "__main__":
+    sys.exit(main())
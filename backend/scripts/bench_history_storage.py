@@ -0,0 +1,170 @@
+"""
+Benchmark: history range and top-N queries, ordinary vs time-series storage.
+
+What it does:
+- Seeds the same synthetic plays (--users users, --plays in total, over the
+  last --years years) into two scratch collections, one per layout, each
+  with the indexes init_db would give it.
+- Runs the queries the API makes against history for one heavy user, --runs
+  times per layout, and prints p50/p95 side by side:
+  a 30-day range scan, the newest page, a keyset page from the middle,
+  the all-time and 90-day top tracks ($group per track_id) and the heatmap.
+- Prints storage and index size of both collections (collStats), then drops
+  them unless --keep is given.
+
+Run (from backend/):
+    python -m scripts.bench_history_storage [--plays 1000000] [--users 20] [--runs 20]
+
+Be sure to have your environment configured (MONGO_URI etc.); use a
+scratch MONGO_DB_NAME. Time-series collections need MongoDB 6.0+.
+"""
+import argparse
+import random
+import statistics
+import sys
+import time
+from datetime import datetime, timezone, timedelta
+from typing import Callable, Dict, List
+
+from app.config import settings
+from app.db.database import get_client, close_db, create_timeseries_history, ensure_history_indexes
+from app.crud.rollup import TRACK_COUNT_STAGES
+
+LAYOUTS = ("standard", "timeseries")
+
+
+def seed(collections: Dict[str, object], users: int, plays: int, years: float, batch: int = 10_000) -> str:
+    """Insert the same plays into every collection; returns the heaviest user's id."""
+    end = datetime.now(timezone.utc)
+    span = int(years * 365 * 86_400)
+    rng = random.Random(42)
+    # Skewed so one user has a large share of the plays
+    weights = [1 / (i + 1) for i in range(users)]
+    start = time.perf_counter()
+    docs: List[dict] = []
+
+    def flush() -> None:
+        for coll in collections.values():
+            coll.insert_many([dict(d) for d in docs], ordered=False)
+
+    for i in range(plays):
+        user = rng.choices(range(users), weights)[0]
+        docs.append({
+            "user_id": f"bench-user-{user:03d}",
+            "track_id": f"track{rng.randrange(20_000):05d}",
+            "played_at": end - timedelta(seconds=rng.randrange(span), microseconds=i % 1000 * 1000),
+            "artist_ids": [f"artist{rng.randrange(2_000):04d}"],
+        })
+        if len(docs) >= batch:
+            flush()
+            docs = []
+    if docs:
+        flush()
+    print(f"Seeded {plays} plays into each layout in {time.perf_counter() - start:.1f}s")
+    return "bench-user-000"
+
+
+def queries(coll, user_id: str) -> Dict[str, Callable[[], object]]:
+    now = datetime.now(timezone.utc)
+    plays = coll.count_documents({"user_id": user_id})
+    middle = next(
+        coll.find({"user_id": user_id}, {"played_at": 1}).sort([("played_at", -1), ("_id", -1)]).skip(plays // 2).limit(1)
+    )
+
+    def top(since=None):
+        match: dict = {"user_id": user_id}
+        if since:
+            match["played_at"] = {"$gte": since}
+        return list(coll.aggregate(
+            [{"$match": match}] + TRACK_COUNT_STAGES + [{"$sort": {"count": -1}}, {"$limit": 10}]
+        ))
+
+    return {
+        "range 30d": lambda: list(coll.find(
+            {"user_id": user_id, "played_at": {"$gte": now - timedelta(days=30), "$lt": now}},
+            {"_id": 0, "track_id": 1, "played_at": 1},
+        )),
+        "newest page": lambda: list(
+            coll.find({"user_id": user_id}).sort([("played_at", -1), ("_id", -1)]).limit(50)
+        ),
+        "middle page": lambda: list(
+            coll.find({
+                "user_id": user_id,
+                "played_at": {"$lte": middle["played_at"]},
+                "$or": [{"played_at": {"$lt": middle["played_at"]}}, {"_id": {"$lt": middle["_id"]}}],
+            }).sort([("played_at", -1), ("_id", -1)]).limit(50)
+        ),
+        "top all-time": lambda: top(),
+        "top 90d": lambda: top(now - timedelta(days=90)),
+        "heatmap": lambda: list(coll.aggregate([
+            {"$match": {"user_id": user_id}},
+            {"$project": {"_id": 0, "played_at": 1}},
+            {"$group": {
+                "_id": {"dow": {"$isoDayOfWeek": "$played_at"}, "hour": {"$hour": "$played_at"}},
+                "plays": {"$sum": 1},
+            }},
+        ])),
+    }
+
+
+def measure(fn, runs: int) -> List[float]:
+    fn()  # warm the cache / plan
+    samples = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        samples.append((time.perf_counter() - start) * 1_000)
+    return sorted(samples)
+
+
+def p95(samples: List[float]) -> float:
+    return samples[min(len(samples) - 1, int(round(0.95 * (len(samples) - 1))))]
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--plays", type=int, default=1_000_000)
+    parser.add_argument("--users", type=int, default=20)
+    parser.add_argument("--years", type=float, default=5.0)
+    parser.add_argument("--runs", type=int, default=20)
+    parser.add_argument("--keep", action="store_true", help="leave the scratch collections in place")
+    args = parser.parse_args()
+
+    db = get_client()[settings.MONGO_DB_NAME]
+    names = {layout: f"bench_history_{layout}" for layout in LAYOUTS}
+    try:
+        for name in names.values():
+            db.drop_collection(name)
+        create_timeseries_history(db, names["timeseries"])
+        collections = {layout: db[name] for layout, name in names.items()}
+        for layout, coll in collections.items():
+            ensure_history_indexes(coll, timeseries=layout == "timeseries")
+
+        user_id = seed(collections, args.users, args.plays, args.years)
+        print(f"{collections['standard'].count_documents({'user_id': user_id})} plays for {user_id}, {args.runs} runs each")
+        print(f"  {'query':<14} {'standard p50/p95 ms':>22} {'timeseries p50/p95 ms':>24}")
+        per_layout = {layout: queries(coll, user_id) for layout, coll in collections.items()}
+        for label in per_layout["standard"]:
+            cells = []
+            for layout in LAYOUTS:
+                samples = measure(per_layout[layout][label], args.runs)
+                cells.append(f"{statistics.median(samples):9.1f} / {p95(samples):8.1f}")
+            print(f"  {label:<14} {cells[0]:>22} {cells[1]:>24}")
+
+        print("Storage")
+        for layout, name in names.items():
+            stats = db.command("collStats", name)
+            print(
+                f"  {layout:<10} storage {stats.get('storageSize', 0) / (1 << 20):8.1f} MB"
+                f"   indexes {stats.get('totalIndexSize', 0) / (1 << 20):8.1f} MB"
+            )
+        return 0
+    finally:
+        if not args.keep:
+            for name in names.values():
+                db.drop_collection(name)
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,105 @@
+"""
+Microbenchmark: LastSavedTracker at 100k tracked users.
+
+What it does:
+- Compares the previous dict-of-dicts tracker (full-scan cleanup, reproduced
+  below as LegacyTracker) with app.services.spotify_services.LastSavedTracker
+  (__slots__ entries + expiry min-heap).
+- Times set/get for N users, cleanup_expired when 1% of entries have expired,
+  and a snapshot/restore round trip, and reports retained memory.
+
+Run (from backend/): python -m scripts.bench_last_saved_tracker [--users 100000]
+"""
+import argparse
+import gc
+import time
+import tracemalloc
+
+from app.services.spotify_services import LastSavedTracker
+
+
+class LegacyTracker:
+    """The tracker as it was before the heap/__slots__ rewrite."""
+    def __init__(self, ttl_seconds: int = 3600):
+        self._data = {}
+        self._ttl = ttl_seconds
+
+    def get(self, user_id):
+        entry = self._data.get(user_id)
+        if entry is None:
+            return None
+        if time.time() - entry["timestamp"] > self._ttl:
+            self._data.pop(user_id, None)
+            return None
+        return entry["track_id"]
+
+    def set(self, user_id, track_id):
+        self._data[user_id] = {"track_id": track_id, "timestamp": time.time()}
+
+    def cleanup_expired(self):
+        now = time.time()
+        expired = [uid for uid, entry in self._data.items() if now - entry["timestamp"] > self._ttl]
+        for uid in expired:
+            self._data.pop(uid, None)
+        return len(expired)
+
+
+def timed(label: str, fn) -> float:
+    start = time.perf_counter()
+    result = fn()
+    elapsed = (time.perf_counter() - start) * 1_000
+    print(f"  {label:<28} {elapsed:9.2f} ms" + (f"  ({result})" if result is not None else ""))
+    return elapsed
+
+
+def build(cls, user_ids, track_ids):
+    gc.collect()
+    tracemalloc.start()
+    tracker = cls(ttl_seconds=3600)
+    for uid, tid in zip(user_ids, track_ids):
+        tracker.set(uid, tid)
+    current, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return tracker, current
+
+
+def age_fraction(tracker, user_ids, fraction: float) -> None:
+    """Make the first `fraction` of users look expired."""
+    expired = user_ids[: int(len(user_ids) * fraction)]
+    if isinstance(tracker, LegacyTracker):
+        for uid in expired:
+            tracker._data[uid]["timestamp"] -= 7200
+    else:
+        for uid in expired:
+            tracker._put(uid, tracker._data[uid].track_id, time.time() - 1)
+
+
+def bench(cls, user_ids, track_ids) -> None:
+    print(cls.__name__)
+    tracker, mem = build(cls, user_ids, track_ids)
+    print(f"  {'retained memory':<28} {mem / 1_048_576:9.2f} MiB")
+    timed("set (all users)", lambda: [tracker.set(u, t) for u, t in zip(user_ids, track_ids)] and None)
+    timed("get (all users)", lambda: [tracker.get(u) for u in user_ids] and None)
+    age_fraction(tracker, user_ids, 0.01)
+    timed("cleanup_expired (1% expired)", tracker.cleanup_expired)
+    timed("cleanup_expired (none due)", tracker.cleanup_expired)
+    if isinstance(tracker, LastSavedTracker):
+        upserts = []
+        timed("drain_dirty", lambda: upserts.extend(tracker.drain_dirty()[0]) or len(upserts))
+        timed("restore (fresh tracker)", lambda: LastSavedTracker().restore(upserts))
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--users", type=int, default=100_000)
+    args = parser.parse_args()
+
+    user_ids = [f"user{i:08d}" for i in range(args.users)]
+    track_ids = [f"{i:022d}" for i in range(args.users)]
+    print(f"{args.users} tracked users")
+    bench(LegacyTracker, user_ids, track_ids)
+    bench(LastSavedTracker, user_ids, track_ids)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,112 @@
+"""
+Maintenance script: backfill and verify the per-user history rollups.
+
+What it does:
+- backfill: rebuilds the `history_rollups` documents of every user (or just
+  --user) from the raw `history` collection. Run it once after deploying
+  rollups, and again if verify reports drift.
+- verify: for each user, compares the top-N tracks, artists and albums
+  served from the rollups with the raw $group aggregation over history,
+  both all-time and for a --since-days window (which exercises the
+  partial-day path). Exits non-zero if any play count disagrees.
+
+Run (from backend/):
+    python -m scripts.history_rollups backfill [--user USER_ID]
+    python -m scripts.history_rollups verify [--user USER_ID] [--limit 50] [--since-days 7]
+
+Be sure to have your environment configured (MONGO_URI etc.).
+"""
+import argparse
+import asyncio
+import sys
+from datetime import datetime, timezone, timedelta
+from typing import List, Optional
+
+from app.db.database import init_db, close_db, init_async_db, close_async_db, get_history_collection
+from app.crud.rollup import ROLLUP_KINDS, raw_top, rebuild_rollups, top_from_rollups
+
+
+def user_ids(only: Optional[str] = None) -> List[str]:
+    if only:
+        return [only]
+    return sorted(get_history_collection().distinct("user_id"))
+
+
+async def backfill(args) -> int:
+    for uid in user_ids(args.user):
+        written = await rebuild_rollups(uid)
+        print(f"{uid}: {written} rollup documents")
+    return 0
+
+
+async def compare(uid: str, kind: str, limit: int, since: Optional[datetime] = None) -> List[str]:
+    """Describe every disagreement between rollups and raw history."""
+    key = ROLLUP_KINDS[kind]["output_key"]
+    # Ties at the cut-off may be ordered differently, so compare the counts
+    # of the rollup's top-N against the full raw aggregation.
+    raw = {e[key]: e["play_count"] for e in await raw_top(uid, kind, start=since)}
+    rolled = await top_from_rollups(uid, kind, limit, since)
+    problems = []
+    for entry in rolled:
+        expected = raw.get(entry[key], 0)
+        if entry["play_count"] != expected:
+            problems.append(f"{kind} {entry[key]!r}: rollup {entry['play_count']} != raw {expected}")
+
+    raw_counts = sorted(raw.values(), reverse=True)[:limit]
+    rolled_counts = [e["play_count"] for e in rolled]
+    if rolled_counts != raw_counts:
+        problems.append(f"{kind} top-{limit} counts differ: rollup {rolled_counts} != raw {raw_counts}")
+    return problems
+
+
+async def verify(args) -> int:
+    since = datetime.now(timezone.utc) - timedelta(days=args.since_days)
+    failures = 0
+    for uid in user_ids(args.user):
+        problems = []
+        for kind in ROLLUP_KINDS:
+            problems += await compare(uid, kind, args.limit)
+            problems += [f"(since) {p}" for p in await compare(uid, kind, args.limit, since)]
+        if problems:
+            failures += 1
+            print(f"{uid}: MISMATCH")
+            for problem in problems:
+                print(f"  {problem}")
+        else:
+            print(f"{uid}: ok")
+    print(f"{failures} user(s) with mismatching rollups")
+    return 1 if failures else 0
+
+
+async def run(args) -> int:
+    await init_async_db()
+    try:
+        return await args.func(args)
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    sub = parser.add_subparsers(dest="command", required=True)
+
+    p_backfill = sub.add_parser("backfill", help="rebuild rollups from raw history")
+    p_backfill.add_argument("--user", help="only this user_id")
+    p_backfill.set_defaults(func=backfill)
+
+    p_verify = sub.add_parser("verify", help="compare rollups with the raw aggregation")
+    p_verify.add_argument("--user", help="only this user_id")
+    p_verify.add_argument("--limit", type=int, default=50)
+    p_verify.add_argument("--since-days", type=float, default=7.0)
+    p_verify.set_defaults(func=verify)
+
+    args = parser.parse_args()
+    init_db()
+    try:
+        return asyncio.run(run(args))
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
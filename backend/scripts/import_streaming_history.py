@@ -0,0 +1,103 @@
+"""
+Import script: load Spotify "extended streaming history" exports into history.
+
+What it does:
+- Stream-parses each Streaming_History_Audio_*.json file (never loading a
+  file whole) and maps its records to history documents, skipping podcasts,
+  local files and plays shorter than --min-ms-played.
+- Leaves out plays already stored, matching the poller's and reconciler's
+  plays of the same track within a couple of minutes, fills artist ids in
+  from the `tracks` catalog, and bulk-upserts the rest, --parallel
+  batches at a time, printing progress as batches land. Run
+  scripts/migrate_artist_ids.py afterwards for tracks the catalog lacked.
+- Remembers how far each file got (per user and file name); re-running
+  resumes after the last fully written record unless --restart is given.
+
+Run (from backend/):
+    python -m scripts.import_streaming_history USER_ID Streaming_History_Audio_*.json
+
+Be sure to have your environment configured (MONGO_URI etc.).
+"""
+import argparse
+import asyncio
+import os
+import sys
+import time
+from typing import AsyncIterator
+
+from app.db.database import init_db, close_db, init_async_db, close_async_db
+from app.services.history_import import HistoryImporter
+
+
+async def read_chunks(path: str, chunk_size: int = 1 << 20) -> AsyncIterator[bytes]:
+    with open(path, "rb") as f:
+        while True:
+            chunk = await asyncio.to_thread(f.read, chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+
+async def import_file(args, path: str) -> None:
+    source = os.path.basename(path)
+    start = time.monotonic()
+
+    def report(progress) -> None:
+        rate = progress["records_done"] / max(time.monotonic() - start, 1e-6)
+        print(
+            f"  {source}: {progress['records_done']} records, "
+            f"{progress['imported']} imported, {progress['duplicates']} duplicates, "
+            f"{progress['skipped']} skipped ({rate:,.0f} records/s)",
+            flush=True,
+        )
+
+    importer = HistoryImporter(
+        args.user_id,
+        source,
+        batch_size=args.batch_size,
+        parallelism=args.parallel,
+        min_ms_played=args.min_ms_played,
+        on_progress=report,
+    )
+    result = await importer.run(read_chunks(path), resume=not args.restart)
+    if result["resumed_from"]:
+        print(f"  (resumed after record {result['resumed_from']})")
+    print(
+        f"{source}: done in {time.monotonic() - start:.1f}s - {result['records_total']} records, "
+        f"{result['imported']} imported, {result['duplicates']} duplicates, {result['skipped']} skipped"
+    )
+
+
+async def main_async(args) -> int:
+    await init_async_db()
+    try:
+        for path in args.files:
+            try:
+                await import_file(args, path)
+            except ValueError as e:
+                print(f"{path}: invalid streaming history file: {e}", file=sys.stderr)
+                return 1
+        return 0
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("user_id", help="Spotify user id the plays belong to")
+    parser.add_argument("files", nargs="+", help="Streaming_History_Audio_*.json files")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    parser.add_argument("--parallel", type=int, default=4, help="bulk upserts in flight at once")
+    parser.add_argument("--min-ms-played", type=int, default=30_000)
+    parser.add_argument("--restart", action="store_true", help="ignore saved progress and start from the top")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        return asyncio.run(main_async(args))
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
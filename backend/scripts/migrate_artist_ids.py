@@ -0,0 +1,139 @@
+"""
+Migration script: give every stored play its artist_ids / artist_names arrays.
+
+What it does:
+- Finds the distinct track_ids of `history` plays and `tracks` catalog
+  entries whose artist_ids are missing or empty: plays recorded before
+  plays carried artist arrays, and plays imported from streaming history
+  exports.
+- Looks the tracks up 50 at a time with the app's client credentials
+  (no user token needed), sets artist_ids on every matching play and
+  artist_ids / artist_names on the catalog entries, with bulk writes.
+- Rebuilds the history rollups of the affected users, so top artists are
+  counted per artist id instead of per joined "A, B" name string.
+
+Run (from backend/): python -m scripts.migrate_artist_ids [--dry-run] [--skip-rollups]
+
+Be sure to have your environment configured (MONGO_URI, SPOTIPY_CLIENT_ID,
+SPOTIPY_CLIENT_SECRET etc.). Safe to re-run; it only touches plays that
+still lack artist ids.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Dict, List, Tuple
+
+import spotipy
+from spotipy.oauth2 import SpotifyClientCredentials
+from pymongo import UpdateMany, UpdateOne
+
+from app.config import settings
+from app.db.database import (
+    init_db, close_db, init_async_db, close_async_db, get_history_collection, get_tracks_collection,
+)
+from app.crud.rollup import rebuild_rollups
+from app.crud.track import artist_refs
+
+MISSING = {"$or": [{"artist_ids": {"$exists": False}}, {"artist_ids": {"$size": 0}}]}
+
+
+def missing_track_ids(coll) -> List[str]:
+    pipeline = [
+        {"$match": {**MISSING, "track_id": {"$type": "string"}}},
+        {"$group": {"_id": "$track_id"}},
+    ]
+    return [doc["_id"] for doc in coll.aggregate(pipeline, allowDiskUse=True)]
+
+
+def missing_catalog_ids(tracks) -> List[str]:
+    return tracks.distinct("_id", MISSING)
+
+
+def lookup_artists(sp: spotipy.Spotify, track_ids: List[str]) -> Dict[str, Tuple[List[str], List[str]]]:
+    found: Dict[str, Tuple[List[str], List[str]]] = {}
+    for i in range(0, len(track_ids), 50):
+        chunk = track_ids[i:i + 50]
+        for track in sp.tracks(chunk).get("tracks", []):
+            if track and track.get("id"):
+                found[track["id"]] = artist_refs(track.get("artists", []))
+        if (i // 50) % 20 == 19:
+            print(f"  looked up {min(i + 50, len(track_ids))}/{len(track_ids)} tracks", flush=True)
+    return found
+
+
+def apply(coll, artists: Dict[str, Tuple[List[str], List[str]]], batch: int = 500) -> int:
+    """Set artist_ids on the plays of `coll` (history keeps no artist names)."""
+    ops = [
+        UpdateMany({"track_id": track_id, **MISSING}, {"$set": {"artist_ids": ids}})
+        for track_id, (ids, _) in artists.items()
+        if ids
+    ]
+    return _bulk(coll, ops, batch)
+
+
+def apply_catalog(tracks, artists: Dict[str, Tuple[List[str], List[str]]], batch: int = 500) -> int:
+    ops = [
+        UpdateOne({"_id": track_id, **MISSING}, {"$set": {"artist_ids": ids, "artist_names": names}})
+        for track_id, (ids, names) in artists.items()
+        if ids
+    ]
+    return _bulk(tracks, ops, batch)
+
+
+def _bulk(coll, ops, batch: int) -> int:
+    modified = 0
+    for i in range(0, len(ops), batch):
+        modified += coll.bulk_write(ops[i:i + batch], ordered=False).modified_count
+    return modified
+
+
+async def rebuild_all_rollups(users: List[str]) -> None:
+    await init_async_db()
+    try:
+        for user_id in users:
+            await rebuild_rollups(user_id)
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report what would change")
+    parser.add_argument("--skip-rollups", action="store_true", help="don't rebuild history rollups afterwards")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        history, tracks = get_history_collection(), get_tracks_collection()
+        track_ids = sorted(set(missing_track_ids(history)) | set(missing_catalog_ids(tracks)))
+        users = history.distinct("user_id", MISSING)
+        print(f"{len(track_ids)} tracks on plays without artist ids ({len(users)} users)")
+        if args.dry_run or not track_ids:
+            return 0
+
+        sp = spotipy.Spotify(
+            auth_manager=SpotifyClientCredentials(
+                client_id=settings.SPOTIPY_CLIENT_ID,
+                client_secret=settings.SPOTIPY_CLIENT_SECRET,
+            ),
+            retries=10,
+            status_forcelist=(429, 500, 502, 503, 504),
+        )
+        start = time.monotonic()
+        artists = lookup_artists(sp, track_ids)
+        print(f"Resolved {len(artists)}/{len(track_ids)} tracks in {time.monotonic() - start:.1f}s")
+
+        print(f"history: {apply(history, artists)} plays updated")
+        print(f"tracks: {apply_catalog(tracks, artists)} catalog entries updated")
+
+        if not args.skip_rollups:
+            asyncio.run(rebuild_all_rollups(users))
+            print(f"Rebuilt history rollups for {len(users)} users")
+        return 0
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
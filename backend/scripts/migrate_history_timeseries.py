@@ -0,0 +1,145 @@
+"""
+Migration script: switch `history` between an ordinary and a time-series collection.
+
+What it does (--to timeseries, the default):
+- Renames the current `history` to `history_standard_backup`.
+- Creates `history` as a time-series collection (user_id metaField,
+  played_at timeField) and copies every play into it, user by user in
+  played_at order so buckets fill up in sequence.
+- Builds the time-series indexes and compares document counts.
+- Drops the backup only with --drop-backup.
+
+With --to standard it copies the time-series plays into a new ordinary
+collection (with history_unique_play, which drops any duplicates the
+time-series layout let through), then replaces `history` with it.
+Time-series collections can't be renamed, hence the copy-then-swap.
+
+Run (from backend/): python -m scripts.migrate_history_timeseries [--to timeseries|standard]
+
+Stop the app (and its poller) first, and set HISTORY_STORAGE to match
+before starting it again. Run scripts/migrate_track_catalog.py first:
+compact plays make much smaller buckets. Requires MongoDB 6.0+.
+"""
+import argparse
+import sys
+import time
+
+from pymongo.errors import BulkWriteError
+
+from app.config import settings
+from app.db.database import (
+    get_client, close_db, is_timeseries, create_timeseries_history, ensure_history_indexes,
+)
+
+BACKUP = "history_standard_backup"
+RESTORE = "history_standard_restore"
+
+
+def copy_plays(source, target, batch: int, ignore_duplicates: bool = False) -> int:
+    """Copy every play of `source` into `target`; returns how many were inserted."""
+    copied = batches = 0
+    docs = []
+    start = time.monotonic()
+
+    def flush() -> int:
+        try:
+            return len(target.insert_many(docs, ordered=False).inserted_ids)
+        except BulkWriteError as e:
+            errors = e.details.get("writeErrors", [])
+            if not ignore_duplicates or any(err.get("code") != 11000 for err in errors):
+                raise
+            return e.details.get("nInserted", 0)
+
+    cursor = source.find({}, batch_size=batch).sort([("user_id", 1), ("played_at", 1)])
+    for doc in cursor:
+        docs.append(doc)
+        if len(docs) >= batch:
+            copied += flush()
+            docs = []
+            batches += 1
+            if batches % 50 == 0:
+                rate = copied / max(time.monotonic() - start, 1e-6)
+                print(f"  {copied:,} plays copied ({rate:,.0f}/s)", flush=True)
+    if docs:
+        copied += flush()
+    return copied
+
+
+def to_timeseries(db, batch: int, drop_backup: bool) -> int:
+    names = db.list_collection_names()
+    if BACKUP in names and "history" in names and not is_timeseries(db, "history"):
+        print(f"Both history and an older {BACKUP} exist; drop or rename {BACKUP} first", file=sys.stderr)
+        return 1
+    if BACKUP not in names:
+        db["history"].rename(BACKUP)
+    elif "history" in names:
+        # An earlier run stopped part-way through the copy: start over
+        db.drop_collection("history")
+    create_timeseries_history(db, "history")
+
+    source, target = db[BACKUP], db["history"]
+    copied = copy_plays(source, target, batch)
+    print("Building indexes...")
+    ensure_history_indexes(target, timeseries=True)
+
+    expected = source.count_documents({})
+    print(f"Copied {copied:,} of {expected:,} plays into the time-series history")
+    if copied != expected:
+        print(f"Counts differ; keeping {BACKUP}", file=sys.stderr)
+        return 1
+    if drop_backup:
+        db.drop_collection(BACKUP)
+        print(f"Dropped {BACKUP}")
+    else:
+        print(f"Kept the old collection as {BACKUP} (drop it once you're happy)")
+    return 0
+
+
+def to_standard(db, batch: int) -> int:
+    db.drop_collection(RESTORE)
+    target = db[RESTORE]
+    ensure_history_indexes(target, timeseries=False)
+    source = db["history"]
+    copied = copy_plays(source, target, batch, ignore_duplicates=True)
+    total = source.count_documents({})
+    print(f"Copied {copied:,} plays ({total - copied:,} duplicates dropped)")
+    db.drop_collection("history")
+    target.rename("history")
+    print("Replaced history with the ordinary collection")
+    return 0
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--to", choices=("timeseries", "standard"), default="timeseries")
+    parser.add_argument("--batch-size", type=int, default=10_000)
+    parser.add_argument("--drop-backup", action="store_true", help="drop history_standard_backup after a clean copy")
+    args = parser.parse_args()
+
+    db = get_client()[settings.MONGO_DB_NAME]
+    try:
+        current = "timeseries" if is_timeseries(db, "history") else "standard"
+        # A backup next to a time-series history that holds fewer plays
+        # means an earlier run stopped part-way through the copy
+        resuming = (
+            args.to == "timeseries"
+            and BACKUP in db.list_collection_names()
+            and db["history"].count_documents({}) < db[BACKUP].count_documents({})
+        )
+        if current == args.to and not resuming:
+            print(f"history is already stored as {args.to}")
+            return 0
+
+        start = time.monotonic()
+        if args.to == "timeseries":
+            status = to_timeseries(db, args.batch_size, args.drop_backup)
+        else:
+            status = to_standard(db, args.batch_size)
+        print(f"Done in {time.monotonic() - start:.1f}s; set HISTORY_STORAGE={args.to} before restarting the app")
+        return status
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
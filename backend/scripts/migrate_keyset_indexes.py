@@ -0,0 +1,66 @@
+"""
+Migration script: rebuild the play-time indexes with their _id tiebreaker.
+
+What it does:
+- Checks `history.history_user_time` and `songs.songs_username_time`
+  against the keys the app now expects (user, played_at, _id), which
+  keyset pagination needs to serve pages straight off the index.
+- Drops and recreates each one whose keys differ, and creates any that
+  are missing. Indexes that already match are left alone.
+
+The app only ever calls create_index, and logs a warning at startup
+while an old definition is still in place, so this runs once per
+database instead of in every worker.
+
+Run (from backend/): python -m scripts.migrate_keyset_indexes [--dry-run]
+
+Be sure to have your environment configured (MONGO_URI etc.). Safe to
+re-run. Reads on a collection fall back to scanning while its index
+rebuilds, so run it at a quiet time on large databases.
+"""
+import argparse
+import sys
+import time
+
+from app.db.database import (
+    init_db, close_db, get_history_collection, get_songs_collection,
+    HISTORY_USER_TIME_KEYS, SONGS_USERNAME_TIME_KEYS,
+)
+
+
+def rebuild(collection, keys, name: str, dry_run: bool) -> bool:
+    """Make index `name` have `keys`. Returns True if it was (or would be) changed."""
+    existing = collection.index_information().get(name)
+    wanted = [(field, int(direction)) for field, direction in keys]
+    if existing is not None and [(f, int(d)) for f, d in existing["key"]] == wanted:
+        print(f"{collection.name}.{name}: up to date")
+        return False
+
+    action = "create" if existing is None else f"rebuild (was {existing['key']})"
+    if dry_run:
+        print(f"{collection.name}.{name}: would {action}")
+        return True
+    start = time.monotonic()
+    if existing is not None:
+        collection.drop_index(name)
+    collection.create_index(keys, name=name)
+    print(f"{collection.name}.{name}: {action} in {time.monotonic() - start:.1f}s")
+    return True
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only report the indexes that would change")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        rebuild(get_history_collection(), HISTORY_USER_TIME_KEYS, "history_user_time", args.dry_run)
+        rebuild(get_songs_collection(), SONGS_USERNAME_TIME_KEYS, "songs_username_time", args.dry_run)
+        return 0
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
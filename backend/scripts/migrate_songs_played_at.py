@@ -0,0 +1,75 @@
+"""
+Migration script: store every `songs` played_at as a BSON date.
+
+What it does:
+- Finds `songs` documents whose played_at is still an ISO string (rows
+  synced before played_at was stored as a date, and currently-playing
+  rows written before that path stored dates too).
+- Parses each one as UTC (naive strings are assumed to be UTC already)
+  and writes it back as a date with bulk updates, so played_at has a
+  single type and the recently-played pages sort and page on it alone.
+- Strings that can't be parsed are reported and left alone.
+
+Run (from backend/): python -m scripts.migrate_songs_played_at [--dry-run] [--batch-size 1000]
+
+Be sure to have your environment configured (MONGO_URI etc.). Safe to
+re-run; it only touches rows whose played_at is still a string. Run it
+before deploying the code that pages songs on dates only.
+"""
+import argparse
+import sys
+import time
+from typing import Tuple
+
+from pymongo import UpdateOne
+
+from app.crud.track import parse_played_at
+from app.db.database import init_db, close_db, get_songs_collection
+
+STRING_PLAYED_AT = {"played_at": {"$type": "string"}}
+
+
+def migrate(songs, batch_size: int) -> Tuple[int, int]:
+    converted = skipped = 0
+    ops = []
+    for doc in songs.find(STRING_PLAYED_AT, {"played_at": 1}, batch_size=batch_size):
+        try:
+            played_at = parse_played_at(doc["played_at"])
+        except ValueError:
+            print(f"Skipping {doc['_id']}: unrecognized played_at {doc['played_at']!r}")
+            skipped += 1
+            continue
+        # Match the string too, so a row rewritten meanwhile is left alone
+        ops.append(UpdateOne({"_id": doc["_id"], "played_at": doc["played_at"]}, {"$set": {"played_at": played_at}}))
+        if len(ops) >= batch_size:
+            converted += songs.bulk_write(ops, ordered=False).modified_count
+            ops = []
+    if ops:
+        converted += songs.bulk_write(ops, ordered=False).modified_count
+    return converted, skipped
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only count the rows that would change")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        songs = get_songs_collection()
+        pending = songs.count_documents(STRING_PLAYED_AT)
+        print(f"{pending} songs rows with a string played_at")
+        if args.dry_run or not pending:
+            return 0
+
+        start = time.monotonic()
+        converted, skipped = migrate(songs, args.batch_size)
+        print(f"Converted {converted} rows, skipped {skipped} in {time.monotonic() - start:.1f}s")
+        return 1 if skipped else 0
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,172 @@
+"""
+Migration script: move per-play track metadata into the shared `tracks` catalog.
+
+What it does:
+- Prints the size of `history`, `songs` and `tracks` (documents, data size,
+  average document, storage and index size) from collStats.
+- Builds a catalog entry per track_id from the metadata already stored on
+  `history` and `songs` plays (entries carrying artist ids win), skipping
+  tracks the catalog already has.
+- Unsets track_name / artist_name / album_name / album_image (and the other
+  catalog fields) from every play, in batches of --batch-size, leaving
+  history as (user_id, track_id, played_at, artist_ids).
+- With --compact, runs the `compact` command on both collections so
+  WiredTiger hands the freed space back, then prints the sizes again
+  next to the before numbers.
+
+Run (from backend/): python -m scripts.migrate_track_catalog [--dry-run] [--compact]
+
+Be sure to have your environment configured (MONGO_URI etc.). Safe to
+re-run: the app reads plays through the catalog, and plays still carrying
+their own fields are shown as stored. Without --compact the data size
+drops right away but storage size only once MongoDB reuses the space.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import Any, Dict, List
+
+from app.db.database import (
+    init_db, close_db, init_async_db, close_async_db, get_history_collection, get_songs_collection, get_tracks_collection,
+)
+from app.crud.track_catalog import TRACK_DEFAULTS, catalog_entry, upsert_tracks
+
+# Catalog fields dropped from each collection's plays
+HISTORY_FIELDS = [field for field in TRACK_DEFAULTS if field != "artist_ids"]
+SONGS_FIELDS = list(TRACK_DEFAULTS)
+STATS = ("count", "size", "avgObjSize", "storageSize", "totalIndexSize")
+
+
+def _mb(n: float) -> str:
+    return f"{n / (1 << 20):10.1f} MB"
+
+
+def collection_stats(db, names: List[str]) -> Dict[str, Dict[str, Any]]:
+    stats = {}
+    for name in names:
+        raw = db.command("collStats", name)
+        stats[name] = {key: raw.get(key, 0) for key in STATS}
+    return stats
+
+
+def print_stats(label: str, stats: Dict[str, Dict[str, Any]]) -> None:
+    print(label)
+    for name, s in stats.items():
+        print(
+            f"  {name:<8} {s['count']:>11,} docs  data {_mb(s['size'])}  avg {s['avgObjSize']:>6,.0f} B"
+            f"  storage {_mb(s['storageSize'])}  indexes {_mb(s['totalIndexSize'])}"
+        )
+
+
+def print_change(before: Dict[str, Dict[str, Any]], after: Dict[str, Dict[str, Any]]) -> None:
+    print("Change")
+    for name in before:
+        parts = []
+        for key in ("size", "storageSize", "totalIndexSize"):
+            old, new = before[name][key], after[name][key]
+            parts.append(f"{key} {old / new:5.1f}x smaller" if new else f"{key} {_mb(old).strip()} -> 0")
+        print(f"  {name:<8} " + ", ".join(parts))
+
+
+async def build_catalog(coll, batch: int) -> int:
+    """Upsert a catalog entry for every track with metadata on `coll`'s plays."""
+    pipeline = [
+        {"$match": {"track_id": {"$type": "string"}, "track_name": {"$exists": True}}},
+        {"$group": {
+            "_id": "$track_id",
+            "track_name": {"$first": "$track_name"},
+            "artist_name": {"$first": "$artist_name"},
+            # Compared ids first, so a play with artist ids beats one without
+            # and names stay parallel to the ids they came with
+            "artists": {"$max": {"ids": "$artist_ids", "names": "$artist_names"}},
+            "album_name": {"$first": "$album_name"},
+            "album_image": {"$max": "$album_image"},
+            "duration_ms": {"$max": "$duration_ms"},
+        }},
+    ]
+    known = set(get_tracks_collection().distinct("_id", {"artist_ids.0": {"$exists": True}}))
+    pending: Dict[str, Dict[str, Any]] = {}
+    written = 0
+    for doc in coll.aggregate(pipeline, allowDiskUse=True):
+        if doc["_id"] in known:
+            continue
+        artists = doc.pop("artists") or {}
+        doc["artist_ids"] = artists.get("ids") or []
+        doc["artist_names"] = artists.get("names") or []
+        pending[doc["_id"]] = catalog_entry(doc)
+        if len(pending) >= batch:
+            await upsert_tracks(pending)
+            written += len(pending)
+            pending = {}
+    if pending:
+        await upsert_tracks(pending)
+        written += len(pending)
+    return written
+
+
+def strip_plays(coll, fields: List[str], batch: int) -> int:
+    """Unset the catalog fields from every play of `coll`, batch by batch."""
+    query = {"$or": [{field: {"$exists": True}} for field in fields]}
+    unset = {field: "" for field in fields}
+    modified = batches = 0
+    ids: List[Any] = []
+    for doc in coll.find(query, {"_id": 1}).sort("_id", 1):
+        ids.append(doc["_id"])
+        if len(ids) >= batch:
+            modified += coll.update_many({"_id": {"$in": ids}}, {"$unset": unset}).modified_count
+            ids = []
+            batches += 1
+            if batches % 20 == 0:
+                print(f"  {coll.name}: {modified:,} plays stripped", flush=True)
+    if ids:
+        modified += coll.update_many({"_id": {"$in": ids}}, {"$unset": unset}).modified_count
+    return modified
+
+
+async def build_catalogs(colls, batch: int) -> None:
+    await init_async_db()
+    try:
+        for coll in colls:
+            print(f"{coll.name}: {await build_catalog(coll, batch):,} catalog entries written")
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--dry-run", action="store_true", help="only print the current sizes")
+    parser.add_argument("--batch-size", type=int, default=5000)
+    parser.add_argument("--compact", action="store_true", help="run `compact` on history and songs afterwards")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        history, songs = get_history_collection(), get_songs_collection()
+        db = history.database
+        names = [history.name, songs.name, get_tracks_collection().name]
+        before = collection_stats(db, names)
+        print_stats("Before", before)
+        if args.dry_run:
+            return 0
+
+        start = time.monotonic()
+        asyncio.run(build_catalogs((history, songs), args.batch_size))
+        print(f"history: {strip_plays(history, HISTORY_FIELDS, args.batch_size):,} plays compacted")
+        print(f"songs: {strip_plays(songs, SONGS_FIELDS, args.batch_size):,} plays compacted")
+        if args.compact:
+            for coll in (history, songs):
+                db.command("compact", coll.name)
+                print(f"{coll.name}: compacted")
+        print(f"Done in {time.monotonic() - start:.1f}s")
+
+        after = collection_stats(db, names)
+        print_stats("After", after)
+        print_change(before, after)
+        return 0
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
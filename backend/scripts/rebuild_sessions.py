@@ -0,0 +1,64 @@
+"""
+Maintenance script: rebuild the stored listening sessions from raw history.
+
+What it does:
+- For every user in `history` (or just --user), replaces their
+  `listening_sessions` documents with sessions recomputed from all their
+  plays, splitting wherever the silence after a track is longer than
+  SESSION_GAP_MINUTES.
+
+Run it once after deploying sessions (plays saved before that have none),
+after changing SESSION_GAP_MINUTES, and whenever the incremental update
+logged failures. Run (from backend/):
+    python -m scripts.rebuild_sessions [--user USER_ID]
+
+Be sure to have your environment configured (MONGO_URI etc.). Plays saved
+while a user is being rebuilt can be missed; stop the app first or run
+the script again afterwards.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from typing import List, Optional
+
+from app.config import settings
+from app.db.database import init_db, close_db, init_async_db, close_async_db, get_history_collection
+from app.crud.session import rebuild_sessions
+
+
+def user_ids(only: Optional[str] = None) -> List[str]:
+    if only:
+        return [only]
+    return sorted(get_history_collection().distinct("user_id"))
+
+
+async def rebuild(users: List[str], batch_size: int) -> None:
+    await init_async_db()
+    try:
+        for uid in users:
+            start = time.monotonic()
+            written = await rebuild_sessions(uid, batch_size)
+            print(f"{uid}: {written} sessions ({time.monotonic() - start:.1f}s)")
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--user", help="only this user_id")
+    parser.add_argument("--batch-size", type=int, default=1000)
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        users = user_ids(args.user)
+        print(f"Rebuilding sessions for {len(users)} user(s), gap {settings.SESSION_GAP_MINUTES:g} minutes")
+        asyncio.run(rebuild(users, args.batch_size))
+        return 0
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,67 @@
+"""
+Batch script: compute the year-in-review reports outside the app.
+
+What it does:
+- Runs the same job the leader worker schedules every
+  YEAR_REVIEW_INTERVAL_SECONDS: for every user (or just --user), one of
+  --processes worker processes reads the year's plays over its own
+  MongoClient and computes top tracks / artists / albums, total minutes,
+  the busiest day and new discoveries; one `year_reviews` document is
+  stored per user.
+- Skips users whose stored report was built from as many plays as they
+  have now for that year, unless --full is given.
+- Prints how many reports were computed, unchanged or failed, and the
+  throughput.
+
+Run (from backend/):
+    python -m scripts.year_in_review [--year 2025] [--user USER_ID] [--full] [--processes 8]
+
+Be sure to have your environment configured (MONGO_URI etc.). New
+discoveries come from the history rollups; run scripts/history_rollups.py
+backfill first if they were never built.
+"""
+import argparse
+import asyncio
+import sys
+import time
+from datetime import datetime, timezone
+
+from app.config import settings
+from app.db.database import init_db, close_db, init_async_db, close_async_db
+from app.services.year_review import YearReviewJob
+
+
+async def run(args) -> int:
+    await init_async_db()
+    try:
+        job = YearReviewJob(processes=args.processes)
+        start = time.monotonic()
+        stats = await job.run(args.year, user_ids=[args.user] if args.user else None, full=args.full)
+        elapsed = time.monotonic() - start
+        print(
+            f"{args.year}: {stats['computed']} computed, {stats['unchanged']} unchanged, "
+            f"{stats['failed']} failed of {stats['users']} users in {elapsed:.1f}s "
+            f"({stats['users'] / max(elapsed, 1e-6):.1f} users/s)"
+        )
+        return 1 if stats["failed"] else 0
+    finally:
+        await close_async_db()
+
+
+def main() -> int:
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--year", type=int, default=datetime.now(timezone.utc).year)
+    parser.add_argument("--user", help="only this user_id")
+    parser.add_argument("--full", action="store_true", help="recompute reports even if no plays arrived since")
+    parser.add_argument("--processes", type=int, default=settings.YEAR_REVIEW_PROCESSES, help="0 = one per CPU core")
+    args = parser.parse_args()
+
+    init_db()
+    try:
+        return asyncio.run(run(args))
+    finally:
+        close_db()
+
+
+if __name__ == "__main__":
+    sys.exit(main())
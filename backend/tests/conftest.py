@@ -0,0 +1,41 @@
+import os
+import uuid
+
+import pytest
+
+# Settings are read when app.config is imported, so set them first. Tests
+# never talk to Spotify; MongoDB tests only run against TEST_MONGO_URI.
+os.environ.setdefault("MONGO_URI", os.environ.get("TEST_MONGO_URI", "mongodb://localhost:27017"))
+os.environ.setdefault("MONGO_DB_NAME", f"spotifetch_test_{uuid.uuid4().hex[:8]}")
+os.environ.setdefault("SPOTIPY_CLIENT_ID", "test-client-id")
+os.environ.setdefault("SPOTIPY_CLIENT_SECRET", "test-client-secret")
+os.environ.setdefault("SPOTIPY_REDIRECT_URI", "http://localhost:8000/auth/callback")
+os.environ.setdefault("LASTFM_KEY", "test-lastfm-key")
+os.environ.setdefault("SESSION_SECRET", "test-session-secret-of-at-least-32-chars")
+
+
+@pytest.fixture
+def anyio_backend():
+    return "asyncio"
+
+
+@pytest.fixture
+async def mongo_db():
+    """
+    A throwaway database on TEST_MONGO_URI with the app's collections and
+    indexes, on both clients. Tests using it are skipped without one.
+    """
+    if not os.environ.get("TEST_MONGO_URI"):
+        pytest.skip("set TEST_MONGO_URI to run MongoDB tests")
+
+    from app.config import settings
+    from app.db import database
+
+    database.init_db()
+    await database.init_async_db()
+    try:
+        yield database
+    finally:
+        await database.close_async_db()
+        database.get_client().drop_database(settings.MONGO_DB_NAME)
+        database.close_db()
@@ -0,0 +1,39 @@
+import logging
+
+import pytest
+from pymongo.errors import OperationFailure
+
+from app.db import database
+
+
+class FakeCollection:
+    name = "history"
+
+    def __init__(self, error=None):
+        self.error = error
+        self.calls = []
+
+    def create_index(self, keys, name, **kwargs):
+        self.calls.append(("create_index", name))
+        if self.error:
+            raise self.error
+
+    def drop_index(self, name):
+        self.calls.append(("drop_index", name))
+
+
+def test_changed_index_is_left_for_the_migration(caplog):
+    collection = FakeCollection(OperationFailure("Index already exists with different keys", code=86))
+
+    with caplog.at_level(logging.WARNING):
+        database._create_index_or_warn(collection, database.HISTORY_USER_TIME_KEYS, name="history_user_time")
+
+    assert collection.calls == [("create_index", "history_user_time")]
+    assert "migrate_keyset_indexes" in caplog.text
+
+
+def test_other_index_failures_are_raised():
+    collection = FakeCollection(OperationFailure("not authorized", code=13))
+
+    with pytest.raises(OperationFailure):
+        database._create_index_or_warn(collection, database.HISTORY_USER_TIME_KEYS, name="history_user_time")
@@ -0,0 +1,81 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.crud.heatmap import get_heatmap, get_play_series
+from app.crud.history import save_history_many
+from app.schemas.history import HistoryCreate
+
+pytestmark = pytest.mark.anyio
+
+USER = "heatmap-user"
+
+
+def utc(*args) -> datetime:
+    return datetime(*args, tzinfo=timezone.utc)
+
+
+# 2025-03-10 is a Monday; New York moved to UTC-4 the day before
+PLAYS = [
+    utc(2025, 3, 10, 3, 30),   # Sunday 23:30 in New York
+    utc(2025, 3, 10, 5, 0),    # Monday 01:00 in New York
+    utc(2025, 3, 12, 15, 0),   # Wednesday 11:00 in New York
+]
+
+
+@pytest.fixture
+async def plays(mongo_db):
+    await save_history_many([
+        HistoryCreate(
+            user_id=USER, track_id=f"t{i}", track_name="Track", artist_name="Artist",
+            album_name="Album", album_image=None, played_at=played_at,
+        )
+        for i, played_at in enumerate(PLAYS)
+    ])
+
+
+def cells(heatmap):
+    return {
+        (heatmap.days[dow], hour): plays
+        for dow, row in enumerate(heatmap.matrix)
+        for hour, plays in enumerate(row)
+        if plays
+    }
+
+
+async def test_heatmap_buckets_in_the_requested_timezone(plays):
+    assert cells(await get_heatmap(USER)) == {("Mon", 3): 1, ("Mon", 5): 1, ("Wed", 15): 1}
+
+    heatmap = await get_heatmap(USER, tz="America/New_York")
+    assert cells(heatmap) == {("Sun", 23): 1, ("Mon", 1): 1, ("Wed", 11): 1}
+    assert heatmap.total_plays == 3
+
+
+async def test_play_series_truncates_to_local_days_and_fills_gaps(plays):
+    series = await get_play_series(USER, unit="day", tz="America/New_York")
+
+    assert [(b.start.date().isoformat(), b.plays) for b in series.buckets] == [
+        ("2025-03-09", 1), ("2025-03-10", 1), ("2025-03-11", 0), ("2025-03-12", 1),
+    ]
+    # Each bucket starts at local midnight, on both sides of the DST change
+    assert all(b.start.hour == 0 for b in series.buckets)
+    assert [b.start.utcoffset().total_seconds() / 3600 for b in series.buckets[:2]] == [-5, -4]
+
+
+async def test_play_series_weeks_start_on_monday(plays):
+    series = await get_play_series(USER, unit="week", tz="America/New_York")
+
+    assert [(b.start.date().isoformat(), b.plays) for b in series.buckets] == [
+        ("2025-03-03", 1), ("2025-03-10", 2),
+    ]
+
+
+async def test_empty_range_has_no_plays(plays):
+    since, until = utc(2025, 3, 13), utc(2025, 3, 20)
+
+    heatmap = await get_heatmap(USER, tz="America/New_York", since=since, until=until)
+    assert heatmap.total_plays == 0
+    assert heatmap.matrix == [[0] * 24 for _ in range(7)]
+
+    series = await get_play_series(USER, tz="America/New_York", since=since, until=until)
+    assert series.buckets == []
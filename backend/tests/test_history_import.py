@@ -0,0 +1,116 @@
+import json
+
+import pytest
+
+from app.services import history_import
+from app.services.history_import import HistoryImporter, JsonArrayStream
+
+DOCUMENT = (
+    '[12, -3.5e2, 1234567, true, false, null, "caf\\u00e9 \\"quoted\\"", [1, [2, 3]],'
+    ' {"ms_played": 183000, "nested": {"a": [10, 20]}}, 0, 42]'
+)
+
+
+def parse(chunks):
+    parser = JsonArrayStream()
+    items = []
+    for chunk in chunks:
+        items.extend(parser.feed(chunk))
+    parser.close()
+    return items
+
+
+def test_numbers_split_across_chunks_are_not_cut_short():
+    assert parse(["[12", "34]"]) == [1234]
+    assert parse(["[1", "2, -", "3.", "5e", "2]"]) == [12, -350.0]
+
+
+@pytest.mark.parametrize("split", range(1, len(DOCUMENT)))
+def test_any_split_point_gives_the_same_elements(split):
+    assert parse([DOCUMENT[:split], DOCUMENT[split:]]) == json.loads(DOCUMENT)
+
+
+def test_one_character_at_a_time():
+    assert parse(list(DOCUMENT)) == json.loads(DOCUMENT)
+
+
+def test_elements_are_returned_as_soon_as_they_are_complete():
+    parser = JsonArrayStream()
+    assert parser.feed('[{"a": 1}, 2') == [{"a": 1}]
+    assert parser.feed(", 3") == [2]
+    assert parser.feed("]") == [3]
+    parser.close()
+
+
+@pytest.mark.parametrize("chunks", [["[1, 2"], ["[12"], ["[1, 2,"], ['[{"a": 1']])
+def test_truncated_arrays_are_rejected(chunks):
+    with pytest.raises(ValueError):
+        parse(chunks)
+
+
+@pytest.mark.parametrize("text", ['{"a": 1}', "[1 2]", "[1] 2"])
+def test_malformed_input_is_rejected(text):
+    with pytest.raises(ValueError):
+        parse([text])
+
+
+def record(i):
+    return {
+        "ts": f"2024-01-01T00:{i:02d}:00Z",
+        "ms_played": 100_000 + i,
+        "spotify_track_uri": f"spotify:track:t{i}",
+        "master_metadata_track_name": f"Café {i}",
+        "master_metadata_album_artist_name": "Artist",
+        "master_metadata_album_album_name": "Album",
+    }
+
+
+@pytest.fixture
+def importer_store(monkeypatch):
+    """Fake the importer's storage: a saved job to resume, and the plays written."""
+    store = {"job": None, "saved": [], "progress": []}
+
+    async def get_import_job(user_id, source):
+        return store["job"]
+
+    async def save_import_progress(user_id, source, progress):
+        store["progress"].append(dict(progress))
+
+    async def save_history_many(entries):
+        store["saved"].extend(entries)
+        return entries
+
+    async def get_play_times(user_id, start, end):
+        return {}
+
+    async def get_many(track_ids):
+        return {}
+
+    monkeypatch.setattr(history_import, "get_import_job", get_import_job)
+    monkeypatch.setattr(history_import, "save_import_progress", save_import_progress)
+    monkeypatch.setattr(history_import, "save_history_many", save_history_many)
+    monkeypatch.setattr(history_import, "get_play_times", get_play_times)
+    monkeypatch.setattr(history_import.track_catalog, "get_many", get_many)
+    return store
+
+
+async def byte_chunks(data: bytes, size: int):
+    for i in range(0, len(data), size):
+        yield data[i:i + size]
+
+
+@pytest.mark.anyio
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 10_000])
+async def test_import_resumes_after_the_recorded_offset(importer_store, chunk_size):
+    data = json.dumps([record(i) for i in range(10)], ensure_ascii=False).encode("utf-8")
+    importer_store["job"] = {"records_done": 4, "imported": 4, "duplicates": 0, "skipped": 0}
+    importer = HistoryImporter("u1", "export.json", batch_size=3, parallelism=2)
+
+    progress = await importer.run(byte_chunks(data, chunk_size))
+
+    assert [entry.track_id for entry in importer_store["saved"]] == [f"t{i}" for i in range(4, 10)]
+    assert importer_store["saved"][0].track_name == "Café 4"
+    assert progress["status"] == "done"
+    assert progress["records_total"] == 10
+    assert progress["records_done"] == 10
+    assert progress["imported"] == 10
@@ -0,0 +1,82 @@
+import pytest
+
+from app.services import poller as poller_module
+from app.services.poller import PlaybackPoller
+
+pytestmark = pytest.mark.anyio
+
+TOKEN = {"access_token": "access", "refresh_token": "refresh", "expires_at": 4_102_444_800}
+
+
+def playback(track_id: str) -> dict:
+    return {
+        "is_playing": True,
+        "timestamp": 1_735_732_800_123,
+        "progress_ms": 1_000,
+        "item": {
+            "id": track_id,
+            "name": f"Track {track_id}",
+            "duration_ms": 200_000,
+            "artists": [{"id": "a1", "name": "Artist One"}, {"id": "a2", "name": "Artist Two"}],
+            "album": {"name": "Album", "images": [{"url": "https://i.scdn.co/image/abc"}]},
+        },
+    }
+
+
+@pytest.fixture
+def spotify(monkeypatch):
+    """Fake playback, token store and ingest queue around one PlaybackPoller."""
+    state = {"playback": playback("t1"), "saved": []}
+
+    class FakeSpotify:
+        @classmethod
+        def from_token_info(cls, token_info, background=False, user_id=None):
+            return cls()
+
+        async def current_playback(self):
+            return state["playback"]
+
+    async def fresh_token(user_id):
+        return TOKEN
+
+    async def get_token(user_id):
+        return TOKEN
+
+    monkeypatch.setattr(poller_module, "AsyncSpotify", FakeSpotify)
+    monkeypatch.setattr(poller_module.token_store, "fresh_token", fresh_token)
+    monkeypatch.setattr(poller_module.token_store, "get", get_token)
+    monkeypatch.setattr(poller_module.coordinator, "owns", lambda user_id: True)
+    monkeypatch.setattr(poller_module.history_ingest, "put", state["saved"].append)
+    return state
+
+
+async def poll_once(poller: PlaybackPoller, user_id: str) -> None:
+    # _run_one releases the slot the scheduling loop acquired for it
+    await poller._semaphore.acquire()
+    await poller._run_one(user_id)
+
+
+async def test_changed_track_is_saved_with_artist_refs(spotify):
+    poller = PlaybackPoller()
+    await poll_once(poller, "u1")
+
+    assert len(spotify["saved"]) == 1
+    entry = spotify["saved"][0]
+    assert entry.track_id == "t1"
+    assert entry.artist_ids == ["a1", "a2"]
+    assert entry.artist_names == ["Artist One", "Artist Two"]
+    assert entry.artist_name == "Artist One, Artist Two"
+    assert entry.played_at.timestamp() == pytest.approx(1_735_732_800.123)
+    # A successful poll never backs off and keeps the user scheduled
+    assert "u1" not in poller._backoff
+    assert "u1" in poller._next_poll
+
+
+async def test_same_track_is_saved_once_and_next_change_again(spotify):
+    poller = PlaybackPoller()
+    await poll_once(poller, "u1")
+    await poll_once(poller, "u1")
+    spotify["playback"] = playback("t2")
+    await poll_once(poller, "u1")
+
+    assert [entry.track_id for entry in spotify["saved"]] == ["t1", "t2"]
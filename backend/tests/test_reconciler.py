@@ -0,0 +1,58 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.services import reconciler as reconciler_module
+from app.services.reconciler import RecentlyPlayedReconciler
+
+pytestmark = pytest.mark.anyio
+
+FINISHED = datetime(2025, 1, 1, 12, 0, tzinfo=timezone.utc)
+
+
+def song(track_id: str, finished: datetime) -> dict:
+    return {
+        "track_id": track_id,
+        "track_name": track_id,
+        "artist_name": "Artist",
+        "artist_ids": ["a1"],
+        "artist_names": ["Artist"],
+        "album_name": "Album",
+        "album_image": None,
+        "duration_ms": 180_000,
+        "played_at": finished,
+    }
+
+
+@pytest.fixture
+def synced(monkeypatch):
+    """Fake one recently-played sync returning two songs, one already recorded by the poller."""
+    queued = []
+
+    async def fresh_token(user_id):
+        return {"access_token": "access", "expires_at": 4_102_444_800}
+
+    async def sync_recently_played_db(sp, user_id):
+        return [song("t1", FINISHED), song("t2", FINISHED + timedelta(minutes=3))]
+
+    async def get_play_times(user_id, start, end):
+        # The poller saw t1 start about three minutes before it finished
+        return {"t1": [FINISHED - timedelta(minutes=3)]}
+
+    monkeypatch.setattr(reconciler_module.token_store, "fresh_token", fresh_token)
+    monkeypatch.setattr(reconciler_module, "sync_recently_played_db", sync_recently_played_db)
+    monkeypatch.setattr(reconciler_module, "get_play_times", get_play_times)
+    monkeypatch.setattr(reconciler_module.history_ingest, "put", queued.append)
+    return queued
+
+
+async def test_request_sync_backfills_on_a_worker_that_does_not_own_the_user(synced, monkeypatch):
+    # The sync advances the shared cursor, so the plays it passed must be
+    # back-filled here; the owner would never see them again
+    monkeypatch.setattr(reconciler_module.coordinator, "owns", lambda user_id: False)
+    reconciler = RecentlyPlayedReconciler()
+
+    await reconciler._reconcile_guarded("u1")
+
+    assert [entry.track_id for entry in synced] == ["t2"]
+    assert synced[0].played_at == FINISHED + timedelta(minutes=3)
@@ -0,0 +1,92 @@
+from datetime import datetime, timedelta, timezone
+
+import pytest
+
+from app.crud.history import save_history_many
+from app.crud.rollup import ROLLUP_KINDS, raw_top, rebuild_rollups, top_from_rollups
+from app.schemas.history import HistoryCreate
+
+pytestmark = pytest.mark.anyio
+
+USER = "rollup-user"
+MIDNIGHT = datetime(2025, 3, 11, tzinfo=timezone.utc)
+
+TRACKS = {
+    "t1": ("One", "Album A", [("a1", "Artist 1")]),
+    "t2": ("Two", "Album A", [("a1", "Artist 1"), ("a2", "Artist 2")]),
+    "t3": ("Three", "Album B", [("a3", "Artist 3")]),
+}
+
+# Plays either side of the day buckets' edges, plus a few whole days
+PLAYS = [
+    ("t1", MIDNIGHT - timedelta(hours=21)),
+    ("t3", MIDNIGHT - timedelta(days=1)),
+    ("t2", MIDNIGHT - timedelta(hours=6)),
+    ("t1", MIDNIGHT - timedelta(milliseconds=1)),
+    ("t2", MIDNIGHT),
+    ("t2", MIDNIGHT + timedelta(milliseconds=1)),
+    ("t3", MIDNIGHT + timedelta(hours=12)),
+    ("t1", MIDNIGHT + timedelta(days=1) - timedelta(milliseconds=1)),
+    ("t1", MIDNIGHT + timedelta(days=1)),
+    ("t2", MIDNIGHT + timedelta(days=2, hours=8)),
+]
+
+SINCES = [
+    None,
+    MIDNIGHT - timedelta(days=1),
+    MIDNIGHT - timedelta(milliseconds=1),
+    MIDNIGHT,
+    MIDNIGHT + timedelta(milliseconds=1),
+    MIDNIGHT + timedelta(hours=12),
+    MIDNIGHT + timedelta(days=3),
+]
+
+
+def play(track_id: str, played_at: datetime) -> HistoryCreate:
+    name, album, artists = TRACKS[track_id]
+    return HistoryCreate(
+        user_id=USER,
+        track_id=track_id,
+        track_name=name,
+        artist_name=", ".join(n for _, n in artists),
+        album_name=album,
+        album_image=None,
+        played_at=played_at,
+        artist_ids=[a for a, _ in artists],
+        artist_names=[n for _, n in artists],
+    )
+
+
+def counts(kind: str, entries):
+    key = ROLLUP_KINDS[kind]["output_key"]
+    return {entry[key]: entry["play_count"] for entry in entries}
+
+
+async def assert_rollups_match_raw():
+    for kind in ROLLUP_KINDS:
+        for since in SINCES:
+            expected = counts(kind, await raw_top(USER, kind, start=since))
+            actual = counts(kind, await top_from_rollups(USER, kind, limit=50, since=since))
+            assert actual == expected, (kind, since)
+
+
+async def test_rollups_written_with_plays_match_raw_history(mongo_db):
+    await save_history_many([play(track_id, at) for track_id, at in PLAYS])
+
+    await assert_rollups_match_raw()
+
+
+async def test_rollups_count_each_play_once(mongo_db):
+    await save_history_many([play(track_id, at) for track_id, at in PLAYS])
+    await save_history_many([play(track_id, at) for track_id, at in PLAYS[:4]])
+
+    assert counts("track", await top_from_rollups(USER, "track")) == {"t1": 4, "t2": 4, "t3": 2}
+    await assert_rollups_match_raw()
+
+
+async def test_rebuilt_rollups_match_raw_history(mongo_db):
+    await save_history_many([play(track_id, at) for track_id, at in PLAYS])
+    await mongo_db.get_async_history_rollups_collection().delete_many({"user_id": USER})
+
+    assert await rebuild_rollups(USER) > 0
+    await assert_rollups_match_raw()
@@ -0,0 +1,26 @@
+import gc
+
+import requests
+
+from app.services import spotify_client
+from app.services.spotify_client import AsyncSpotify
+
+
+def test_clients_share_one_session_until_shutdown(monkeypatch):
+    closed = []
+    monkeypatch.setattr(requests.Session, "close", lambda self: closed.append(self))
+    monkeypatch.setattr(spotify_client, "_session", None)
+
+    first, second = AsyncSpotify("token-1"), AsyncSpotify("token-2")
+    session = first._sp._session
+    assert second._sp._session is session
+
+    # spotipy closes its session when a client is collected; the shared one stays open
+    del first, second
+    gc.collect()
+    assert closed == []
+
+    spotify_client.shutdown_executors()
+    assert closed == [session]
+    assert AsyncSpotify("token-3")._sp._session is not session
+    spotify_client.shutdown_executors()
@@ -0,0 +1,85 @@
+import time
+
+import pytest
+
+from app.services import spotify_client
+from app.services import token_store as token_store_module
+from app.services.token_store import TokenStore
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.fixture
+def spotify(monkeypatch):
+    """Fake Spotify's refresh endpoint: each call returns a token valid for an hour."""
+    calls = []
+
+    async def governed(func, refresh_token, **kwargs):
+        calls.append(refresh_token)
+        return {
+            "access_token": f"access-{len(calls)}",
+            "refresh_token": refresh_token,
+            "expires_at": int(time.time()) + 3600,
+        }
+
+    monkeypatch.setattr(spotify_client, "_governed", governed)
+    monkeypatch.setattr(spotify_client, "_refreshed_tokens", {})
+    monkeypatch.setattr(spotify_client, "_refreshes_in_flight", {})
+    return calls
+
+
+async def test_recent_refresh_is_reused_only_while_it_outlives_min_ttl(spotify):
+    first = await spotify_client.refresh_access_token("r1")
+    assert await spotify_client.refresh_access_token("r1") is first
+
+    # The cached token now has two minutes left, less than the lead time asked for
+    spotify_client._refreshed_tokens["r1"] = dict(first, expires_at=int(time.time()) + 120)
+    second = await spotify_client.refresh_access_token("r1", min_ttl=300)
+
+    assert second["access_token"] != first["access_token"]
+    assert spotify == ["r1", "r1"]
+
+
+def test_refreshed_tokens_evict_expired_entries_first(monkeypatch):
+    monkeypatch.setattr(spotify_client, "_REFRESHED_TOKENS_MAX", 3)
+    now = time.time()
+    monkeypatch.setattr(spotify_client, "_refreshed_tokens", {
+        "live": {"expires_at": now + 3600},
+        "gone": {"expires_at": now - 1},
+        "also-live": {"expires_at": now + 3600},
+    })
+
+    spotify_client._remember_refreshed("new", {"expires_at": now + 3600})
+
+    assert list(spotify_client._refreshed_tokens) == ["live", "also-live", "new"]
+
+
+async def test_refresh_expiring_counts_only_saved_tokens(spotify, monkeypatch):
+    soon = int(time.time()) + 120
+    stored = {
+        "u1": {"access_token": "a1", "refresh_token": "r1", "expires_at": soon},
+        "u2": {"access_token": "a2", "refresh_token": "r2", "expires_at": soon},
+    }
+
+    async def save_token(user_id, token_info):
+        # Another worker already stored a newer token for u2
+        if user_id == "u2":
+            return False
+        stored[user_id] = token_info
+        return True
+
+    async def get_token(user_id):
+        return stored.get(user_id)
+
+    monkeypatch.setattr(token_store_module, "save_token", save_token)
+    monkeypatch.setattr(token_store_module, "get_token", get_token)
+    # A token refreshed a while ago, itself due within the lead time
+    spotify_client._refreshed_tokens["r1"] = dict(stored["u1"], access_token="stale")
+    store = TokenStore()
+    store._cache = dict(stored)
+
+    refreshed = await store.refresh_expiring(300, owns=lambda uid: True)
+
+    assert refreshed == 1
+    assert store._cache["u1"]["access_token"] not in ("a1", "stale")
+    assert store._cache["u1"]["expires_at"] > soon
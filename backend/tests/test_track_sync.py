@@ -0,0 +1,68 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from app.crud import track as track_module
+from app.crud.track import parse_played_at, sync_recently_played_db
+
+pytestmark = pytest.mark.anyio
+
+
+@pytest.mark.parametrize("value", [
+    "2025-01-01T12:00:00.123Z",
+    "2025-01-01T13:00:00.123+01:00",
+    "2025-01-01T12:00:00.123",
+    datetime(2025, 1, 1, 12, 0, 0, 123000),
+    datetime(2025, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc),
+])
+def test_parse_played_at_reads_every_stored_form_as_utc(value):
+    assert parse_played_at(value) == datetime(2025, 1, 1, 12, 0, 0, 123000, tzinfo=timezone.utc)
+
+
+class FakeSongs:
+    def __init__(self, latest):
+        self.latest = latest
+        self.inserted = []
+
+    async def find_one(self, *args, **kwargs):
+        return self.latest
+
+    async def insert_many(self, docs, ordered=True):
+        self.inserted.extend(docs)
+
+
+class FakeSpotify:
+    async def current_user_recently_played(self, limit=50, after=None, before=None):
+        return {
+            "items": [
+                {"played_at": played_at, "track": {"id": track_id, "name": track_id, "artists": [{"id": "a1", "name": "A"}]}}
+                for track_id, played_at in (("old", "2025-01-01T11:59:00.000Z"), ("new", "2025-01-01T12:05:00.000Z"))
+            ],
+            "cursors": {"after": "1735733100000"},
+        }
+
+
+async def test_first_incremental_sync_skips_plays_behind_an_unmigrated_string_row(monkeypatch):
+    # A row synced before played_at was stored as a date
+    songs = FakeSongs({"played_at": "2025-01-01T12:00:00.000"})
+    cursors = []
+
+    async def get_sync_cursor(username):
+        return None
+
+    async def set_sync_cursor(username, after):
+        cursors.append(after)
+
+    async def remember(docs):
+        pass
+
+    monkeypatch.setattr(track_module, "get_async_songs_collection", lambda: songs)
+    monkeypatch.setattr(track_module, "get_sync_cursor", get_sync_cursor)
+    monkeypatch.setattr(track_module, "set_sync_cursor", set_sync_cursor)
+    monkeypatch.setattr(track_module.track_catalog, "remember", remember)
+
+    docs = await sync_recently_played_db(FakeSpotify(), "u1")
+
+    assert [doc["track_id"] for doc in docs] == ["new"]
+    assert [doc["track_id"] for doc in songs.inserted] == ["new"]
+    assert cursors == [1735733100000]
@@ -19,7 +19,7 @@ import Artists from "./Artists";
 import Albums from "./Albums";
 import { useUserId } from "../../services/store";
 import { getMusicRatio, getListeningClock } from "../../repositories/reportsRepository";
-import { fetchTopTracks, fetchTopArtists, fetchTopAlbums } from "../../repositories/historyRepository";
+import { fetchHistorySummary } from "../../repositories/historyRepository";
 
 // Enhanced animations
 const fadeInUp = keyframes`
@@ -272,12 +272,11 @@ const Library = () => {
         // Fetch the listening clock and the full top lists (request a large limit)
         // and derive totals from the returned array lengths. This is more reliable
         // than counting uniques from a paginated raw history fetch.
-        const [clock, topTracks, topArtists, topAlbums] = await Promise.all([
+        const [clock, summary] = await Promise.all([
           getListeningClock(userId),
-          fetchTopTracks(userId, 100),
-          fetchTopArtists(userId, 100),
-          fetchTopAlbums(userId, 100),
+          fetchHistorySummary(userId, { tracks: 100, artists: 100, albums: 100, recent: 0 }),
         ]);
+        const { top_tracks: topTracks, top_artists: topArtists, top_albums: topAlbums } = summary;
 
         // Derive totals from returned arrays. If the backend enforces a hard cap
         // on the limit, consider adding dedicated aggregated-count endpoints.
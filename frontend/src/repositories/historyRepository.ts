@@ -12,6 +12,8 @@ export interface HistorySong {
   played_at: string;
   play_count?: number;
   duration_ms?: number;
+  artist_ids?: string[];
+  artist_names?: string[];
 }
 
 export interface TopTrack {
@@ -25,6 +27,7 @@ export interface TopTrack {
 
 
 export interface TopArtist {
+  artist_id?: string | null;
   artist_name: string;
   play_count: number;
   artist_image?: string | null;
@@ -60,6 +63,70 @@ export async function fetchUserHistory(
   return resp.data;
 }
 
+export interface HistoryPage {
+  items: HistorySong[];
+  nextCursor: string | null;
+}
+
+/**
+ * Fetch one page of history, newest first, continuing from `before`
+ * (the previous page's nextCursor). Every page costs the same, however deep.
+ */
+export async function fetchUserHistoryPage(
+  userId: string,
+  limit: number = 50,
+  before?: string | null
+): Promise<HistoryPage> {
+  const resp = await api.get<HistorySong[]>(
+    `/user/${encodeURIComponent(userId)}/history/`,
+    { params: before ? { limit, before } : { limit } }
+  );
+  return {
+    items: resp.data,
+    nextCursor: resp.headers['x-next-cursor'] ?? null,
+  };
+}
+
+export interface HistorySummary {
+  top_tracks: TopTrack[];
+  top_artists: TopArtist[];
+  top_albums: TopAlbum[];
+  recent: HistorySong[];
+  next_cursor: string | null;
+  total_plays: number;
+}
+
+export interface HistorySummaryLimits {
+  tracks?: number;
+  artists?: number;
+  albums?: number;
+  recent?: number;
+}
+
+/**
+ * Fetch top tracks, artists, albums and recent plays in one request
+ * (a limit of 0 skips that list).
+ */
+export async function fetchHistorySummary(
+  userId: string,
+  limits: HistorySummaryLimits = {},
+  since?: string
+): Promise<HistorySummary> {
+  const resp = await api.get<HistorySummary>(
+    `/user/${encodeURIComponent(userId)}/history/summary`,
+    {
+      params: {
+        tracks_limit: limits.tracks ?? 10,
+        artists_limit: limits.artists ?? 10,
+        albums_limit: limits.albums ?? 10,
+        recent_limit: limits.recent ?? 20,
+        ...(since ? { since } : {}),
+      },
+    }
+  );
+  return resp.data;
+}
+
 /**
  * Fetch a user’s top-played tracks.
  */
@@ -1,13 +1,15 @@
 import {
-  fetchUserHistory,
+  fetchUserHistoryPage,
   fetchTopArtists,
   fetchTopAlbums,
   fetchTopTracks,
   HistorySong,
+  HistoryPage,
   TopArtist,
   TopAlbum,
   TopTrack,
 } from './historyRepository';
+import { api } from './apiConfig';
 
 // Re-export types for convenience
 export type { HistorySong, TopArtist, TopAlbum, TopTrack };
@@ -67,7 +69,7 @@ export async function getTopTracks(
 
 /**
  * Fetch the user's raw listening history for reports.
- * Fetches all available history by paginating through results.
+ * Fetches all available history by following the pagination cursor.
  */
 export async function fetchReports(
   userId: string,
@@ -76,23 +78,15 @@ export async function fetchReports(
   try {
     // Fetch a large batch for reports - the backend will limit appropriately
     const allHistory: HistorySong[] = [];
-    let skip = 0;
     const batchSize = 200;
-    let hasMore = true;
-    
-    // Paginate to get full history (with a reasonable cap)
-    while (hasMore && allHistory.length < 2000) {
-      const batch = await fetchUserHistory(userId, skip, batchSize);
-      if (batch.length === 0) {
-        hasMore = false;
-      } else {
-        allHistory.push(...batch);
-        skip += batch.length;
-        if (batch.length < batchSize) {
-          hasMore = false;
-        }
-      }
-    }
+    let cursor: string | null = null;
+
+    // Follow the keyset cursor to get full history (with a reasonable cap)
+    do {
+      const page: HistoryPage = await fetchUserHistoryPage(userId, batchSize, cursor);
+      allHistory.push(...page.items);
+      cursor = page.nextCursor;
+    } while (cursor && allHistory.length < 2000);
     
     return allHistory;
   } catch (err) {
@@ -102,7 +96,7 @@ export async function fetchReports(
 }
 
 /**
- * Compute the user's "Music Ratio":
+ * The user's "Music Ratio", computed server-side:
  *   • # unique tracks
  *   • # unique albums
  *   • # unique artists
@@ -112,110 +106,68 @@ export async function getMusicRatio(
   userId: string,
   days: number = 30
 ): Promise<RawMusicRatio> {
-  const history = await fetchUserHistory(userId);
-  const now = Date.now();
-  const periodMs = days * 24 * 60 * 60 * 1000;
-  const startCurrent = now - periodMs;
-  const startLast = now - 2 * periodMs;
-  const endLast = startCurrent;
-
-  const slice = (arr: HistorySong[], from: number, to: number) =>
-    arr.filter(h => {
-      const t = new Date(h.played_at).getTime();
-      return t >= from && t < to;
-    });
-
-  const currentPeriod = slice(history, startCurrent, now);
-  const lastPeriod = slice(history, startLast, endLast);
-
-  const countUniques = (arr: HistorySong[], key: keyof HistorySong) =>
-    new Set(arr.map(h => h[key] as string)).size;
-
-  const tracks = countUniques(currentPeriod, 'track_id');
-  const albums = countUniques(currentPeriod, 'album_id');
-  const artists = countUniques(currentPeriod, 'artist_id');
-
-  const lastTracks = countUniques(lastPeriod, 'track_id');
-  const lastAlbums = countUniques(lastPeriod, 'album_id');
-  const lastArtists = countUniques(lastPeriod, 'artist_id');
-
-  return { tracks, albums, artists, lastTracks, lastAlbums, lastArtists };
+  const resp = await api.get<{
+    tracks: number;
+    albums: number;
+    artists: number;
+    last_tracks: number;
+    last_albums: number;
+    last_artists: number;
+  }>(`/user/${encodeURIComponent(userId)}/history/music-ratio`, { params: { days } });
+  const r = resp.data;
+  return {
+    tracks: r.tracks,
+    albums: r.albums,
+    artists: r.artists,
+    lastTracks: r.last_tracks,
+    lastAlbums: r.last_albums,
+    lastArtists: r.last_artists,
+  };
 }
 
 /**
- * Compute a Listening Fingerprint over the last 30 days.
+ * Listening Fingerprint over the last 30 days, computed server-side
+ * (days are split in the browser's local time zone).
  */
 export async function getListeningFingerprint(
   userId: string
 ): Promise<Fingerprint> {
-  const history = await fetchUserHistory(userId);
-
-  // only keep plays from the last 30 days
-  const now = Date.now();
-  const thirtyDaysAgo = now - 30 * 24 * 60 * 60 * 1000;
-  const recent = history.filter(
-    h => new Date(h.played_at).getTime() >= thirtyDaysAgo
-  );
-
-  // aggregate plays per day
-  const byDay: Record<string, number> = {};
-  recent.forEach(h => {
-    const day = new Date(h.played_at).toDateString();
-    byDay[day] = (byDay[day] || 0) + 1;
+  const resp = await api.get<{
+    consistency: number;
+    discovery_rate: number;
+    variance: number;
+    concentration: number;
+    replay_rate: number;
+  }>(`/user/${encodeURIComponent(userId)}/history/fingerprint`, {
+    params: { days: 30, utc_offset_minutes: -new Date().getTimezoneOffset() },
   });
-
-  const dayCounts = Object.values(byDay);
-  const daysWithPlays = dayCounts.length;
-  const totalPlays = dayCounts.reduce((sum, c) => sum + c, 0);
-
-  // 1) Consistency: what % of the last 30 days had any plays?
-  const consistency = Math.round((daysWithPlays / 30) * 100);
-
-  // 2) Discovery Rate: % of plays that were unique tracks
-  const uniqueTracks = new Set(recent.map(h => h.track_id)).size;
-  const discoveryRate = totalPlays > 0
-    ? Math.round((uniqueTracks / totalPlays) * 100)
-    : 0;
-
-  // 3) Variance: normalized stddev of daily play counts
-  const mean = daysWithPlays > 0 ? totalPlays / daysWithPlays : 0;
-  const varianceRaw = daysWithPlays > 0
-    ? Math.sqrt(
-        dayCounts.reduce((sum, c) => sum + (c - mean) ** 2, 0) /
-        daysWithPlays
-      )
-    : 0;
-  const variance = mean > 0
-    ? Math.round(Math.min((varianceRaw / mean) * 100, 100))
-    : 0;
-
-  // 4) Concentration: % of total plays that occurred on your top-5 days
-  const top5Sum = [...dayCounts]
-    .sort((a, b) => b - a)
-    .slice(0, 5)
-    .reduce((sum, c) => sum + c, 0);
-  const concentration = totalPlays > 0
-    ? Math.round((top5Sum / totalPlays) * 100)
-    : 0;
-
-  // 5) Replay Rate: avg plays per unique track, scaled to 0–100
-  const replayRateRaw = uniqueTracks > 0 ? recent.length / uniqueTracks : 0;
-  const replayRate = Math.min(Math.round(replayRateRaw * 10), 100);
-
-  return { consistency, discoveryRate, variance, concentration,  replayRate };
+  const f = resp.data;
+  return {
+    consistency: f.consistency,
+    discoveryRate: f.discovery_rate,
+    variance: f.variance,
+    concentration: f.concentration,
+    replayRate: f.replay_rate,
+  };
 }
 
 /**
- * Compute the distribution of plays by hour of day (0–23).
+ * Distribution of plays by hour of day (0–23) in the browser's time zone,
+ * summed from the server-side day-of-week × hour heatmap.
  */
 export async function getListeningClock(
   userId: string
 ): Promise<number[]> {
-  const history = await fetchUserHistory(userId);
+  const tz = Intl.DateTimeFormat().resolvedOptions().timeZone || 'UTC';
+  const resp = await api.get<{ matrix: number[][] }>(
+    `/user/${encodeURIComponent(userId)}/history/heatmap`,
+    { params: { tz } }
+  );
   const counts = Array<number>(24).fill(0);
-  history.forEach(h => {
-    const hr = new Date(h.played_at).getHours();
-    counts[hr]++;
+  resp.data.matrix.forEach(day => {
+    day.forEach((plays, hr) => {
+      counts[hr] += plays;
+    });
   });
   return counts;
 }
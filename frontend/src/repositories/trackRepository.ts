@@ -10,11 +10,20 @@ export interface Song {
   play_count?: number;
 }
 
-export async function fetchRecentTracks(username: string, skip: number): Promise<Song[]> {
-  const resp = await api.get<{ recent_tracks: Song[] }>(
-    `/tracks/user/${encodeURIComponent(username)}/library/recently_played_db?skip=${skip}`
+export interface RecentTracksPage {
+  tracks: Song[];
+  nextCursor: string | null;
+}
+
+export async function fetchRecentTracks(
+  username: string,
+  before?: string | null
+): Promise<RecentTracksPage> {
+  const resp = await api.get<{ recent_tracks: Song[]; next_cursor: string | null }>(
+    `/tracks/user/${encodeURIComponent(username)}/library/recently_played_db`,
+    { params: before ? { before } : {} }
   );
-  return resp.data.recent_tracks;
+  return { tracks: resp.data.recent_tracks, nextCursor: resp.data.next_cursor };
 }
 
 export async function fetchMostPlayedSongs(): Promise<Song[]> {